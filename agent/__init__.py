@@ -0,0 +1,19 @@
+"""
+恋爱智能体
+
+root_agent、runner 和会话服务在 agent/agent.py 中创建 (构建知识库索引、连接数据库)。
+这里按需加载: from agent import runner 时才执行 agent.agent,
+只导入 agent.tools、agent.sessions 等子模块时不会创建会话服务。
+"""
+
+import importlib
+
+
+def __getattr__(name):
+    if name.startswith("__"):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(".agent", __name__)
+    try:
+        return getattr(module, name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
@@ -9,10 +9,17 @@ from google.adk.agents import Agent
 from google.adk.apps.app import App
 
 # 导入数据库服务和类型
-from google.adk.sessions import DatabaseSessionService
 from google.adk.tools import google_search, FunctionTool
+from google.adk.tools.agent_tool import AgentTool
 from google.genai import types
 
+from agent.tools import ToolResultCache, create_date_plan_pdf
+from agent.tools.tool_cache import TOOL_CACHE_ENABLED
+from agent.sessions.compaction import compact_history
+from agent.sessions.cache import SESSION_CACHE_ENABLED, CachingSessionService
+from agent.sessions.backend import SESSION_BACKEND, create_session_service
+from agent.sessions.write_behind import EVENT_WRITE_BEHIND, WriteBehindSessionService
+from knowledge.retrieval import get_index, inject_knowledge
 
 
 # 1. 加载 .env 文件中的变量
@@ -21,20 +28,9 @@ load_dotenv()
 # 2. 获取 API Key
 api_key = os.getenv("GOOGLE_API_KEY")
 
- # 2. 读取你的文档 (单身篇、恋爱篇、已婚篇)
-def load_knowledge():
-    # 假设你把三个 Markdown 文件放在 docs 文件夹下
-    docs = ["document/恋爱常见问题和回答 - 单身篇.md", "document/恋爱常见问题和回答 - 已婚篇.md", "document/恋爱常见问题和回答 - 恋爱篇.md"]
-    combined_text = ""
-    for doc_path in docs:
-        try:
-            with open(doc_path, "r", encoding="utf-8") as f:
-                combined_text += f"\n\n--- 文档: {doc_path} ---\n{f.read()}"
-        except FileNotFoundError:
-            print(f"警告: 找不到文件 {doc_path}")
-    return combined_text
-
-knowledge_base = load_knowledge()
+# 2. 构建本地知识库索引 (单身篇、恋爱篇、已婚篇)
+# 不再把整份文档塞进系统提示词,而是每轮只注入与用户问题相关的 top-k 条目
+get_index()
 
 # 3. 定义 System Instruction (注入灵魂和知识)
 # --- 🔥 核心优化:系统提示词 (System Instruction) ---
@@ -51,7 +47,7 @@ system_instruction = f"""
     * 搜索查询词应简洁明了,例如:"情侣吵架冷战怎么解决 心理学"、"如何处理伴侣的情绪价值"等。
 
 2.  **第二步:结合本地知识库**。
-    * 在获取搜索结果后,结合下方的【核心知识库】中的具体课程或方法论。
+    * 在获取搜索结果后,结合提示词末尾附上的【核心知识库内容】中的具体课程或方法论(系统会按用户问题自动检索最相关的条目,没有附上则说明知识库中没有相关内容)。
     * 搜索结果提供了广度和时效性,本地知识库提供了深度和系统性建议。
 
 3.  **第三步:生成回复**。
@@ -65,33 +61,60 @@ system_instruction = f"""
 2. 根据用户需求或你的专业建议,填充餐厅信息、活动流程、礼物清单等内容
 3. 生成成功后,解析工具返回的 JSON,从中获取 file_name,然后告诉用户可以通过链接下载
 
-【核心知识库内容】
-{knowledge_base}
-
 【例外情况】
 如果用户只是进行简单的寒暄(如"你好"、"在吗"),则不需要搜索,直接温柔回应即可。但只要涉及具体问题,**务必搜索**。
 """
 
+# google_search 是 Gemini 内置工具,搜索在模型侧完成,本地拿不到结果也就无法缓存。
+# 默认的 "builtin" 模式直接使用内置工具,搜索和回答在同一次模型调用中完成。
+# "agent" 模式把它包进一个只负责搜索的子 Agent,以普通工具的形式挂到 root_agent 上,
+# 搜索结果经过本地工具回调,可以按查询词缓存并在会话之间共享,也可以和 PDF 工具同时挂载;
+# 代价是每次未命中缓存的搜索多一次子 Agent 的 Gemini 调用 (延迟和费用),
+# 只有搜索查询重复率高、命中省下的调用多于多出的调用时才值得开启。
+# 子 Agent 同样命名为 google_search,提示词和工具名判断都不用改。
+SEARCH_TOOL_MODE = os.getenv("SEARCH_TOOL_MODE", "builtin")
+
+if SEARCH_TOOL_MODE == "agent":
+    search_agent = Agent(
+        name="google_search",
+        model="gemini-2.5-flash",
+        instruction="你是搜索助手。使用 google_search 搜索给定的查询词,用中文简要整理搜索到的观点和案例,并列出每条结果的标题和来源链接。",
+        tools=[google_search],
+    )
+    search_tool = AgentTool(agent=search_agent)
+    # 搜索不再是内置工具后,可以和普通函数工具一起挂载
+    agent_tools = [search_tool, create_date_plan_pdf]
+else:
+    # 内置 google_search 不能和其他工具同时使用
+    search_tool = google_search
+    agent_tools = [search_tool]
+
+# 内置 google_search 在模型侧执行,不经过工具回调;只有 "agent" 模式下才有可以缓存的工具调用
+tool_cache = ToolResultCache() if TOOL_CACHE_ENABLED and SEARCH_TOOL_MODE == "agent" else None
+
 root_agent = Agent(
     name="root_agent",
     model="gemini-2.5-flash",
     instruction=system_instruction,
-    tools= [google_search]
-    #[google_search, create_date_plan_pdf]
+    # 先压缩过长的历史,再按最新问题注入知识库
+    before_model_callback=[compact_history, inject_knowledge],
+    before_tool_callback=tool_cache.before_tool if tool_cache else None,
+    after_tool_callback=tool_cache.after_tool if tool_cache else None,
+    on_tool_error_callback=tool_cache.on_tool_error if tool_cache else None,
+    tools=agent_tools
 )
 
 app = App(name="agent", root_agent=root_agent)
 
-db_user = os.getenv("DB_USER", "postgres")
-db_pass = os.getenv("DB_PASS", "Aa2000922")
-db_name = os.getenv("DB_NAME", "my_agent_data")
-instance_connection_name = os.getenv("wdtest-001:asia-east2:my-agent-db")
-
-# Cloud Run 连接 Cloud SQL 的标准 Socket 路径
-# 格式: postgresql+asyncpg://user:pass@/dbname?host=/cloudsql/connection_name
-db_url = f"postgresql+asyncpg://{db_user}:{db_pass}@/{db_name}?host=/cloudsql/{instance_connection_name}"
-
-session_service = DatabaseSessionService(db_url=db_url)
+# 会话存储后端由 SESSION_BACKEND 选择: postgres (线上) / sqlite / memory (本地压测和测试)
+session_service = create_session_service()
+# 事件先进缓冲区,由后台任务合并成批量事务写入;每轮结束时 flush 保证已落库
+event_writer = WriteBehindSessionService(session_service) if EVENT_WRITE_BEHIND else None
+if event_writer is not None:
+    session_service = event_writer
+# 最近活跃的会话缓存在进程内,每轮只查一次版本号,不再重新加载全部事件
+if SESSION_CACHE_ENABLED:
+    session_service = CachingSessionService(session_service)
 
 # 创建 Runner
 runner = Runner(app=app, session_service=session_service)
@@ -101,7 +124,7 @@ runner = Runner(app=app, session_service=session_service)
 async def main_test():
     """执行应用的初始化、会话创建和工具使用测试。"""
     print(f"🚀 App is ready!")
-    print(f"📂 数据库绝对路径: {db_url}")
+    print(f"📂 会话存储: {SESSION_BACKEND}")
 
     print("⏳ 正在连接数据库并创建新会话...")
     # 【关键点】创建 Session 时,使用 await
@@ -164,7 +187,7 @@ async def main_test():
     print("💡 提示:现在请在一个新终端运行 'adk web --port 8000' 来启动服务。")
 
 
-# --- 初始化与工具测试脚本 (只在直接运行 python agent.py 时执行) ---
+# --- 初始化与工具测试脚本 (只在直接运行 python -m agent.agent 时执行) ---
 if __name__ == "__main__":
     try:
         # 运行主异步测试函数
@@ -0,0 +1,147 @@
+"""
+Prometheus 指标 - /metrics 接口导出的计数器、直方图和状态量
+
+请求路径上只做 prometheus_client 的计数和直方图观测 (一次加锁的内存写入)。
+连接池、各级缓存这类已经在 stats() 里统计好的数据,由 MetricsSampler 每隔
+METRICS_SAMPLE_INTERVAL 秒复制到 Gauge,不在请求路径上增加开销。
+
+多个 uvicorn/gunicorn worker 时设置 PROMETHEUS_MULTIPROC_DIR (启动前清空该目录):
+每个 worker 把指标写到目录下自己的 mmap 文件,/metrics 由任意一个 worker 汇总所有文件。
+Gauge 按 livesum 汇总,worker 退出时调用 mark_process_dead 去掉它的数据。
+"""
+
+import asyncio
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_SAMPLE_INTERVAL = float(os.getenv("METRICS_SAMPLE_INTERVAL", "15"))
+MULTIPROCESS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+# 模型调用从几百毫秒到一分钟不等
+_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+_TTFT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30)
+_PDF_SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+_PDF_BYTES_BUCKETS = (16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024)
+
+CHAT_LATENCY = Histogram(
+    "chat_request_seconds", "/api/chat 从收到请求到输出完毕的耗时",
+    ["mode", "outcome"], buckets=_LATENCY_BUCKETS,
+)
+CHAT_TTFT = Histogram(
+    "chat_time_to_first_token_seconds", "/api/chat 从收到请求到第一段回答文本的耗时",
+    ["mode"], buckets=_TTFT_BUCKETS,
+)
+LLM_TOKENS = Counter("llm_tokens_total", "模型输入/输出的 token 数", ["direction"])
+TOOL_CALLS = Counter("tool_invocations_total", "模型发起的工具调用次数", ["tool"])
+PDF_RENDER = Histogram("pdf_render_seconds", "PDF 在进程池中的渲染耗时", buckets=_PDF_SECONDS_BUCKETS)
+PDF_SIZE = Histogram("pdf_size_bytes", "新生成的 PDF 大小", buckets=_PDF_BYTES_BUCKETS)
+SSE_STREAMS = Gauge("sse_active_streams", "正在输出的 SSE 流数量", multiprocess_mode="livesum")
+ADMISSION_ACTIVE = Gauge("chat_admission_active", "已获准运行的 /api/chat 请求数", multiprocess_mode="livesum")
+ADMISSION_QUEUED = Gauge("chat_admission_queue_depth", "排队等待运行的 /api/chat 请求数", multiprocess_mode="livesum")
+ADMISSION_REJECTED = Counter("chat_admission_rejected_total", "被准入控制拒绝的请求数", ["reason"])
+ADMISSION_WAIT = Histogram("chat_admission_wait_seconds", "请求获准运行前的排队时间", buckets=_TTFT_BUCKETS)
+CHAT_COALESCED = Counter("chat_coalesced_total", "与进行中的相同请求合并、没有再调用模型的请求数", ["mode"])
+SESSION_LOCK_WAIT = Histogram("chat_session_lock_wait_seconds", "同一会话上等待前一轮结束的时间", buckets=_LATENCY_BUCKETS)
+
+DB_POOL = Gauge("db_pool_connections", "会话数据库连接池的连接数", ["state"], multiprocess_mode="livesum")
+DB_POOL_WAITING = Gauge("db_pool_waiting", "正在等待连接的请求数", multiprocess_mode="livesum")
+DB_POOL_CHECKOUTS = Gauge("db_pool_checkouts", "累计取连接次数 (worker 重启后归零)", multiprocess_mode="livesum")
+DB_POOL_TIMEOUTS = Gauge("db_pool_timeouts", "累计取连接超时次数 (worker 重启后归零)", multiprocess_mode="livesum")
+CACHE_HITS = Gauge("cache_hits", "各级缓存累计命中次数 (worker 重启后归零)", ["cache"], multiprocess_mode="livesum")
+CACHE_MISSES = Gauge("cache_misses", "各级缓存累计未命中次数 (worker 重启后归零)", ["cache"], multiprocess_mode="livesum")
+
+
+def render_metrics() -> tuple:
+    """返回 (响应体, Content-Type)"""
+    if MULTIPROCESS_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead():
+    """worker 退出时调用,livesum 的 Gauge 不再计入这个进程"""
+    if MULTIPROCESS_DIR:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class ChatObserver:
+    """一次 /api/chat 请求: 根据 runner 产生的事件记录首 token 时间、token 数和工具调用"""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.started = time.perf_counter()
+        self.first_token = None
+
+    def on_event(self, event):
+        if not METRICS_ENABLED:
+            return
+        if self.first_token is None and event.content and any(part.text for part in event.content.parts or []):
+            self.first_token = time.perf_counter()
+            CHAT_TTFT.labels(self.mode).observe(self.first_token - self.started)
+        for call in event.get_function_calls():
+            TOOL_CALLS.labels(call.name).inc()
+        # partial 片段不带用量,汇总后的完整事件才有
+        usage = event.usage_metadata
+        if usage is not None and not event.partial:
+            if usage.prompt_token_count:
+                LLM_TOKENS.labels("in").inc(usage.prompt_token_count)
+            if usage.candidates_token_count:
+                LLM_TOKENS.labels("out").inc(usage.candidates_token_count)
+
+    def finish(self, outcome: str = "ok"):
+        if METRICS_ENABLED:
+            CHAT_LATENCY.labels(self.mode, outcome).observe(time.perf_counter() - self.started)
+
+
+class MetricsSampler:
+    """定期把各组件 stats() 中的数据复制到 Gauge"""
+
+    def __init__(self, pool_stats=None, caches: dict = None, interval: float = METRICS_SAMPLE_INTERVAL):
+        self.pool_stats = pool_stats    # 返回 agent.sessions.pool.pool_stats() 结果的函数
+        self.caches = caches or {}      # 缓存名 -> 返回 stats() 字典的函数
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        if METRICS_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"⚠️ 指标采样失败: {e}")
+            await asyncio.sleep(self.interval)
+
+    def sample(self):
+        if self.pool_stats is not None:
+            stats = self.pool_stats()
+            for state in ("checked_out", "checked_in", "overflow"):
+                if state in stats:
+                    DB_POOL.labels(state).set(stats[state])
+            DB_POOL_WAITING.set(stats["waiting"])
+            DB_POOL_CHECKOUTS.set(stats["checkouts"])
+            DB_POOL_TIMEOUTS.set(stats["timeouts"])
+        for name, stats in self.caches.items():
+            stats = stats()
+            if stats is None:
+                continue
+            CACHE_HITS.labels(name).set(stats["hits"])
+            CACHE_MISSES.labels(name).set(stats["misses"])
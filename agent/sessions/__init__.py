@@ -0,0 +1,3 @@
+"""
+会话存储相关组件
+"""
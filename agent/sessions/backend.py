@@ -0,0 +1,97 @@
+"""
+会话存储后端 - 按 SESSION_BACKEND 选择会话数据库
+
+    postgres  Cloud SQL / PostgreSQL (asyncpg),线上默认
+    sqlite    本地 SQLite 文件 (aiosqlite),开启 WAL,适合单机压测
+    memory    进程内 SQLite 内存库 (共享缓存,由一个常驻连接保持),进程退出即丢失,适合测试和基准测试
+
+三种后端都通过 DatabaseSessionService 访问,create_session、append_event 的
+语义 (包括 StaleSessionError 检测) 完全一致,上层的事件批量写入和会话缓存也可以照常使用。
+"""
+
+import os
+import sqlite3
+import uuid
+import weakref
+
+from google.adk.sessions import DatabaseSessionService
+from sqlalchemy import event
+
+from agent.sessions.pool import engine_options
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "postgres")
+# 设置后直接使用这个连接串,忽略下面的 DB_* 变量
+SESSION_DB_URL = os.getenv("SESSION_DB_URL", "")
+# 默认放在项目根目录,与启动时的工作目录无关
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", os.path.join(BASE_DIR, "sessions.db"))
+# 写锁被占用时等待的毫秒数,超过后报 database is locked
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+SESSION_BACKENDS = ("postgres", "sqlite", "memory")
+
+# 内存库的常驻连接,随会话服务一起释放;登记在这里,不写到 ADK 对象的属性上
+_memory_keepers = weakref.WeakKeyDictionary()
+
+
+def _postgres_url() -> str:
+    db_user = os.getenv("DB_USER", "postgres")
+    # 密码不设默认值,由部署环境注入 (Cloud Run 的 Secret Manager 等)
+    db_pass = os.getenv("DB_PASS")
+    if not db_pass:
+        raise ValueError("SESSION_BACKEND=postgres 需要设置 DB_PASS (或用 SESSION_DB_URL 指定完整连接串)")
+    db_name = os.getenv("DB_NAME", "my_agent_data")
+    instance_connection_name = os.getenv("INSTANCE_CONNECTION_NAME", "wdtest-001:asia-east2:my-agent-db")
+    # Cloud Run 连接 Cloud SQL 的标准 Socket 路径
+    # 格式: postgresql+asyncpg://user:pass@/dbname?host=/cloudsql/connection_name
+    return f"postgresql+asyncpg://{db_user}:{db_pass}@/{db_name}?host=/cloudsql/{instance_connection_name}"
+
+
+def session_db_url(backend: str = SESSION_BACKEND) -> str:
+    """后端对应的 SQLAlchemy 连接串"""
+    if backend not in SESSION_BACKENDS:
+        raise ValueError(f"未知的 SESSION_BACKEND: {backend} (可选 {', '.join(SESSION_BACKENDS)})")
+    if backend == "memory":
+        # 每次生成一个新的命名内存库,多个服务之间互不影响
+        return f"sqlite+aiosqlite:///file:sessions-{uuid.uuid4().hex}?mode=memory&cache=shared&uri=true"
+    if SESSION_DB_URL:
+        return SESSION_DB_URL
+    if backend == "sqlite":
+        return f"sqlite+aiosqlite:///{SESSION_SQLITE_PATH}"
+    return _postgres_url()
+
+
+def _enable_wal(dbapi_connection, connection_record):
+    # WAL 模式下读不阻塞写;synchronous=NORMAL 每次提交不再 fsync,断电时最多丢最后几个事务
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+def create_session_service(backend: str = SESSION_BACKEND, db_url: str = None) -> DatabaseSessionService:
+    """
+    创建指定后端的 DatabaseSessionService
+
+    Args:
+        backend: postgres / sqlite / memory
+        db_url: 指定时覆盖根据后端生成的连接串 (基准测试用临时文件)
+    """
+    db_url = db_url or session_db_url(backend)
+    # 连接池大小、回收时间、pre-ping 和语句缓存由 DB_* 环境变量控制
+    options = engine_options(db_url)
+    keeper = None
+    if backend == "memory":
+        # 共享缓存的内存库在最后一个连接关闭时消失。请求被取消时 SQLAlchemy 会作废正在用的连接,
+        # 所以另外保持一个不经过连接池的连接,内存库的生命周期与服务相同。
+        # 共享缓存按表加锁,并发的事务会直接报 database table is locked,
+        # 连接池大小为 1,并发的请求排队使用它
+        keeper = sqlite3.connect(db_url.split("///", 1)[1], uri=True, check_same_thread=False)
+        options.update(pool_size=1, max_overflow=0, pool_recycle=-1, pool_pre_ping=False)
+    service = DatabaseSessionService(db_url=db_url, **options)
+    if keeper is not None:
+        _memory_keepers[service] = keeper
+    if backend == "sqlite":
+        event.listen(service.db_engine.sync_engine, "connect", _enable_wal)
+    return service
@@ -0,0 +1,206 @@
+"""
+会话读缓存 - 在 DatabaseSessionService 前面缓存最近活跃的会话
+
+Runner 每一轮都会调用 get_session 重新加载整个会话 (会话行 + 全部事件 +
+app/user state),对话越长越慢。这里把最近活跃的会话保存在进程内 LRU 中:
+
+    get_session     命中时只查一次会话行的 update_time (版本号),和缓存一致就直接返回副本;
+                    不一致说明其他 worker 写过这个会话,丢弃缓存重新加载
+    append_event    直接写入数据库 (write-through),成功后用最新的会话刷新缓存
+    delete_session  删除后清掉缓存
+
+缓存按会话数和估算的字节数两个上限做 LRU 淘汰。
+"""
+
+import os
+from collections import OrderedDict
+from datetime import timezone
+
+from google.adk.sessions import BaseSessionService
+from sqlalchemy import select
+
+from agent.tracing import span
+
+SESSION_CACHE_ENABLED = os.getenv("SESSION_CACHE_ENABLED", "1") == "1"
+SESSION_CACHE_MAX_SESSIONS = int(os.getenv("SESSION_CACHE_MAX_SESSIONS", "500"))
+SESSION_CACHE_MAX_BYTES = int(os.getenv("SESSION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# temp: 开头的 state 只在一次调用内有效,不会写入数据库,也不进缓存
+_TEMP_PREFIX = "temp:"
+
+
+def _timestamp(value) -> float:
+    # SQLite 和不带时区的 PostgreSQL 列返回 naive datetime,按 UTC 处理 (与 ADK 一致)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _copy(session):
+    """返回可以交给调用方修改的副本: 事件列表和 state 各自独立,事件对象共用"""
+    return session.model_copy(update={
+        "events": list(session.events),
+        "state": {k: v for k, v in session.state.items() if not k.startswith(_TEMP_PREFIX)},
+    })
+
+
+def _filter_events(session, config):
+    """在缓存的完整会话上应用 GetSessionConfig,结果与数据库查询一致"""
+    if config is None:
+        return session
+    events = session.events
+    if config.after_timestamp:
+        events = [e for e in events if e.timestamp >= config.after_timestamp]
+    if config.num_recent_events is not None:
+        events = events[-config.num_recent_events:] if config.num_recent_events else []
+    session.events = events
+    return session
+
+
+class CachingSessionService(BaseSessionService):
+    """包装 DatabaseSessionService 的读缓存"""
+
+    def __init__(self, inner, max_sessions: int = SESSION_CACHE_MAX_SESSIONS,
+                 max_bytes: int = SESSION_CACHE_MAX_BYTES):
+        self.inner = inner
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # (app_name, user_id, session_id) -> (Session, 估算字节数)
+        self._bytes = 0
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "evictions": 0,
+            "db_loads": 0,
+            "version_probes": 0,
+        }
+
+    def __getattr__(self, name):
+        # db_engine、close 等其他属性直接转发给被包装的服务
+        return getattr(self.inner, name)
+
+    # ----------------------------------------------------------------
+    # 缓存维护
+    # ----------------------------------------------------------------
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _remember(self, session, size: int = None):
+        key = (session.app_name, session.user_id, session.id)
+        if size is None:
+            size = len(session.model_dump_json())
+        self._drop(key)
+        self._entries[key] = (_copy(session), size)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_sessions or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+
+    async def _storage_version(self, app_name: str, user_id: str, session_id: str):
+        """只查会话行的 update_time,比加载全部事件轻得多"""
+        self._stats["version_probes"] += 1
+        if hasattr(self.inner, "flush_session"):
+            # 下层是批量写入时,先把这个会话缓冲中的事件写入,版本号才是最新的
+            await self.inner.flush_session(app_name, user_id, session_id)
+        # ADK 按数据库中的 schema 版本选择表定义
+        storage_session = self.inner._get_schema_classes().StorageSession
+        stmt = (
+            select(storage_session.update_time)
+            .filter(storage_session.app_name == app_name)
+            .filter(storage_session.user_id == user_id)
+            .filter(storage_session.id == session_id)
+        )
+        async with self.inner.db_engine.connect() as conn:
+            value = (await conn.execute(stmt)).scalar_one_or_none()
+        return None if value is None else _timestamp(value)
+
+    # ----------------------------------------------------------------
+    # BaseSessionService 接口
+    # ----------------------------------------------------------------
+
+    async def create_session(self, *, app_name: str, user_id: str, state=None, session_id=None):
+        session = await self.inner.create_session(
+            app_name=app_name, user_id=user_id, state=state, session_id=session_id
+        )
+        self._remember(session)
+        return session
+
+    async def get_session(self, *, app_name: str, user_id: str, session_id: str, config=None):
+        with span("session.load"):
+            return await self._get_session(app_name, user_id, session_id, config)
+
+    async def _get_session(self, app_name: str, user_id: str, session_id: str, config):
+        key = (app_name, user_id, session_id)
+        entry = self._entries.get(key)
+        if entry is not None:
+            version = await self._storage_version(app_name, user_id, session_id)
+            if version is not None and abs(version - entry[0].last_update_time) < 1e-6:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return _filter_events(_copy(entry[0]), config)
+            self._drop(key)
+            self._stats["invalidations"] += 1
+
+        self._stats["misses"] += 1
+        self._stats["db_loads"] += 1
+        session = await self.inner.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        if session is None:
+            return None
+        self._remember(session)
+        return _filter_events(_copy(session), config)
+
+    async def list_sessions(self, *, app_name: str, user_id=None):
+        return await self.inner.list_sessions(app_name=app_name, user_id=user_id)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str):
+        self._drop((app_name, user_id, session_id))
+        await self.inner.delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+
+    async def get_user_state(self, *, app_name: str, user_id: str):
+        return await self.inner.get_user_state(app_name=app_name, user_id=user_id)
+
+    async def append_event(self, session, event):
+        key = (session.app_name, session.user_id, session.id)
+        try:
+            event = await self.inner.append_event(session, event)
+        except Exception:
+            # 包括 StaleSessionError: 缓存中的版本已经不可信
+            self._drop(key)
+            raise
+        if event.partial:
+            return event
+
+        entry = self._entries.get(key)
+        if entry is not None and len(session.events) == len(entry[0].events) + 1:
+            # 调用方拿到的是完整会话,追加成功后直接替换缓存,只累加新事件的大小
+            self._remember(session, entry[1] + len(event.model_dump_json()))
+        else:
+            # 调用方的会话是按 GetSessionConfig 截断过的,或者缓存已被淘汰,下次重新加载
+            self._drop(key)
+        return event
+
+    async def flush(self, *, app_name: str = None, user_id: str = None, session_id: str = None):
+        if not hasattr(self.inner, "flush_session"):
+            # 下层直接写入数据库,没有缓冲的事件;ADK 的 flush() 不接受参数
+            await self.inner.flush()
+            return
+        try:
+            await self.inner.flush(app_name=app_name, user_id=user_id, session_id=session_id)
+        except Exception:
+            # 包括 StaleSessionError: 缓存中的会话含有没能写入的事件
+            if session_id is not None:
+                self._drop((app_name, user_id, session_id))
+            raise
+
+    def stats(self) -> dict:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "sessions": len(self._entries),
+            "bytes": self._bytes,
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,151 @@
+"""
+对话历史压缩 - 长会话只把 "早期对话摘要 + 最近几轮" 发给模型
+
+作为 before_model_callback 接入。历史超过 HISTORY_TOKEN_BUDGET 时:
+  1. 保留最近 HISTORY_RECENT_TURNS 轮原文 (一轮 = 一条用户消息及其后的模型回复、工具调用)
+  2. 更早的轮次合并进摘要,摘要追加到系统提示词,原文不再发送
+  3. 摘要和它覆盖的轮数保存在会话 state 的 history_memory 中,随会话一起持久化,
+     之后每轮只需要把新移出窗口的轮次合并进去
+
+摘要默认用抽取方式生成 (每轮截取问题和回答的开头),不额外调用模型;
+设置 HISTORY_SUMMARY_MODEL 后改用该模型生成摘要,失败时回退到抽取方式。
+"""
+
+import os
+import re
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "4000"))
+HISTORY_RECENT_TURNS = int(os.getenv("HISTORY_RECENT_TURNS", "6"))
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "800"))
+# 为空时使用抽取式摘要
+HISTORY_SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "")
+
+MEMORY_STATE_KEY = "history_memory"
+
+_CJK = re.compile(r"[\u4e00-\u9fff\u3000-\u303f\uff00-\uffef]")
+_genai_client = None
+
+
+def estimate_tokens(text: str) -> int:
+    """按 Gemini 的经验值估算: 每个汉字约 1 token,其余字符约 4 个一个 token"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _content_text(content) -> str:
+    parts = []
+    for part in content.parts or []:
+        if part.text:
+            parts.append(part.text)
+        elif part.function_call:
+            parts.append(f"{part.function_call.name}({part.function_call.args})")
+        elif part.function_response:
+            parts.append(str(part.function_response.response))
+    return "".join(parts)
+
+
+def content_tokens(contents) -> int:
+    return sum(estimate_tokens(_content_text(c)) for c in contents)
+
+
+def _is_user_message(content) -> bool:
+    # 工具返回结果也是 role="user",但没有文本,不算新的一轮
+    return content.role == "user" and any(part.text for part in content.parts or [])
+
+
+def split_turns(contents) -> list:
+    """按用户消息把 contents 切分为若干轮"""
+    turns = []
+    for content in contents:
+        if _is_user_message(content) or not turns:
+            turns.append([])
+        turns[-1].append(content)
+    return turns
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+def extractive_summary(previous: str, turns: list, max_tokens: int = HISTORY_SUMMARY_MAX_TOKENS) -> str:
+    """每轮保留问题和回答的开头;总长度超出上限时丢弃最早的记录"""
+    lines = [line for line in previous.splitlines() if line and not line.startswith("(")]
+    for turn in turns:
+        question = "".join(_content_text(c) for c in turn if c.role == "user" and _is_user_message(c))
+        answer = "".join(_content_text(c) for c in turn if c.role == "model")
+        lines.append(f"- 用户: {_clip(question, 60)} / 回答: {_clip(answer, 100)}")
+
+    dropped = False
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+        dropped = True
+    if dropped:
+        lines.insert(0, "(更早的对话已省略)")
+    return "\n".join(lines)
+
+
+async def _model_summary(previous: str, turns: list) -> str:
+    global _genai_client
+    if _genai_client is None:
+        from google import genai
+
+        _genai_client = genai.Client()
+
+    transcript = "\n".join(
+        f"{'用户' if c.role == 'user' else '助手'}: {_content_text(c)}" for turn in turns for c in turn
+    )
+    prompt = (
+        f"下面是一段恋爱咨询对话的已有摘要和后续新增的对话。请把它们合并成一份新的摘要,"
+        f"保留用户的基本情况、关注的问题和已经给出的关键建议,不超过 {HISTORY_SUMMARY_MAX_TOKENS} 字。\n\n"
+        f"【已有摘要】\n{previous or '无'}\n\n【新增对话】\n{transcript}"
+    )
+    response = await _genai_client.aio.models.generate_content(model=HISTORY_SUMMARY_MODEL, contents=prompt)
+    return (response.text or "").strip()
+
+
+async def summarize(previous: str, turns: list) -> str:
+    if HISTORY_SUMMARY_MODEL:
+        try:
+            summary = await _model_summary(previous, turns)
+            if summary:
+                return summary
+        except Exception as e:
+            print(f"⚠️ 对话摘要生成失败,改用抽取式摘要: {e}")
+    return extractive_summary(previous, turns)
+
+
+async def compact_history(callback_context, llm_request):
+    """
+    before_model_callback: 历史超过预算时用摘要替换早期轮次
+
+    Returns:
+        None: 不拦截模型调用,只修改请求
+    """
+    contents = llm_request.contents or []
+    turns = split_turns(contents)
+    memory = callback_context.state.get(MEMORY_STATE_KEY) or {"summary": "", "turns": 0}
+    if memory["turns"] >= len(turns):
+        # 会话被回退或截断过,摘要已经对不上
+        memory = {"summary": "", "turns": 0}
+    if not memory["turns"] and content_tokens(contents) <= HISTORY_TOKEN_BUDGET:
+        return None
+
+    # 最近几轮本身超出预算时继续缩小窗口,至少保留当前这一轮
+    keep = min(HISTORY_RECENT_TURNS, len(turns))
+    while keep > 1 and content_tokens([c for turn in turns[-keep:] for c in turn]) > HISTORY_TOKEN_BUDGET:
+        keep -= 1
+    # 已经摘要过的轮次不再发送原文,窗口只会向后移动
+    split = max(len(turns) - keep, memory["turns"])
+    if split == 0:
+        return None
+    if memory["turns"] < split:
+        memory = {
+            "summary": await summarize(memory["summary"], turns[memory["turns"]:split]),
+            "turns": split,
+        }
+        callback_context.state[MEMORY_STATE_KEY] = memory
+
+    llm_request.contents = [c for turn in turns[split:] for c in turn]
+    llm_request.append_instructions([f"【之前对话的摘要】(共 {memory['turns']} 轮)\n{memory['summary']}"])
+    return None
@@ -0,0 +1,193 @@
+"""
+数据库连接池 - DatabaseSessionService 的连接池参数、启动预热和运行指标
+
+连接池参数全部由环境变量控制,传给 SQLAlchemy 的 create_async_engine。
+InstrumentedPool 记录每次取连接的等待时间和同时等待的请求数,
+突发流量下 /api/chat 的长尾延迟主要来自这里。
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+
+from sqlalchemy import exc, text
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Cloud SQL 会主动断开长时间空闲的连接,提前回收
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+# asyncpg 每个连接缓存的预编译语句数;经过 pgbouncer 等事务级连接池时需要设为 0
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+# 启动时预先建立的连接数,默认填满常驻连接
+DB_WARMUP_CONNECTIONS = int(os.getenv("DB_WARMUP_CONNECTIONS", str(DB_POOL_SIZE)))
+DB_WARMUP_TIMEOUT = float(os.getenv("DB_WARMUP_TIMEOUT", "30"))
+
+# 用于计算等待时间分位数的最近样本数
+_WAIT_SAMPLES = 1000
+
+
+class PoolMetrics:
+    """取连接的次数、等待时间和当前等待数,所有连接池实例共用"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self._samples = deque(maxlen=_WAIT_SAMPLES)
+
+    def record(self, wait_ms: float):
+        self.checkouts += 1
+        self.wait_ms_total += wait_ms
+        self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+        self._samples.append(wait_ms)
+
+    def snapshot(self) -> dict:
+        samples = sorted(self._samples)
+
+        def percentile(p: float) -> float:
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))], 2) if samples else 0.0
+
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "wait_ms_avg": round(self.wait_ms_total / self.checkouts, 2) if self.checkouts else 0.0,
+            "wait_ms_p50": percentile(0.5),
+            "wait_ms_p99": percentile(0.99),
+            "wait_ms_max": round(self.wait_ms_max, 2),
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """在 AsyncAdaptedQueuePool 的基础上统计取连接的等待时间 (包括新建连接和 pre-ping)"""
+
+    def __init__(self, creator, pool_size: int = 5, max_overflow: int = 10, **kwargs):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kwargs)
+        # 能同时提供的连接数;max_overflow 为 -1 (不限) 时只算常驻连接
+        self.max_connections = pool_size + max(max_overflow, 0)
+
+    def connect(self):
+        pool_metrics.waiting += 1
+        pool_metrics.max_waiting = max(pool_metrics.max_waiting, pool_metrics.waiting)
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        finally:
+            pool_metrics.waiting -= 1
+        pool_metrics.record((time.perf_counter() - started) * 1000)
+        return connection
+
+
+def engine_options(db_url: str) -> dict:
+    """传给 DatabaseSessionService (create_async_engine) 的连接池参数"""
+    options = {
+        "poolclass": InstrumentedPool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if db_url.startswith("postgresql+asyncpg"):
+        options["connect_args"] = {"statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    return options
+
+
+class PoolWarmer:
+    """
+    启动时预先建立连接,完成之前 /api/health 返回 503
+
+    连接失败 (例如 Cloud SQL 还没就绪) 时按指数退避重试,直到成功。
+    """
+
+    def __init__(self, engine, connections: int = DB_WARMUP_CONNECTIONS, timeout: float = DB_WARMUP_TIMEOUT):
+        self.engine = engine
+        # 不能超过连接池能同时提供的连接数,否则会一直等下去
+        pool = engine.pool
+        limit = pool.max_connections if isinstance(pool, InstrumentedPool) else 0
+        self.connections = min(connections, limit)
+        self.timeout = timeout
+        self.ready = self.connections <= 0
+        self.attempts = 0
+        self.warmup_ms = None
+        self.last_error = None
+        self._task = None
+
+    def start(self):
+        if not self.ready:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _open(self, barrier: asyncio.Barrier):
+        async with self.engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            # 持有连接直到所有连接都建好,保证建立的是 N 个不同的连接
+            await barrier.wait()
+
+    async def warm(self):
+        barrier = asyncio.Barrier(self.connections)
+        started = time.perf_counter()
+        await asyncio.wait_for(
+            asyncio.gather(*(self._open(barrier) for _ in range(self.connections))),
+            timeout=self.timeout,
+        )
+        self.warmup_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    async def _run(self):
+        delay = 1.0
+        while not self.ready:
+            self.attempts += 1
+            try:
+                await self.warm()
+                self.ready = True
+                self.last_error = None
+                print(f"🔌 数据库连接池预热完成: {self.connections} 个连接, 耗时 {self.warmup_ms}ms")
+            except Exception as e:
+                self.last_error = str(e) or type(e).__name__
+                print(f"⚠️ 数据库连接池预热失败 (第 {self.attempts} 次), {delay:.0f}s 后重试: {self.last_error}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    def describe(self) -> dict:
+        return {
+            "ready": self.ready,
+            "connections": self.connections,
+            "attempts": self.attempts,
+            "warmup_ms": self.warmup_ms,
+            "last_error": self.last_error,
+        }
+
+
+def pool_stats(engine) -> dict:
+    """连接池当前状态和累计的等待指标"""
+    pool = engine.pool
+    stats = {"pool_class": type(pool).__name__}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+        })
+    return {**stats, **pool_metrics.snapshot()}
@@ -0,0 +1,300 @@
+"""
+事件批量写入 - 把 append_event 的数据库写入合并成批量事务
+
+DatabaseSessionService 每个事件单独开一个事务 (查会话行、查 app/user state、
+插入事件、更新会话,再提交)。这里 append_event 只更新内存中的会话并把事件
+放进缓冲区,后台任务每隔 EVENT_FLUSH_INTERVAL 秒把所有会话积累的事件放进
+同一个事务: 事件用一条多行 INSERT 写入,每个会话只更新一次 state 和 update_time。
+
+持久性保证:
+    - 一轮对话结束时调用 flush(app_name=, user_id=, session_id=),正常返回时这一轮的事件已经提交;
+      会话在此期间被其他 worker 写过或已被删除,事件无法写入时抛出 StaleSessionError
+    - 事务失败时事件放回缓冲区,flush() 抛出原来的异常,下一次写入时重试
+    - get_session 先写入该会话的缓冲事件,读到的总是最新数据
+    - 应用关闭时 stop() 写入全部缓冲事件
+
+流式输出的 partial 事件本来就不落库,这里同样直接跳过。
+
+批量事务复用了 DatabaseSessionService 的内部方法 (_get_schema_classes、
+_rollback_on_exception_session、_apply_temp_state、_commit_event_to_session 等) 和
+Session._storage_update_marker,它们不是公开接口,requirements.txt 固定了 google-adk 的版本,
+升级 ADK 时需要对照新版本的 append_event 检查这里的写入逻辑。
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+
+from google.adk.errors import StaleSessionError
+from google.adk.sessions import BaseSessionService
+from google.adk.sessions import _session_util
+from sqlalchemy import select
+
+EVENT_WRITE_BEHIND = os.getenv("EVENT_WRITE_BEHIND", "1") == "1"
+EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", "0.05"))
+# 缓冲的事件数达到这个值时立即写入,不等定时器
+EVENT_FLUSH_MAX_BATCH = int(os.getenv("EVENT_FLUSH_MAX_BATCH", "500"))
+
+
+class _PendingSession:
+    """一个会话尚未写入的事件和 state 变化"""
+
+    def __init__(self, session, expected_marker):
+        self.session = session
+        self.expected_marker = expected_marker
+        self.events = []
+        self.deltas = {"app": {}, "user": {}, "session": {}}
+
+    def add(self, event):
+        self.events.append(event)
+        if event.actions and event.actions.state_delta:
+            for scope, delta in _session_util.extract_json_safe_state_delta(event.actions.state_delta).items():
+                self.deltas[scope].update(delta)
+
+
+class WriteBehindSessionService(BaseSessionService):
+    """包装 DatabaseSessionService,事件先进缓冲区,由后台任务批量写入"""
+
+    def __init__(self, inner, interval: float = EVENT_FLUSH_INTERVAL, max_batch: int = EVENT_FLUSH_MAX_BATCH):
+        self.inner = inner
+        self.interval = interval
+        self.max_batch = max_batch
+        self._pending = {}              # (app_name, user_id, session_id) -> _PendingSession
+        self._pending_events = 0
+        self._markers = {}              # 本进程最近一次写入后的会话版本
+        self._rejected = {}             # 因为版本冲突没能写入的会话 -> 丢弃的事件数,由该会话的 flush() 报告
+        self._write_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stats = {
+            "events_buffered": 0,
+            "events_written": 0,
+            "transactions": 0,
+            "max_batch_events": 0,
+            "max_batch_sessions": 0,
+            "stale_sessions": 0,
+            "flush_ms_total": 0.0,
+            "flush_ms_max": 0.0,
+        }
+
+    def __getattr__(self, name):
+        # db_engine、close 等其他属性直接转发给被包装的服务
+        return getattr(self.inner, name)
+
+    # ----------------------------------------------------------------
+    # 后台写入任务
+    # ----------------------------------------------------------------
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """写入所有缓冲事件后停止后台任务"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"❌ 会话事件批量写入失败: {e}")
+
+    async def flush(self, *, app_name: str = None, user_id: str = None, session_id: str = None):
+        """
+        把当前缓冲的所有事件写入数据库
+
+        Raises:
+            StaleSessionError: 指定的会话有事件因为版本冲突 (其他 worker 写过或会话已被删除) 没能写入,
+                               这一轮没有保存,调用方需要重新加载会话
+        """
+        async with self._write_lock:
+            batch, self._pending, self._pending_events = self._pending, {}, 0
+            if batch:
+                await self._write_or_requeue(batch)
+        if session_id is not None:
+            dropped = self._rejected.pop((app_name, user_id, session_id), None)
+            if dropped:
+                raise StaleSessionError(f"会话 {session_id} 已被其他进程修改或删除,{dropped} 个事件没有写入")
+
+    async def flush_session(self, app_name: str, user_id: str, session_id: str):
+        """只写入某一个会话的缓冲事件"""
+        key = (app_name, user_id, session_id)
+        if key not in self._pending:
+            return
+        async with self._write_lock:
+            pending = self._pending.pop(key, None)
+            if pending is not None:
+                self._pending_events -= len(pending.events)
+                await self._write_or_requeue({key: pending})
+
+    async def _write_or_requeue(self, batch: dict):
+        try:
+            await self._write(batch)
+        except Exception:
+            # 事务已回滚,事件放回缓冲区等下一次写入;写入期间新到的事件排在后面
+            for key, pending in batch.items():
+                newer = self._pending.get(key)
+                if newer is not None:
+                    pending.events += newer.events
+                    for scope, delta in newer.deltas.items():
+                        pending.deltas[scope].update(delta)
+                self._pending[key] = pending
+                self._pending_events += len(pending.events) - (len(newer.events) if newer else 0)
+            raise
+
+    async def _write(self, batch: dict):
+        started = time.perf_counter()
+        inner = self.inner
+        schema = inner._get_schema_classes()
+        naive = inner._uses_naive_datetime()
+        storage_events = []
+        written = {}
+        stale = {}
+
+        async with inner._rollback_on_exception_session() as sql_session:
+            for (app_name, user_id, session_id), pending in batch.items():
+                stmt = (
+                    select(schema.StorageSession)
+                    .filter(schema.StorageSession.app_name == app_name)
+                    .filter(schema.StorageSession.user_id == user_id)
+                    .filter(schema.StorageSession.id == session_id)
+                )
+                if inner._supports_row_level_locking():
+                    stmt = stmt.with_for_update()
+                storage_session = (await sql_session.execute(stmt)).scalars().one_or_none()
+                if storage_session is None or (
+                    pending.expected_marker is not None
+                    and storage_session.get_update_marker() != pending.expected_marker
+                ):
+                    # 会话已被删除,或者其他 worker 在此期间写过这个会话;与 ADK 一样拒绝这批事件,
+                    # 重试也不会成功,不放回缓冲区
+                    stale[(app_name, user_id, session_id)] = len(pending.events)
+                    continue
+
+                if pending.deltas["app"]:
+                    app_state = (await sql_session.execute(
+                        select(schema.StorageAppState).filter(schema.StorageAppState.app_name == app_name)
+                    )).scalar_one()
+                    app_state.state.update(pending.deltas["app"])
+                if pending.deltas["user"]:
+                    user_state = (await sql_session.execute(
+                        select(schema.StorageUserState)
+                        .filter(schema.StorageUserState.app_name == app_name)
+                        .filter(schema.StorageUserState.user_id == user_id)
+                    )).scalar_one()
+                    user_state.state.update(pending.deltas["user"])
+                if pending.deltas["session"]:
+                    storage_session.state.update(pending.deltas["session"])
+
+                update_time = datetime.fromtimestamp(pending.events[-1].timestamp, timezone.utc)
+                storage_session.update_time = update_time.replace(tzinfo=None) if naive else update_time
+                storage_events += [schema.StorageEvent.from_event(pending.session, e) for e in pending.events]
+                # 提交后再访问 ORM 属性可能触发延迟加载,版本号要在提交前读出 (与 ADK 相同)
+                written[(app_name, user_id, session_id)] = (
+                    pending, storage_session.get_update_timestamp(), storage_session.get_update_marker()
+                )
+
+            # 所有会话的事件合并成一条多行 INSERT
+            sql_session.add_all(storage_events)
+            await sql_session.commit()
+
+        for key, dropped in stale.items():
+            self._stats["stale_sessions"] += 1
+            self._rejected[key] = self._rejected.get(key, 0) + dropped
+            print(f"⚠️ 会话 {key[2]} 已被其他进程修改或删除,{dropped} 个事件没有写入")
+
+        for key, (pending, update_timestamp, marker) in written.items():
+            self._markers[key] = marker
+            newer = self._pending.get(key)
+            if newer is not None and newer.expected_marker == pending.expected_marker:
+                # 写入期间同一会话又缓冲了新事件,它们接在刚写入的这批后面
+                newer.expected_marker = marker
+            pending.session.last_update_time = update_timestamp
+            pending.session._storage_update_marker = marker
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._stats["transactions"] += 1
+        self._stats["events_written"] += len(storage_events)
+        self._stats["max_batch_events"] = max(self._stats["max_batch_events"], len(storage_events))
+        self._stats["max_batch_sessions"] = max(self._stats["max_batch_sessions"], len(batch))
+        self._stats["flush_ms_total"] += elapsed_ms
+        self._stats["flush_ms_max"] = max(self._stats["flush_ms_max"], elapsed_ms)
+
+    # ----------------------------------------------------------------
+    # BaseSessionService 接口
+    # ----------------------------------------------------------------
+
+    async def create_session(self, *, app_name: str, user_id: str, state=None, session_id=None):
+        return await self.inner.create_session(app_name=app_name, user_id=user_id, state=state, session_id=session_id)
+
+    async def get_session(self, *, app_name: str, user_id: str, session_id: str, config=None):
+        await self.flush_session(app_name, user_id, session_id)
+        return await self.inner.get_session(app_name=app_name, user_id=user_id, session_id=session_id, config=config)
+
+    async def list_sessions(self, *, app_name: str, user_id=None):
+        await self.flush()
+        return await self.inner.list_sessions(app_name=app_name, user_id=user_id)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str):
+        key = (app_name, user_id, session_id)
+        async with self._write_lock:
+            pending = self._pending.pop(key, None)
+            if pending is not None:
+                self._pending_events -= len(pending.events)
+        self._markers.pop(key, None)
+        self._rejected.pop(key, None)
+        await self.inner.delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+
+    async def get_user_state(self, *, app_name: str, user_id: str):
+        await self.flush()
+        return await self.inner.get_user_state(app_name=app_name, user_id=user_id)
+
+    async def append_event(self, session, event):
+        await self.inner.prepare_tables()
+        if event.partial:
+            return event
+
+        # 与 DatabaseSessionService 相同: temp state 只进内存,不写库
+        self._apply_temp_state(session, event)
+        event = self._trim_temp_delta_state(event)
+
+        key = (session.app_name, session.user_id, session.id)
+        pending = self._pending.get(key)
+        if pending is None:
+            # 之前被拒绝的事件没有人来 flush (如对话被取消);这批事件如果仍然冲突会再次被拒绝
+            self._rejected.pop(key, None)
+            # 版本号是 UTC 时间的 ISO 字符串,可以直接比较新旧
+            markers = [m for m in (session._storage_update_marker, self._markers.get(key)) if m]
+            pending = self._pending[key] = _PendingSession(session, max(markers) if markers else None)
+        pending.add(event)
+        self._pending_events += 1
+        self._stats["events_buffered"] += 1
+
+        session.last_update_time = event.timestamp
+        self.start()
+        if self._pending_events >= self.max_batch:
+            self._wakeup.set()
+        return self._commit_event_to_session(session, event)
+
+    def stats(self) -> dict:
+        transactions = self._stats["transactions"]
+        return {
+            **self._stats,
+            "pending_events": self._pending_events,
+            "pending_sessions": len(self._pending),
+            "events_per_transaction": round(self._stats["events_written"] / transactions, 2) if transactions else 0.0,
+        }
@@ -2,6 +2,11 @@
 Agent 工具包
 """
 
+from .artifact_store import get_artifact_store
 from .pdf_tool import create_date_plan_pdf
+from .pdf_service import PdfServiceBusyError, pdf_service
+from .tool_cache import ToolResultCache
 
-__all__ = ["create_date_plan_pdf"]
+__all__ = [
+    "create_date_plan_pdf", "get_artifact_store", "pdf_service", "PdfServiceBusyError", "ToolResultCache",
+]
@@ -0,0 +1,160 @@
+"""
+PDF 后台清理 - 按最长闲置时间和总容量配额回收本地目录中的 PDF
+
+在 FastAPI lifespan 中启动,每隔 PDF_GC_INTERVAL 秒执行一轮:
+  1. 逐个分片目录扫描 (每个分片一次线程调用,不阻塞事件循环)
+  2. 删除超过 PDF_GC_MAX_AGE 秒没有被访问的文件
+  3. 总大小仍超过 PDF_GC_MAX_BYTES 时,按最近访问时间从旧到新继续删除
+
+文件的 mtime 就是最近访问时间 (生成、复用和下载时都会刷新)。最近
+PDF_GC_MIN_IDLE 秒内访问过的文件即使超出配额也不删除,避免刚返回给
+模型的下载链接立刻失效。多个 worker 共享目录时用非阻塞文件锁保证同一
+时间只有一个 worker 在清理,其他 worker 直接跳过本轮。
+
+只处理本地目录后端;内存后端自带 TTL 和内存预算,S3 请使用存储桶的生命周期规则。
+"""
+
+import asyncio
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows 本地开发时没有 fcntl,不做跨进程协调
+    fcntl = None
+
+PDF_GC_ENABLED = os.getenv("PDF_GC_ENABLED", "1") == "1"
+PDF_GC_INTERVAL = float(os.getenv("PDF_GC_INTERVAL", "600"))
+PDF_GC_MAX_AGE = float(os.getenv("PDF_GC_MAX_AGE", str(7 * 24 * 3600)))
+PDF_GC_MAX_BYTES = int(os.getenv("PDF_GC_MAX_BYTES", str(1024 * 1024 * 1024)))
+PDF_GC_MIN_IDLE = float(os.getenv("PDF_GC_MIN_IDLE", "300"))
+# 每次线程调用最多删除的文件数
+PDF_GC_BATCH = int(os.getenv("PDF_GC_BATCH", "200"))
+
+
+class ArtifactCollector:
+    """在 FastAPI lifespan 中启动的后台清理任务"""
+
+    def __init__(self, store, interval: float = PDF_GC_INTERVAL, max_age: float = PDF_GC_MAX_AGE,
+                 max_bytes: int = PDF_GC_MAX_BYTES, min_idle: float = PDF_GC_MIN_IDLE,
+                 batch: int = PDF_GC_BATCH):
+        self.store = store
+        self.backend = store.backend
+        self.interval = interval
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.min_idle = min_idle
+        self.batch = batch
+        self.lock_path = os.path.join(self.backend.root, "gc.lock")
+        self._task = None
+        self._stats = {
+            "passes": 0,
+            "skipped_locked": 0,
+            "files_reclaimed": 0,
+            "bytes_reclaimed": 0,
+            "expired": 0,
+            "over_quota": 0,
+            "last_pass_ms": 0.0,
+            "total_pass_ms": 0.0,
+            "last_pass_at": None,
+            "stored_files": 0,
+            "stored_bytes": 0,
+            "last_error": None,
+        }
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        print(f"🧹 PDF 清理任务已启动: 每 {self.interval:.0f}s 一轮, "
+              f"最长闲置 {self.max_age:.0f}s, 配额 {self.max_bytes // (1024 * 1024)}MB")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> dict:
+        return {**self._stats, "max_age": self.max_age, "max_bytes": self.max_bytes}
+
+    def _try_lock(self):
+        if fcntl is None:
+            return open(self.lock_path, "a")
+        f = open(self.lock_path, "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return None
+        return f
+
+    async def _delete(self, victims: list) -> list:
+        deleted = []
+        for i in range(0, len(victims), self.batch):
+            chunk = await asyncio.to_thread(self.backend.delete_many, victims[i:i + self.batch])
+            await asyncio.to_thread(self.store.forget, [digest for digest, _ in chunk])
+            deleted += chunk
+        return deleted
+
+    async def collect(self) -> bool:
+        """
+        执行一轮清理
+
+        Returns:
+            bool: 其他 worker 正在清理时返回 False
+        """
+        lock = await asyncio.to_thread(self._try_lock)
+        if lock is None:
+            self._stats["skipped_locked"] += 1
+            return False
+
+        started = time.perf_counter()
+        try:
+            now = time.time()
+            entries = []
+            for shard in await asyncio.to_thread(self.backend.shards):
+                entries += await asyncio.to_thread(self.backend.scan_shard, shard, now - self.max_age)
+
+            expired = [(digest, mtime) for digest, _, mtime in entries if mtime < now - self.max_age]
+            deleted = await self._delete(expired)
+            self._stats["expired"] += len(deleted)
+
+            gone = {digest for digest, _ in deleted}
+            alive = sorted((e for e in entries if e[0] not in gone), key=lambda e: e[2])
+            total = sum(size for _, size, _ in alive)
+            over_quota = []
+            for digest, size, mtime in alive:
+                if total <= self.max_bytes or mtime >= now - self.min_idle:
+                    break
+                over_quota.append((digest, mtime))
+                total -= size
+            evicted = await self._delete(over_quota)
+            self._stats["over_quota"] += len(evicted)
+
+            reclaimed = deleted + evicted
+            self._stats["files_reclaimed"] += len(reclaimed)
+            self._stats["bytes_reclaimed"] += sum(size for _, size in reclaimed)
+            self._stats["stored_files"] = len(entries) - len(reclaimed)
+            self._stats["stored_bytes"] = sum(size for _, size, _ in entries) - sum(size for _, size in reclaimed)
+            self._stats["last_error"] = None
+        finally:
+            lock.close()
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._stats["passes"] += 1
+        self._stats["last_pass_ms"] = round(elapsed_ms, 1)
+        self._stats["total_pass_ms"] += elapsed_ms
+        self._stats["last_pass_at"] = time.time()
+        if reclaimed:
+            print(f"🧹 PDF 清理: 删除 {len(reclaimed)} 个文件, 耗时 {elapsed_ms:.0f}ms")
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                await self.collect()
+            except Exception as e:
+                self._stats["last_error"] = str(e)
+                print(f"❌ PDF 清理失败: {e}")
+            await asyncio.sleep(self.interval)
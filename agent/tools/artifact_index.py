@@ -0,0 +1,106 @@
+"""
+PDF 元数据索引 - 生成 PDF 时登记 (用户, 文件名, 大小, 创建时间),列表接口按索引分页查询
+
+SQLite 表上建了 (user_id, created_at, file_name) 复合索引,按创建时间倒序的
+游标分页每次只走一段索引,耗时与已存储的 PDF 总数无关。
+"""
+
+import base64
+import os
+import sqlite3
+import threading
+import time
+
+from .artifact_store import PDF_OUTPUT_DIR, PDF_STORE_BACKEND
+
+# 内存后端的文件随进程消失,索引也只放在内存里;其他后端默认放在 PDF_OUTPUT_DIR 下
+PDF_INDEX_PATH = os.getenv(
+    "PDF_INDEX_PATH",
+    ":memory:" if PDF_STORE_BACKEND == "memory" else os.path.join(PDF_OUTPUT_DIR, "index.sqlite3"),
+)
+PDF_LIST_PAGE_SIZE = int(os.getenv("PDF_LIST_PAGE_SIZE", "20"))
+PDF_LIST_MAX_PAGE_SIZE = 100
+
+
+class InvalidCursorError(ValueError):
+    """分页游标无法解析"""
+
+
+def encode_cursor(created_at: float, file_name: str) -> str:
+    return base64.urlsafe_b64encode(f"{created_at!r}|{file_name}".encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, _, file_name = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").partition("|")
+        return float(created_at), file_name
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursorError(f"无效的分页游标: {cursor}") from e
+
+
+class ArtifactIndex:
+    """
+    PDF 元数据索引
+
+    同一个 PDF (相同哈希) 被多个用户生成时,每个用户各有一行;
+    进程内共用一个连接,用锁串行化,多个 worker 通过 WAL 共享同一个文件。
+    """
+
+    def __init__(self, path: str = PDF_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            "user_id TEXT NOT NULL, file_name TEXT NOT NULL, digest TEXT NOT NULL, "
+            "size INTEGER NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (user_id, file_name))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS artifacts_by_user_time ON artifacts (user_id, created_at, file_name)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS artifacts_by_digest ON artifacts (digest)")
+
+    def add(self, user_id: str, info, created_at: float = None):
+        """登记一个 PDF;同一用户重复生成相同内容时刷新创建时间,排到列表最前面"""
+        created_at = time.time() if created_at is None else created_at
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO artifacts (user_id, file_name, digest, size, created_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (user_id, file_name) DO UPDATE SET created_at = excluded.created_at",
+                (user_id, info.file_name, info.digest, info.size, created_at),
+            )
+
+    def remove(self, digest: str):
+        """PDF 被删除或淘汰后,所有用户的对应条目一起删除"""
+        with self._lock:
+            self._conn.execute("DELETE FROM artifacts WHERE digest = ?", (digest,))
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM artifacts LIMIT 1").fetchone() is None
+
+    def page(self, user_id: str, limit: int = None, cursor: str = None) -> dict:
+        """
+        按创建时间倒序分页
+
+        Returns:
+            dict: {"items": [{"name", "size", "created_at"}], "next_cursor": Optional[str]}
+        """
+        limit = max(1, min(limit or PDF_LIST_PAGE_SIZE, PDF_LIST_MAX_PAGE_SIZE))
+        sql = "SELECT file_name, size, created_at FROM artifacts WHERE user_id = ?"
+        params = [user_id]
+        if cursor:
+            created_at, file_name = decode_cursor(cursor)
+            sql += " AND (created_at, file_name) < (?, ?)"
+            params += [created_at, file_name]
+        sql += " ORDER BY created_at DESC, file_name DESC LIMIT ?"
+        # 多取一条判断是否还有下一页
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        items = [{"name": name, "size": size, "created_at": created_at} for name, size, created_at in rows[:limit]]
+        next_cursor = encode_cursor(rows[limit - 1][2], rows[limit - 1][0]) if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,550 @@
+"""
+PDF 产物存储 - 按内容哈希保存生成好的 PDF,可切换存储后端
+
+    memory  进程内 LRU,总字节数受 PDF_STORE_MEMORY_BUDGET 限制,条目存活 PDF_STORE_TTL 秒
+    local   本地目录 objects/<前两位>/<哈希>.pdf + 逐个文件的元数据 (多进程共享,写入时文件锁保护)
+    s3      S3 兼容的对象存储 (本地可用 MinIO 代替),需要安装 boto3
+
+所有后端都用 "友好文件名 -> 哈希" 的映射支持下载链接,并按字节区间读取,
+下载接口据此实现 Content-Length / ETag / Range。
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+try:
+    import fcntl
+except ImportError:  # Windows 本地开发时没有 fcntl,退化为不加锁
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+PDF_OUTPUT_DIR = os.getenv("PDF_OUTPUT_DIR", os.path.join(BASE_DIR, "generated_pdfs"))
+PDF_STORE_BACKEND = os.getenv("PDF_STORE_BACKEND", "local")
+PDF_STORE_MEMORY_BUDGET = int(os.getenv("PDF_STORE_MEMORY_BUDGET", str(64 * 1024 * 1024)))
+PDF_STORE_TTL = float(os.getenv("PDF_STORE_TTL", "3600"))
+PDF_STORE_S3_ENDPOINT = os.getenv("PDF_STORE_S3_ENDPOINT", "http://127.0.0.1:9000")
+PDF_STORE_S3_BUCKET = os.getenv("PDF_STORE_S3_BUCKET", "generated-pdfs")
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ArtifactTooLargeError(Exception):
+    """单个文件超过内存预算"""
+
+
+@dataclass
+class ArtifactInfo:
+    digest: str             # 生成参数的哈希,用于去重
+    file_name: str
+    size: int
+    created_at: float
+    sha256: str = None      # 文件字节的哈希
+
+    @property
+    def etag(self) -> str:
+        # digest 哈希的是生成参数,同样的参数每次渲染出的字节并不相同 (生成时间、ReportLab 的
+        # 创建时间和文档 ID),淘汰后重新生成的文件不能沿用它作为强 ETag,否则断点续传会拼接两个文件
+        if self.sha256:
+            return f'"{self.sha256}"'
+        # 之前版本存下的文件没有记录字节哈希: 弱 ETag 可以用于 304,但不能用于 If-Range 续传
+        return f'W/"{self.digest[:16]}-{self.size}-{int(self.created_at)}"'
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _unique_name(file_name: str, digest: str, taken) -> str:
+    if file_name not in taken:
+        return file_name
+    stem, ext = os.path.splitext(file_name)
+    return f"{stem}_{digest[:8]}{ext}"
+
+
+class MemoryBackend:
+    """进程内 LRU,不落盘;只适合单 worker 或会话粘滞的部署"""
+
+    name = "memory"
+
+    def __init__(self, budget: int = PDF_STORE_MEMORY_BUDGET, ttl: float = PDF_STORE_TTL):
+        self.budget = budget
+        self.ttl = ttl
+        self._objects = OrderedDict()   # digest -> (ArtifactInfo, bytes)
+        self._names = {}                # file_name -> digest
+        self._bytes = 0
+        self.evictions = 0
+        self.on_delete = None           # 条目过期或被淘汰时的回调 (digest)
+
+    def _drop(self, digest: str):
+        info, data = self._objects.pop(digest)
+        self._names.pop(info.file_name, None)
+        self._bytes -= len(data)
+        if self.on_delete is not None:
+            self.on_delete(digest)
+
+    def get(self, digest: str):
+        item = self._objects.get(digest)
+        if item is None:
+            return None
+        if time.time() - item[0].created_at > self.ttl:
+            self._drop(digest)
+            return None
+        self._objects.move_to_end(digest)
+        return item[0]
+
+    def resolve(self, file_name: str):
+        digest = self._names.get(file_name)
+        return self.get(digest) if digest else None
+
+    def put(self, digest: str, data: bytes, file_name: str) -> ArtifactInfo:
+        existing = self.get(digest)
+        if existing is not None:
+            return existing
+        if len(data) > self.budget:
+            raise ArtifactTooLargeError(f"PDF 大小 {len(data)} 字节超过内存预算 {self.budget} 字节")
+
+        info = ArtifactInfo(digest, _unique_name(file_name, digest, self._names), len(data), time.time(), _sha256(data))
+        self._objects[digest] = (info, bytes(data))
+        self._names[info.file_name] = digest
+        self._bytes += len(data)
+        while self._bytes > self.budget:
+            self._drop(next(iter(self._objects)))
+            self.evictions += 1
+        return info
+
+    def read(self, info: ArtifactInfo, start: int, end: int):
+        # 先取出引用,下载过程中条目被淘汰也不影响正在输出的响应
+        data = memoryview(self._objects[info.digest][1])
+        return (bytes(data[offset:min(offset + CHUNK_SIZE, end + 1)]) for offset in range(start, end + 1, CHUNK_SIZE))
+
+    def list(self) -> list:
+        return [info for info, _ in self._objects.values() if time.time() - info.created_at <= self.ttl]
+
+    def delete(self, digest: str):
+        if digest in self._objects:
+            self._drop(digest)
+
+    def usage(self) -> dict:
+        return {"objects": len(self._objects), "bytes": self._bytes, "budget": self.budget,
+                "evictions": self.evictions}
+
+
+def _entry_info(digest: str, entry: dict) -> ArtifactInfo:
+    return ArtifactInfo(digest, entry["file_name"], entry["size"], entry["created_at"], entry.get("sha256"))
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class LocalDirBackend:
+    """
+    本地目录: 按哈希分目录存放文件,元数据和友好文件名也按文件分别保存
+
+        objects/<前两位>/<哈希>.pdf       文件内容
+        meta/<前两位>/<哈希>.json         文件名、大小、创建时间、字节哈希
+        names/<前两位>/<文件名哈希>       友好文件名 -> 哈希的指针
+
+    查询只读一两个小文件,不加锁,耗时与已存储的文件数无关;写入都是先写临时文件再
+    os.replace,读到的要么是旧内容要么是新内容。put 和删除用文件锁串行化,保证同名文件不会互相覆盖。
+    """
+
+    name = "local"
+
+    def __init__(self, root: str = PDF_OUTPUT_DIR):
+        self.root = root
+        self.object_dir = os.path.join(root, "objects")
+        self.meta_dir = os.path.join(root, "meta")
+        self.name_dir = os.path.join(root, "names")
+        self.lock_path = os.path.join(root, "store.lock")
+        os.makedirs(self.object_dir, exist_ok=True)
+        self._migrate_manifest()
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.object_dir, digest[:2], f"{digest}.pdf")
+
+    def meta_path(self, digest: str) -> str:
+        return os.path.join(self.meta_dir, digest[:2], f"{digest}.json")
+
+    def name_path(self, file_name: str) -> str:
+        # 中文文件名转成十六进制会超过文件系统 255 字节的限制,用它的哈希作为指针文件名
+        key = _sha256(file_name.encode("utf-8"))
+        return os.path.join(self.name_dir, key[:2], key)
+
+    @contextmanager
+    def _lock(self):
+        with open(self.lock_path, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_meta(self, digest: str):
+        try:
+            with open(self.meta_path(digest), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_meta(self, digest: str, entry: dict):
+        _write_atomic(self.meta_path(digest), json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+
+    def _read_name(self, file_name: str):
+        try:
+            with open(self.name_path(file_name), "r", encoding="ascii") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _migrate_manifest(self):
+        """之前的版本把所有条目记录在一个 manifest.json 中,启动时拆成逐个文件的元数据"""
+        manifest_path = os.path.join(self.root, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return
+        with self._lock():
+            try:
+                with open(manifest_path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except FileNotFoundError:
+                return  # 其他 worker 已经迁移完
+            except ValueError:
+                manifest = {"objects": {}}
+            for digest, entry in manifest.get("objects", {}).items():
+                if self._read_meta(digest) is None:
+                    self._write_meta(digest, entry)
+                    _write_atomic(self.name_path(entry["file_name"]), digest.encode("ascii"))
+            os.remove(manifest_path)
+        try:
+            os.remove(manifest_path + ".lock")
+        except FileNotFoundError:
+            pass
+        print(f"📦 PDF 清单已拆分为逐个文件的元数据 ({len(manifest.get('objects', {}))} 个)")
+
+    def _info(self, digest: str, entry: dict):
+        if entry is None:
+            return None
+        try:
+            # 用 mtime 记录最近一次访问,后台清理按它做 LRU 淘汰
+            os.utime(self.object_path(digest))
+        except FileNotFoundError:
+            return None
+        return _entry_info(digest, entry)
+
+    def get(self, digest: str):
+        return self._info(digest, self._read_meta(digest))
+
+    def resolve(self, file_name: str):
+        digest = self._read_name(file_name)
+        if digest is None:
+            return None
+        entry = self._read_meta(digest)
+        # 指针可能指向已经删除后又以其他文件名重新生成的条目
+        if entry is None or entry["file_name"] != file_name:
+            return None
+        return self._info(digest, entry)
+
+    def put(self, digest: str, data: bytes, file_name: str) -> ArtifactInfo:
+        path = self.object_path(digest)
+        with self._lock():
+            entry = self._read_meta(digest)
+            if entry is not None and os.path.exists(path):
+                # 并发生成相同内容时沿用先写入的文件: 同样的参数每次渲染的字节不同,
+                # 覆盖会让已经发出的 ETag 对不上文件内容
+                return _entry_info(digest, entry)
+
+            _write_atomic(path, data)
+
+            if entry is None:
+                taken = self._read_name(file_name)
+                if taken is not None and taken != digest and self._read_meta(taken) is not None:
+                    file_name = _unique_name(file_name, digest, {file_name})
+            else:
+                file_name = entry["file_name"]
+            entry = {"file_name": file_name, "size": len(data), "created_at": time.time(), "sha256": _sha256(data)}
+            self._write_meta(digest, entry)
+            _write_atomic(self.name_path(file_name), digest.encode("ascii"))
+        return _entry_info(digest, entry)
+
+    def read(self, info: ArtifactInfo, start: int, end: int):
+        with open(self.object_path(info.digest), "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def list(self) -> list:
+        """遍历全部元数据,只在启动时建立索引用"""
+        infos = []
+        for shard in self._listdir(self.meta_dir):
+            for name in self._listdir(os.path.join(self.meta_dir, shard)):
+                if not name.endswith(".json"):
+                    continue
+                digest = name[:-len(".json")]
+                entry = self._read_meta(digest)
+                if entry is not None and os.path.exists(self.object_path(digest)):
+                    infos.append(_entry_info(digest, entry))
+        return infos
+
+    @staticmethod
+    def _listdir(path: str) -> list:
+        try:
+            return sorted(os.listdir(path))
+        except FileNotFoundError:
+            return []
+
+    def delete(self, digest: str):
+        self.delete_many([(digest, None)])
+
+    def shards(self) -> list:
+        """objects/ 下的分片目录名 (哈希前两位)"""
+        try:
+            return sorted(entry.name for entry in os.scandir(self.object_dir) if entry.is_dir())
+        except FileNotFoundError:
+            return []
+
+    def scan_shard(self, shard: str, stale_before: float) -> list:
+        """
+        列出一个分片中的文件 [(digest, size, mtime)]
+
+        顺便删除 stale_before 之前留下的临时文件 (写入过程中进程退出时会残留)
+        """
+        entries = []
+        try:
+            it = os.scandir(os.path.join(self.object_dir, shard))
+        except FileNotFoundError:
+            return entries
+        with it:
+            for entry in it:
+                try:
+                    stat = entry.stat()
+                    if entry.name.endswith(".pdf"):
+                        entries.append((entry.name[:-len(".pdf")], stat.st_size, stat.st_mtime))
+                    elif stat.st_mtime < stale_before:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+        return entries
+
+    def delete_many(self, victims: list) -> list:
+        """
+        删除一批文件及其元数据和文件名指针
+
+        Args:
+            victims: [(digest, 扫描时看到的 mtime)];mtime 变化说明期间被访问或重新写入,跳过。
+                     mtime 为 None 时无条件删除。
+
+        Returns:
+            list: 实际删除的 [(digest, size)]
+        """
+        deleted = []
+        with self._lock():
+            for digest, seen_mtime in victims:
+                path = self.object_path(digest)
+                try:
+                    stat = os.stat(path)
+                    if seen_mtime is not None and stat.st_mtime != seen_mtime:
+                        continue
+                    os.remove(path)
+                    deleted.append((digest, stat.st_size))
+                except FileNotFoundError:
+                    pass
+                entry = self._read_meta(digest)
+                if entry is None:
+                    continue
+                if self._read_name(entry["file_name"]) == digest:
+                    os.remove(self.name_path(entry["file_name"]))
+                os.remove(self.meta_path(digest))
+        return deleted
+
+    def usage(self) -> dict:
+        return {"root": self.root}
+
+
+class S3Backend:
+    """S3 兼容对象存储: 文件存在 objects/<哈希>.pdf,友好文件名写在对象元数据和 names/ 下的指针对象中"""
+
+    name = "s3"
+
+    def __init__(self, endpoint: str = PDF_STORE_S3_ENDPOINT, bucket: str = PDF_STORE_S3_BUCKET):
+        import boto3  # 可选依赖,只有选择 s3 后端时才需要
+        from botocore.exceptions import ClientError
+
+        self._client_error = ClientError
+        self.bucket = bucket
+        self._s3 = boto3.client("s3", endpoint_url=endpoint)
+
+    @staticmethod
+    def _key(digest: str) -> str:
+        return f"objects/{digest}.pdf"
+
+    @staticmethod
+    def _name_key(file_name: str) -> str:
+        return f"names/{file_name.encode('utf-8').hex()}"
+
+    def get(self, digest: str):
+        try:
+            head = self._s3.head_object(Bucket=self.bucket, Key=self._key(digest))
+        except self._client_error:
+            return None
+        meta = head.get("Metadata", {})
+        return ArtifactInfo(digest, bytes.fromhex(meta["file-name"]).decode("utf-8"),
+                            head["ContentLength"], float(meta["created-at"]), meta.get("sha256"))
+
+    def resolve(self, file_name: str):
+        try:
+            pointer = self._s3.get_object(Bucket=self.bucket, Key=self._name_key(file_name))
+        except self._client_error:
+            return None
+        return self.get(pointer["Body"].read().decode("ascii"))
+
+    def put(self, digest: str, data: bytes, file_name: str) -> ArtifactInfo:
+        existing = self.get(digest)
+        if existing is not None:
+            return existing
+        if self.resolve(file_name) is not None:
+            file_name = _unique_name(file_name, digest, {file_name})
+        created_at = time.time()
+        sha256 = _sha256(data)
+        self._s3.put_object(
+            Bucket=self.bucket, Key=self._key(digest), Body=data, ContentType="application/pdf",
+            Metadata={"file-name": file_name.encode("utf-8").hex(), "created-at": str(created_at), "sha256": sha256},
+        )
+        self._s3.put_object(Bucket=self.bucket, Key=self._name_key(file_name), Body=digest.encode("ascii"))
+        return ArtifactInfo(digest, file_name, len(data), created_at, sha256)
+
+    def read(self, info: ArtifactInfo, start: int, end: int):
+        body = self._s3.get_object(Bucket=self.bucket, Key=self._key(info.digest), Range=f"bytes={start}-{end}")["Body"]
+        yield from body.iter_chunks(CHUNK_SIZE)
+
+    def list(self) -> list:
+        infos = []
+        paginator = self._s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix="objects/"):
+            for obj in page.get("Contents", []):
+                info = self.get(obj["Key"][len("objects/"):-len(".pdf")])
+                if info is not None:
+                    infos.append(info)
+        return infos
+
+    def delete(self, digest: str):
+        info = self.get(digest)
+        if info is not None:
+            self._s3.delete_object(Bucket=self.bucket, Key=self._name_key(info.file_name))
+            self._s3.delete_object(Bucket=self.bucket, Key=self._key(digest))
+
+    def usage(self) -> dict:
+        return {"bucket": self.bucket}
+
+
+class ArtifactStore:
+    """在后端之上统计命中率和节省的字节数,并维护按用户分页的元数据索引"""
+
+    def __init__(self, backend, index=None):
+        self.backend = backend
+        self.index = index
+        if index is not None:
+            backend.on_delete = index.remove
+        self._stats = {"hits": 0, "misses": 0, "puts": 0, "bytes_saved": 0, "bytes_written": 0}
+
+    async def offload(self, func, *args):
+        """
+        在异步处理函数中调用存储方法: 本地目录和 S3 后端会读写磁盘、访问网络,放到线程中执行,
+        不阻塞事件循环;内存后端不是线程安全的,且不涉及 I/O,直接调用
+        """
+        if self.backend.name == "memory":
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    def lookup(self, digest: str):
+        """相同内容已经存在时返回 ArtifactInfo,否则返回 None"""
+        info = self.backend.get(digest)
+        if info is None:
+            self._stats["misses"] += 1
+        else:
+            self._stats["hits"] += 1
+            self._stats["bytes_saved"] += info.size
+        return info
+
+    def put(self, digest: str, data: bytes, file_name: str) -> ArtifactInfo:
+        info = self.backend.put(digest, data, file_name)
+        self._stats["puts"] += 1
+        self._stats["bytes_written"] += len(data)
+        return info
+
+    def register(self, user_id: str, info: ArtifactInfo):
+        """把 PDF 登记到用户名下,命中已有内容时也要登记"""
+        if self.index is not None:
+            self.index.add(user_id, info)
+
+    def page(self, user_id: str, limit: int = None, cursor: str = None) -> dict:
+        """某个用户的 PDF,按创建时间倒序分页"""
+        return self.index.page(user_id, limit, cursor)
+
+    def resolve(self, file_name: str):
+        return self.backend.resolve(file_name)
+
+    def read(self, info: ArtifactInfo, start: int = 0, end: int = None):
+        """按闭区间 [start, end] 逐块读取"""
+        return self.backend.read(info, start, info.size - 1 if end is None else end)
+
+    def list(self) -> list:
+        return self.backend.list()
+
+    def delete(self, digest: str):
+        self.backend.delete(digest)
+        if self.index is not None:
+            self.index.remove(digest)
+
+    def forget(self, digests: list):
+        """后端已经删除的文件,从元数据索引中移除"""
+        if self.index is not None:
+            for digest in digests:
+                self.index.remove(digest)
+
+    def stats(self) -> dict:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "backend": self.backend.name,
+            "hit_ratio": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            **self.backend.usage(),
+        }
+
+
+_BACKENDS = {"memory": MemoryBackend, "local": LocalDirBackend, "s3": S3Backend}
+# 建立索引之前生成的 PDF 没有记录用户,归到前端默认的 user_id 下
+LEGACY_USER_ID = "user"
+_store = None
+
+
+def get_artifact_store() -> ArtifactStore:
+    """按 PDF_STORE_BACKEND 创建进程内共用的存储"""
+    global _store
+    if _store is None:
+        from .artifact_index import ArtifactIndex
+
+        backend = _BACKENDS[PDF_STORE_BACKEND]()
+        index = ArtifactIndex()
+        if index.is_empty():
+            for info in backend.list():
+                index.add(LEGACY_USER_ID, info, created_at=info.created_at)
+        _store = ArtifactStore(backend, index)
+    return _store
+
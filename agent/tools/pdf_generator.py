@@ -16,8 +16,11 @@
 PDF 生成工具 - 用于生成恋爱相关的 PDF 文档
 """
 
+import io
 import os
+import hashlib
 from datetime import datetime
+from urllib.parse import quote
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import cm
@@ -26,119 +29,112 @@ from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
 import json
 
-# 获取项目根目录
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-PDF_OUTPUT_DIR = os.path.join(BASE_DIR, "generated_pdfs")
+from .artifact_store import LEGACY_USER_ID, get_artifact_store
 
-# 确保输出目录存在
-os.makedirs(PDF_OUTPUT_DIR, exist_ok=True)
 
+# ----------------------------------------------------------------
+# 内容寻址: 相同参数只渲染一次,重复请求直接返回已有文件
+# PDF 在内存中渲染为字节串,由 artifact_store 决定存放位置 (内存/本地目录/S3)
+# ----------------------------------------------------------------
 
-def register_chinese_fonts():
-    """注册中文字体 - 使用系统自带的字体"""
-    try:
-        # Windows 系统字体路径
-        font_path = "C:/Windows/Fonts/msyh.ttc"  # 微软雅黑
-        if os.path.exists(font_path):
-            pdfmetrics.registerFont(TTFont('ChineseFont', font_path))
-            return True
-    except Exception as e:
-        print(f"警告: 无法注册中文字体 {e}")
-    return False
+def content_hash(kind: str, params: dict) -> str:
+    """对规范化后的生成参数计算哈希"""
+    canonical = json.dumps({"kind": kind, "params": params}, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
 
 
-def generate_date_plan_pdf(
-    title: str,
-    restaurant_info: dict,
-    activity_schedule: list,
-    gift_list: list,
-    additional_notes: str = ""
-) -> dict:
+def pdf_file_name(title: str) -> str:
+    """下载时使用的友好文件名"""
+    return f"{title}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+
+
+def artifact_result(info, cached: bool) -> dict:
+    return {
+        "success": True,
+        "file_name": info.file_name,
+        "download_url": f"/api/download_pdf/{quote(info.file_name)}",
+        "size": info.size,
+        "cached": cached,
+        "message": f"PDF 文档生成成功! 文件名: {info.file_name}"
+    }
+
+
+# 中文字体搜索路径: PDF_FONT_PATHS (用系统路径分隔符分隔) 优先,然后是常见的系统字体位置。
+# ReportLab 只支持 TrueType 轮廓,Noto CJK 这类 CFF 字体无法使用。
+PDF_FONT_PATHS = [path for path in os.getenv("PDF_FONT_PATHS", "").split(os.pathsep) if path]
+DEFAULT_FONT_PATHS = [
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",   # Debian/Ubuntu: fonts-wqy-microhei
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",     # Debian/Ubuntu: fonts-wqy-zenhei
+    "/usr/share/fonts/wqy-microhei/wqy-microhei.ttc",   # Fedora/Alpine
+    "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",
+    "/System/Library/Fonts/STHeiti Light.ttc",          # macOS
+    "C:/Windows/Fonts/msyh.ttc",                        # Windows 微软雅黑
+]
+# 找不到字体文件时使用 ReportLab 内置的 CID 宋体,不依赖任何系统字体
+FALLBACK_CID_FONT = "STSong-Light"
+
+
+class PdfRenderContext:
     """
-    生成约会计划 PDF
-    
-    Args:
-        title: PDF 标题 (例如: "七夕约会计划")
-        restaurant_info: 餐厅信息字典 {"name": "餐厅名", "time": "预订时间", "address": "地址", "phone": "电话"}
-        activity_schedule: 活动流程列表 [{"time": "14:00", "activity": "看电影", "location": "万达影城"}]
-        gift_list: 礼物清单列表 [{"name": "玫瑰花", "price": "99元", "status": "已购买"}]
-        additional_notes: 额外备注
-    
-    Returns:
-        dict: {"success": bool, "file_path": str, "file_name": str, "message": str}
+    PDF 渲染上下文 - 字体、段落样式和表格样式只创建一次,所有 PDF 共用
+
+    每个进程 (包括渲染进程池的 worker) 第一次渲染时创建,之后复用。
     """
-    try:
-        # 注册中文字体
-        has_chinese_font = register_chinese_fonts()
-        
-        # 生成文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_name = f"{title}_{timestamp}.pdf"
-        file_path = os.path.join(PDF_OUTPUT_DIR, file_name)
-        
-        # 创建 PDF 文档
-        doc = SimpleDocTemplate(file_path, pagesize=A4)
-        story = []
-        
-        # 设置样式
+
+    def __init__(self, font_paths: list = None):
+        self.font_name, self.font_path = self._register_font(font_paths or PDF_FONT_PATHS + DEFAULT_FONT_PATHS)
+        self.has_chinese_font = self.font_name != "Helvetica"
+        bold_font = self.font_name if self.has_chinese_font else "Helvetica-Bold"
+
         styles = getSampleStyleSheet()
-        
-        # 标题样式
-        title_style = ParagraphStyle(
+
+        # 约会计划标题样式
+        self.title_style = ParagraphStyle(
             'CustomTitle',
             parent=styles['Heading1'],
-            fontName='ChineseFont' if has_chinese_font else 'Helvetica-Bold',
+            fontName=bold_font,
             fontSize=24,
             textColor=colors.HexColor('#E91E63'),
             alignment=TA_CENTER,
             spaceAfter=30,
         )
-        
+
+        # 纯文本 PDF 的标题样式
+        self.text_title_style = ParagraphStyle(
+            'CustomTextTitle',
+            parent=self.title_style,
+            fontSize=20,
+            spaceAfter=20,
+        )
+
         # 副标题样式
-        subtitle_style = ParagraphStyle(
+        self.subtitle_style = ParagraphStyle(
             'CustomSubtitle',
             parent=styles['Heading2'],
-            fontName='ChineseFont' if has_chinese_font else 'Helvetica-Bold',
+            fontName=bold_font,
             fontSize=16,
             textColor=colors.HexColor('#FF4081'),
             spaceAfter=12,
         )
-        
+
         # 正文样式
-        body_style = ParagraphStyle(
+        self.body_style = ParagraphStyle(
             'CustomBody',
             parent=styles['Normal'],
-            fontName='ChineseFont' if has_chinese_font else 'Helvetica',
+            fontName=self.font_name,
             fontSize=11,
             leading=18,
         )
-        
-        # 添加标题
-        story.append(Paragraph(title, title_style))
-        story.append(Spacer(1, 0.5*cm))
-        
-        # 添加生成时间
-        date_text = f"生成时间: {datetime.now().strftime('%Y年%m月%d日 %H:%M')}"
-        story.append(Paragraph(date_text, body_style))
-        story.append(Spacer(1, 1*cm))
-        
-        # 1. 餐厅预订信息
-        story.append(Paragraph("🍽️ 餐厅预订信息", subtitle_style))
-        restaurant_data = [
-            ["餐厅名称", restaurant_info.get("name", "未指定")],
-            ["预订时间", restaurant_info.get("time", "未指定")],
-            ["餐厅地址", restaurant_info.get("address", "未指定")],
-            ["联系电话", restaurant_info.get("phone", "未指定")],
-        ]
-        
-        restaurant_table = Table(restaurant_data, colWidths=[4*cm, 12*cm])
-        restaurant_table.setStyle(TableStyle([
+
+        # 左侧为字段名的信息表 (餐厅预订信息)
+        self.info_table_style = TableStyle([
             ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#FFE0F0')),
             ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
             ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), 'ChineseFont' if has_chinese_font else 'Helvetica'),
+            ('FONTNAME', (0, 0), (-1, -1), self.font_name),
             ('FONTSIZE', (0, 0), (-1, -1), 10),
             ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#FFB6D9')),
             ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
@@ -146,148 +142,225 @@ def generate_date_plan_pdf(
             ('RIGHTPADDING', (0, 0), (-1, -1), 10),
             ('TOPPADDING', (0, 0), (-1, -1), 8),
             ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ]))
-        story.append(restaurant_table)
-        story.append(Spacer(1, 1*cm))
-        
-        # 2. 活动流程
-        story.append(Paragraph("📅 活动流程安排", subtitle_style))
-        activity_data = [["时间", "活动内容", "地点"]]
-        for activity in activity_schedule:
-            activity_data.append([
-                activity.get("time", ""),
-                activity.get("activity", ""),
-                activity.get("location", "")
-            ])
-        
-        activity_table = Table(activity_data, colWidths=[3*cm, 7*cm, 6*cm])
-        activity_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#FF4081')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, -1), 'ChineseFont' if has_chinese_font else 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('FONTSIZE', (0, 1), (-1, -1), 10),
-            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#FFB6D9')),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('TOPPADDING', (0, 0), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ]))
-        story.append(activity_table)
-        story.append(Spacer(1, 1*cm))
-        
-        # 3. 礼物清单
-        story.append(Paragraph("🎁 礼物清单", subtitle_style))
-        gift_data = [["礼物名称", "预算/价格", "状态"]]
-        for gift in gift_list:
-            gift_data.append([
-                gift.get("name", ""),
-                gift.get("price", ""),
-                gift.get("status", "待购买")
-            ])
-        
-        gift_table = Table(gift_data, colWidths=[6*cm, 5*cm, 5*cm])
-        gift_table.setStyle(TableStyle([
+        ])
+
+        # 首行为表头的列表表格 (活动流程、礼物清单)
+        self.list_table_style = TableStyle([
             ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#FF4081')),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, -1), 'ChineseFont' if has_chinese_font else 'Helvetica'),
+            ('FONTNAME', (0, 0), (-1, -1), self.font_name),
             ('FONTSIZE', (0, 0), (-1, 0), 11),
             ('FONTSIZE', (0, 1), (-1, -1), 10),
             ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#FFB6D9')),
             ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
             ('TOPPADDING', (0, 0), (-1, -1), 8),
             ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ]))
-        story.append(gift_table)
-        story.append(Spacer(1, 1*cm))
-        
-        # 4. 额外备注
-        if additional_notes:
-            story.append(Paragraph("📝 温馨提示", subtitle_style))
-            story.append(Paragraph(additional_notes, body_style))
-        
-        # 生成 PDF
-        doc.build(story)
-        
-        return {
-            "success": True,
-            "file_path": file_path,
-            "file_name": file_name,
-            "message": f"PDF 文档生成成功! 文件名: {file_name}"
-        }
-        
-    except Exception as e:
-        return {
-            "success": False,
-            "file_path": "",
-            "file_name": "",
-            "message": f"PDF 生成失败: {str(e)}"
-        }
+        ])
+
+    @staticmethod
+    def _register_font(font_paths: list):
+        """返回 (字体名, 字体文件路径),依次尝试字体文件、内置 CID 字体和 Helvetica"""
+        for font_path in font_paths:
+            if not os.path.exists(font_path):
+                continue
+            try:
+                pdfmetrics.registerFont(TTFont('ChineseFont', font_path, subfontIndex=0))
+                return 'ChineseFont', font_path
+            except Exception as e:
+                print(f"警告: 无法注册中文字体 {font_path}: {e}")
+        try:
+            pdfmetrics.registerFont(UnicodeCIDFont(FALLBACK_CID_FONT))
+            return FALLBACK_CID_FONT, None
+        except Exception as e:
+            print(f"警告: 无法注册中文字体 {e}")
+        return 'Helvetica', None
+
+
+_render_context = None
+
+
+def get_render_context() -> PdfRenderContext:
+    """当前进程共用的渲染上下文"""
+    global _render_context
+    if _render_context is None:
+        _render_context = PdfRenderContext()
+    return _render_context
+
+
+def register_chinese_fonts():
+    """注册中文字体 (只在进程内第一次调用时真正注册)"""
+    return get_render_context().has_chinese_font
 
 
-def generate_pdf_from_text(title: str, content: str) -> dict:
+def build_date_plan_pdf(
+    title: str,
+    restaurant_info: dict,
+    activity_schedule: list,
+    gift_list: list,
+    additional_notes: str = "",
+    context: PdfRenderContext = None
+) -> bytes:
     """
-    从文本内容生成简单的 PDF
+    在内存中渲染约会计划 PDF,不写磁盘
     
     Args:
-        title: PDF 标题
-        content: 文本内容
+        title: PDF 标题 (例如: "七夕约会计划")
+        restaurant_info: 餐厅信息字典 {"name": "餐厅名", "time": "预订时间", "address": "地址", "phone": "电话"}
+        activity_schedule: 活动流程列表 [{"time": "14:00", "activity": "看电影", "location": "万达影城"}]
+        gift_list: 礼物清单列表 [{"name": "玫瑰花", "price": "99元", "status": "已购买"}]
+        additional_notes: 额外备注
+        context: 渲染上下文,默认使用进程内共用的上下文
     
     Returns:
-        dict: {"success": bool, "file_path": str, "file_name": str, "message": str}
+        bytes: PDF 文件内容
     """
+    # 字体和样式只在进程内第一次渲染时创建
+    ctx = context or get_render_context()
+    title_style, subtitle_style, body_style = ctx.title_style, ctx.subtitle_style, ctx.body_style
+    
+    # 创建 PDF 文档
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    story = []
+    
+    # 添加标题
+    story.append(Paragraph(title, title_style))
+    story.append(Spacer(1, 0.5*cm))
+    
+    # 添加生成时间
+    date_text = f"生成时间: {datetime.now().strftime('%Y年%m月%d日 %H:%M')}"
+    story.append(Paragraph(date_text, body_style))
+    story.append(Spacer(1, 1*cm))
+    
+    # 1. 餐厅预订信息
+    story.append(Paragraph("🍽️ 餐厅预订信息", subtitle_style))
+    restaurant_data = [
+        ["餐厅名称", restaurant_info.get("name", "未指定")],
+        ["预订时间", restaurant_info.get("time", "未指定")],
+        ["餐厅地址", restaurant_info.get("address", "未指定")],
+        ["联系电话", restaurant_info.get("phone", "未指定")],
+    ]
+    
+    restaurant_table = Table(restaurant_data, colWidths=[4*cm, 12*cm])
+    restaurant_table.setStyle(ctx.info_table_style)
+    story.append(restaurant_table)
+    story.append(Spacer(1, 1*cm))
+    
+    # 2. 活动流程
+    story.append(Paragraph("📅 活动流程安排", subtitle_style))
+    activity_data = [["时间", "活动内容", "地点"]]
+    for activity in activity_schedule:
+        activity_data.append([
+            activity.get("time", ""),
+            activity.get("activity", ""),
+            activity.get("location", "")
+        ])
+    
+    activity_table = Table(activity_data, colWidths=[3*cm, 7*cm, 6*cm])
+    activity_table.setStyle(ctx.list_table_style)
+    story.append(activity_table)
+    story.append(Spacer(1, 1*cm))
+    
+    # 3. 礼物清单
+    story.append(Paragraph("🎁 礼物清单", subtitle_style))
+    gift_data = [["礼物名称", "预算/价格", "状态"]]
+    for gift in gift_list:
+        gift_data.append([
+            gift.get("name", ""),
+            gift.get("price", ""),
+            gift.get("status", "待购买")
+        ])
+    
+    gift_table = Table(gift_data, colWidths=[6*cm, 5*cm, 5*cm])
+    gift_table.setStyle(ctx.list_table_style)
+    story.append(gift_table)
+    story.append(Spacer(1, 1*cm))
+    
+    # 4. 额外备注
+    if additional_notes:
+        story.append(Paragraph("📝 温馨提示", subtitle_style))
+        story.append(Paragraph(additional_notes, body_style))
+    
+    # 生成 PDF
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def build_text_pdf(title: str, content: str, context: PdfRenderContext = None) -> bytes:
+    """在内存中把文本内容渲染为简单的 PDF"""
+    ctx = context or get_render_context()
+    title_style, body_style = ctx.text_title_style, ctx.body_style
+    
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    story = []
+    
+    story.append(Paragraph(title, title_style))
+    story.append(Spacer(1, 1*cm))
+    
+    # 处理多行文本
+    for line in content.split('\n'):
+        if line.strip():
+            story.append(Paragraph(line, body_style))
+            story.append(Spacer(1, 0.3*cm))
+    
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def _render_and_store(kind: str, params: dict, builder, context: PdfRenderContext, user_id: str) -> dict:
+    """查找相同内容的已有 PDF,没有时渲染并存入 artifact_store,最后登记到用户名下"""
     try:
-        has_chinese_font = register_chinese_fonts()
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_name = f"{title}_{timestamp}.pdf"
-        file_path = os.path.join(PDF_OUTPUT_DIR, file_name)
-        
-        doc = SimpleDocTemplate(file_path, pagesize=A4)
-        story = []
-        
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontName='ChineseFont' if has_chinese_font else 'Helvetica-Bold',
-            fontSize=20,
-            textColor=colors.HexColor('#E91E63'),
-            alignment=TA_CENTER,
-            spaceAfter=20,
-        )
-        
-        body_style = ParagraphStyle(
-            'CustomBody',
-            parent=styles['Normal'],
-            fontName='ChineseFont' if has_chinese_font else 'Helvetica',
-            fontSize=11,
-            leading=18,
-        )
-        
-        story.append(Paragraph(title, title_style))
-        story.append(Spacer(1, 1*cm))
-        
-        # 处理多行文本
-        for line in content.split('\n'):
-            if line.strip():
-                story.append(Paragraph(line, body_style))
-                story.append(Spacer(1, 0.3*cm))
-        
-        doc.build(story)
-        
-        return {
-            "success": True,
-            "file_path": file_path,
-            "file_name": file_name,
-            "message": f"PDF 文档生成成功! 文件名: {file_name}"
-        }
-        
+        store = get_artifact_store()
+        digest = content_hash(kind, params)
+        info = store.lookup(digest)
+        cached = info is not None
+        if not cached:
+            data = builder(**params, context=context)
+            info = store.put(digest, data, pdf_file_name(params["title"]))
+        store.register(user_id, info)
+        return artifact_result(info, cached=cached)
+
     except Exception as e:
         return {
             "success": False,
-            "file_path": "",
             "file_name": "",
             "message": f"PDF 生成失败: {str(e)}"
         }
+
+
+def generate_date_plan_pdf(
+    title: str,
+    restaurant_info: dict,
+    activity_schedule: list,
+    gift_list: list,
+    additional_notes: str = "",
+    context: PdfRenderContext = None,
+    user_id: str = LEGACY_USER_ID
+) -> dict:
+    """
+    生成约会计划 PDF 并存入 artifact_store (同步版本,参数同 build_date_plan_pdf,user_id 为 PDF 所属用户)
+    
+    Returns:
+        dict: {"success": bool, "file_name": str, "download_url": str, "size": int, "cached": bool, "message": str}
+    """
+    params = {
+        "title": title,
+        "restaurant_info": restaurant_info,
+        "activity_schedule": activity_schedule,
+        "gift_list": gift_list,
+        "additional_notes": additional_notes,
+    }
+    return _render_and_store("date_plan", params, build_date_plan_pdf, context, user_id)
+
+
+def generate_pdf_from_text(title: str, content: str, context: PdfRenderContext = None,
+                           user_id: str = LEGACY_USER_ID) -> dict:
+    """
+    从文本内容生成简单的 PDF 并存入 artifact_store
+    
+    Returns:
+        dict: {"success": bool, "file_name": str, "download_url": str, "size": int, "cached": bool, "message": str}
+    """
+    return _render_and_store("text", {"title": title, "content": content}, build_text_pdf, context, user_id)
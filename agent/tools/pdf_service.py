@@ -0,0 +1,154 @@
+"""
+PDF 渲染服务 - 把 ReportLab 渲染放到进程池中执行,不阻塞事件循环
+
+ReportLab 是纯 CPU 的同步代码,直接在工具函数里调用会卡住同一个
+uvicorn worker 上所有正在输出的 SSE 流。这里用一个有界的进程池渲染,
+排队任务数超过上限时直接拒绝,每个任务记录排队和渲染耗时。
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .pdf_generator import register_chinese_fonts
+from agent.metrics import PDF_RENDER
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+# 正在渲染 + 排队中的任务总数上限
+PDF_MAX_PENDING = int(os.getenv("PDF_MAX_PENDING", "8"))
+PDF_TIMEOUT = float(os.getenv("PDF_TIMEOUT", "30"))
+# 子进程的启动方式。默认的 fork 会复制事件循环线程、数据库连接池和 gRPC 通道等状态,
+# 其中的锁可能正被其他线程持有;forkserver 从一个干净的服务进程复制 (没有它的平台用 spawn)
+PDF_MP_START = os.getenv(
+    "PDF_MP_START",
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn",
+)
+
+
+class PdfServiceBusyError(Exception):
+    """排队任务已满"""
+
+
+def _warm_worker():
+    # 子进程启动时先注册好字体,第一个任务不用再付这部分开销
+    register_chinese_fonts()
+
+
+def _noop():
+    return os.getpid()
+
+
+def _run_job(func, kwargs: dict):
+    started_at = time.time()
+    result = func(**kwargs)
+    return result, started_at, time.time()
+
+
+class PdfRenderService:
+    """进程池渲染服务,所有方法都在事件循环线程中调用"""
+
+    def __init__(self, workers: int = PDF_WORKERS, max_pending: int = PDF_MAX_PENDING,
+                 timeout: float = PDF_TIMEOUT):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._pending = 0
+        self._stats = {
+            "jobs": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "rejected": 0,
+            "timeouts": 0,
+            "queue_wait_ms_total": 0.0,
+            "render_ms_total": 0.0,
+            "render_ms_max": 0.0,
+        }
+
+    def start(self):
+        """创建进程池并预热所有 worker"""
+        if self._executor is not None:
+            return
+        context = multiprocessing.get_context(PDF_MP_START)
+        if PDF_MP_START == "forkserver":
+            # 服务进程先导入 ReportLab,之后的 worker 复制它,不用各自再导入一遍
+            context.set_forkserver_preload([_warm_worker.__module__])
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                             initializer=_warm_worker)
+        for _ in range(self.workers):
+            self._executor.submit(_noop)
+        print(f"🖨️ PDF 渲染进程池已启动: {self.workers} 个 worker, 最多 {self.max_pending} 个排队任务")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def render(self, func, **kwargs):
+        """
+        在进程池中执行 func(**kwargs),返回它的结果 (如渲染好的 PDF 字节串)
+
+        Raises:
+            PdfServiceBusyError: 排队任务已满
+            asyncio.TimeoutError: 超过 timeout 秒仍未完成
+        """
+        if self._pending >= self.max_pending:
+            self._stats["rejected"] += 1
+            raise PdfServiceBusyError(f"当前有 {self._pending} 个 PDF 正在生成,请稍后再试")
+
+        self.start()
+        submitted_at = time.time()
+        try:
+            job = self._executor.submit(_run_job, func, kwargs)
+        except Exception:
+            self._stats["failed"] += 1
+            raise
+        # 名额保留到进程池中的任务真正结束: 超时或取消只能撤回还在排队的任务,
+        # 已经开始渲染的会继续占用 worker,提前释放会让 max_pending 限制不住进程池的积压
+        self._pending += 1
+        loop = asyncio.get_running_loop()
+        job.add_done_callback(lambda _: self._release(loop))
+        self._stats["jobs"] += 1
+        try:
+            result, started_at, finished_at = await asyncio.wait_for(asyncio.wrap_future(job), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            raise
+        except Exception:
+            self._stats["failed"] += 1
+            raise
+
+        queue_wait_ms = (started_at - submitted_at) * 1000
+        render_ms = (finished_at - started_at) * 1000
+        self._stats["succeeded"] += 1
+        self._stats["queue_wait_ms_total"] += queue_wait_ms
+        self._stats["render_ms_total"] += render_ms
+        self._stats["render_ms_max"] = max(self._stats["render_ms_max"], render_ms)
+        PDF_RENDER.observe(render_ms / 1000)
+        return result
+
+    def _release(self, loop):
+        # 在进程池的管理线程中调用
+        try:
+            loop.call_soon_threadsafe(self._finish)
+        except RuntimeError:
+            # 事件循环已经关闭
+            self._finish()
+
+    def _finish(self):
+        self._pending -= 1
+
+    def stats(self) -> dict:
+        done = self._stats["succeeded"]
+        return {
+            **self._stats,
+            "workers": self.workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "avg_render_ms": round(self._stats["render_ms_total"] / done, 1) if done else 0.0,
+        }
+
+
+pdf_service = PdfRenderService()
@@ -5,14 +5,21 @@
 PDF 生成工具 - Google ADK Tool 包装器
 """
 
-from .pdf_generator import generate_date_plan_pdf
+from .artifact_store import get_artifact_store
+from .pdf_generator import artifact_result, build_date_plan_pdf, content_hash, pdf_file_name
+from .pdf_service import PdfServiceBusyError, pdf_service
+from agent.metrics import PDF_SIZE
+from agent.tracing import span
 
+import asyncio
 import json
 
+from google.adk.tools import ToolContext
+
 
 # 注意：这里移除了函数参数中的所有默认值 (= "")
 
-def create_date_plan_pdf(
+async def create_date_plan_pdf(
         title: str,
         restaurant_name: str,
         restaurant_time: str,
@@ -20,7 +27,8 @@ def create_date_plan_pdf(
         restaurant_phone: str,
         activity_schedule_json: str,
         gift_list_json: str,
-        additional_notes: str
+        additional_notes: str,
+        tool_context: ToolContext
 ) -> str:
     """
     生成约会计划 PDF 文档
@@ -38,6 +46,7 @@ def create_date_plan_pdf(
         activity_schedule_json: 活动流程 JSON 字符串 (如果没有，请传入 "[]")
         gift_list_json: 礼物清单 JSON 字符串 (如果没有，请传入 "[]")
         additional_notes: 额外备注信息 (如果没有，请传入空字符串)
+        tool_context: 由 ADK 自动注入,用于把 PDF 登记到当前用户名下
 
     Returns:
         str: 生成结果的 JSON 字符串
@@ -75,21 +84,50 @@ def create_date_plan_pdf(
             "phone": r_phone
         }
 
-        # 生成 PDF
-        result = generate_date_plan_pdf(
-            title=title,
-            restaurant_info=restaurant_info,
-            activity_schedule=activity_schedule,
-            gift_list=gift_list,
-            additional_notes=additional_notes if additional_notes else ""
-        )
+        params = {
+            "title": title,
+            "restaurant_info": restaurant_info,
+            "activity_schedule": activity_schedule,
+            "gift_list": gift_list,
+            "additional_notes": additional_notes if additional_notes else ""
+        }
+
+        # 相同内容已经生成过时直接返回,不再排队渲染
+        store = get_artifact_store()
+        digest = content_hash("date_plan", params)
+        # 存储的读写放到线程中执行,不阻塞事件循环
+        info = await store.offload(store.lookup, digest)
+        cached = info is not None
+        if not cached:
+            # 在进程池中渲染为字节串 (不阻塞其他对话的流式输出),再由当前进程存入 artifact_store
+            with span("pdf.render"):
+                data = await pdf_service.render(build_date_plan_pdf, **params)
+            PDF_SIZE.observe(len(data))
+            with span("pdf.store"):
+                info = await store.offload(store.put, digest, data, pdf_file_name(title))
+
+        # 列表接口按用户分页,命中已有内容时也要登记到当前用户名下
+        await store.offload(store.register, tool_context.user_id, info)
+
+        return json.dumps(artifact_result(info, cached=cached), ensure_ascii=False)
+
+    except PdfServiceBusyError as e:
+        return json.dumps({
+            "success": False,
+            "file_name": "",
+            "message": f"PDF 生成繁忙: {str(e)}"
+        }, ensure_ascii=False)
 
-        return json.dumps(result, ensure_ascii=False)
+    except asyncio.TimeoutError:
+        return json.dumps({
+            "success": False,
+            "file_name": "",
+            "message": "PDF 生成超时,请稍后再试"
+        }, ensure_ascii=False)
 
     except Exception as e:
         return json.dumps({
             "success": False,
-            "file_path": "",
             "file_name": "",
             "message": f"工具调用失败: {str(e)}"
         }, ensure_ascii=False)
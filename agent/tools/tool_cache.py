@@ -0,0 +1,188 @@
+"""
+工具结果缓存 - 相同 (工具名, 归一化参数) 的调用直接复用之前的结果
+
+通过 Agent 的 before_tool_callback / after_tool_callback / on_tool_error_callback 接入:
+before 命中缓存时直接返回结果,ADK 会跳过真正的工具调用;
+after 把新结果写入缓存;工具抛出异常时 on_tool_error 丢弃这次调用的记录。进程内是带 TTL 的 LRU,可选的 SQLite
+文件让同一台机器上的多个 worker 共享缓存。
+
+内置的 google_search 在模型侧执行,不会触发这些回调;agent.py 只在 SEARCH_TOOL_MODE=agent
+(搜索包成子 Agent 工具) 时挂载缓存,默认的 builtin 模式下 TOOL_CACHE_ENABLED 不起作用。
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+
+TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "1") == "1"
+# 只缓存结果与调用时机无关的工具,逗号分隔
+TOOL_CACHE_TOOLS = [name.strip() for name in os.getenv("TOOL_CACHE_TOOLS", "google_search").split(",") if name.strip()]
+TOOL_CACHE_TTL = float(os.getenv("TOOL_CACHE_TTL", str(12 * 3600)))
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "2000"))
+TOOL_CACHE_MAX_BYTES = int(os.getenv("TOOL_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# 为空时只使用进程内缓存
+TOOL_CACHE_SQLITE = os.getenv("TOOL_CACHE_SQLITE", "")
+# 最多同时记录多少个未命中、正在执行的调用 (对话被取消时 after / error 回调都不会运行)
+_MAX_STARTED = 1024
+
+
+def _normalize(value):
+    """字符串做 NFKC + 小写 + 合并空白,全角半角、大小写和多余空格的差异不影响命中"""
+    if isinstance(value, str):
+        return " ".join(unicodedata.normalize("NFKC", value).lower().split())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def cache_key(tool_name: str, args: dict) -> str:
+    return f"{tool_name}:{json.dumps(_normalize(args or {}), ensure_ascii=False, sort_keys=True)}"
+
+
+class _SqliteStore:
+    """多个 worker 共享的磁盘缓存 (WAL 模式,读写互不阻塞)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tool_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, latency REAL NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key: str, ttl: float):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, latency, created_at FROM tool_cache WHERE key = ? AND created_at > ?",
+                (key, time.time() - ttl),
+            ).fetchone()
+        return row
+
+    def put(self, key: str, value: str, latency: float, created_at: float, ttl: float):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tool_cache (key, value, latency, created_at) VALUES (?, ?, ?, ?)",
+                (key, value, latency, created_at),
+            )
+            conn.execute("DELETE FROM tool_cache WHERE created_at <= ?", (time.time() - ttl,))
+
+
+class ToolResultCache:
+    """工具结果缓存,实例方法 before_tool / after_tool 直接作为 Agent 回调使用"""
+
+    def __init__(self, tools=TOOL_CACHE_TOOLS, ttl: float = TOOL_CACHE_TTL,
+                 max_entries: int = TOOL_CACHE_MAX_ENTRIES, max_bytes: int = TOOL_CACHE_MAX_BYTES,
+                 sqlite_path: str = TOOL_CACHE_SQLITE):
+        self.tools = set(tools)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._store = _SqliteStore(sqlite_path) if sqlite_path else None
+        self._entries = OrderedDict()   # key -> (序列化后的结果, 原始耗时, 写入时间)
+        self._bytes = 0
+        self._started = {}              # function_call_id -> 开始时间
+        self._stats = {
+            "hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "saved_latency_seconds": 0.0,
+        }
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (value, _, _) = self._entries.popitem(last=False)
+            self._bytes -= len(value)
+            self._stats["evictions"] += 1
+
+    def _remember(self, key: str, value: str, latency: float, created_at: float):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old[0])
+        self._entries[key] = (value, latency, created_at)
+        self._bytes += len(value)
+        self._evict()
+
+    async def _get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is not None:
+            if time.time() - entry[2] <= self.ttl:
+                self._entries.move_to_end(key)
+                return entry
+            self._entries.pop(key)
+            self._bytes -= len(entry[0])
+
+        if self._store is not None:
+            row = await asyncio.to_thread(self._store.get, key, self.ttl)
+            if row is not None:
+                self._stats["shared_hits"] += 1
+                self._remember(key, *row)
+                return row
+        return None
+
+    async def before_tool(self, tool, args, tool_context):
+        """命中时返回缓存结果,ADK 会跳过实际的工具调用"""
+        if tool.name not in self.tools:
+            return None
+        key = cache_key(tool.name, args)
+        entry = await self._get(key)
+        if entry is None:
+            self._stats["misses"] += 1
+            self._started[tool_context.function_call_id] = time.perf_counter()
+            # 按插入顺序丢弃最早的记录,被取消的调用不会一直留在这里
+            while len(self._started) > _MAX_STARTED:
+                del self._started[next(iter(self._started))]
+            return None
+
+        value, latency, _ = entry
+        self._stats["hits"] += 1
+        self._stats["saved_latency_seconds"] += latency
+        return json.loads(value)
+
+    async def after_tool(self, tool, args, tool_context, tool_response):
+        """把未命中时真正执行得到的结果写入缓存,不修改返回值"""
+        started = self._started.pop(tool_context.function_call_id, None)
+        if started is None or tool.name not in self.tools:
+            return None
+        if isinstance(tool_response, dict) and tool_response.get("error"):
+            return None
+
+        try:
+            value = json.dumps(tool_response, ensure_ascii=False)
+        except TypeError:
+            return None
+        key = cache_key(tool.name, args)
+        latency = time.perf_counter() - started
+        created_at = time.time()
+        self._remember(key, value, latency, created_at)
+        if self._store is not None:
+            await asyncio.to_thread(self._store.put, key, value, latency, created_at, self.ttl)
+        self._stats["stores"] += 1
+        return None
+
+    async def on_tool_error(self, tool, args, tool_context, error):
+        """工具抛出异常时 after_tool 不会运行,在这里清掉开始时间;不处理异常本身"""
+        self._started.pop(tool_context.function_call_id, None)
+        return None
+
+    def stats(self) -> dict:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            # 每次命中都省掉了一次外部搜索往返
+            "round_trips_avoided": self._stats["hits"],
+        }
@@ -0,0 +1,225 @@
+"""
+请求链路追踪 - 记录 /api/chat 每个阶段的耗时
+
+一次请求对应一个 RequestTrace,保存在 contextvar 中,调用链上任何位置都可以用
+span("阶段名") 记录一段耗时,不需要层层传参。耗时汇总后:
+    - 非流式响应放进 Server-Timing 响应头
+    - 流式响应在 done 之前发送一个 stats 事件
+
+设置 TRACE_EXPORTER 后同时生成 OpenTelemetry span 并导出:
+    otlp     OTLP/HTTP,地址由标准的 OTEL_EXPORTER_OTLP_ENDPOINT 指定 (本地 collector)
+    file     每个 span 一行 JSON,写入 TRACE_FILE
+    console  打印到标准输出
+ADK 自身的 invoke_agent / call_llm / execute_tool span 会挂在请求 span 下面。
+
+两项都关闭时 span() 只做一次 contextvar 读取,开销可以忽略。
+"""
+
+import contextvars
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+CHAT_TIMING_ENABLED = os.getenv("CHAT_TIMING_ENABLED", "1") == "1"
+# 为空时不导出 OpenTelemetry span
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "my-love-agent")
+
+_current = contextvars.ContextVar("request_trace", default=None)
+_tracer = None
+
+
+def setup_tracing():
+    """按 TRACE_EXPORTER 配置全局 TracerProvider,应用启动时调用一次"""
+    global _tracer
+    if not TRACE_EXPORTER or _tracer is not None:
+        return
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+    if TRACE_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        exporter = OTLPSpanExporter()
+    elif TRACE_EXPORTER == "file":
+        exporter = ConsoleSpanExporter(
+            out=open(TRACE_FILE, "a", encoding="utf-8"),
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+    elif TRACE_EXPORTER == "console":
+        exporter = ConsoleSpanExporter()
+    else:
+        print(f"⚠️ 未知的 TRACE_EXPORTER: {TRACE_EXPORTER},不导出 trace")
+        return
+
+    provider = TracerProvider(resource=Resource.create({"service.name": TRACE_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer(__name__)
+    print(f"🔭 请求追踪已开启,导出到 {TRACE_EXPORTER}")
+
+
+def shutdown_tracing():
+    """导出缓冲中的 span"""
+    if _tracer is not None:
+        from opentelemetry import trace
+
+        trace.get_tracer_provider().shutdown()
+
+
+class RequestTrace:
+    """一次请求的各阶段耗时;同名阶段累加 (例如多次调用同一个工具)"""
+
+    def __init__(self, name: str, **attributes):
+        self.started = time.perf_counter()
+        self.stages = OrderedDict()     # 阶段名 -> [总毫秒, 次数]
+        self.session_ms = 0.0           # 会话读写的耗时,见 EventClock
+        self._span = _tracer.start_span(name, attributes=attributes) if _tracer is not None else None
+
+    def record(self, name: str, ms: float):
+        stage = self.stages.setdefault(name, [0.0, 0])
+        stage[0] += ms
+        stage[1] += 1
+        if name.startswith("session."):
+            self.session_ms += ms
+
+    def set_attribute(self, key: str, value):
+        if self._span is not None:
+            self._span.set_attribute(key, value)
+
+    @contextmanager
+    def activate(self):
+        """在当前上下文中把本请求设为活动请求 (流式响应的生成器里需要重新激活)"""
+        token = _current.set(self)
+        try:
+            if self._span is None:
+                yield self
+            else:
+                from opentelemetry import trace
+
+                with trace.use_span(self._span, end_on_exit=False):
+                    yield self
+        finally:
+            try:
+                _current.reset(token)
+            except ValueError:
+                # 客户端断开时生成器可能在另一个上下文中被关闭
+                _current.set(None)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def finish(self, error: str = None):
+        if self._span is not None:
+            if error:
+                from opentelemetry.trace import Status, StatusCode
+
+                self._span.set_status(Status(StatusCode.ERROR, error))
+            for name, (ms, count) in self.stages.items():
+                self._span.set_attribute(f"stage.{name}.ms", round(ms, 2))
+                self._span.set_attribute(f"stage.{name}.count", count)
+            self._span.end()
+            self._span = None
+
+    def stats(self) -> dict:
+        return {
+            "total_ms": round(self.elapsed_ms(), 1),
+            "stages": {name: {"ms": round(ms, 1), "count": count} for name, (ms, count) in self.stages.items()},
+        }
+
+    def server_timing(self) -> str:
+        """Server-Timing 响应头,浏览器开发者工具的 Timing 面板可以直接显示"""
+        entries = [f"{name};dur={ms:.1f}" for name, (ms, _) in self.stages.items()]
+        entries.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(entries)
+
+
+def start_trace(name: str, **attributes):
+    """开始记录一次请求;计时和导出都关闭时返回 None"""
+    if not CHAT_TIMING_ENABLED and _tracer is None:
+        return None
+    return RequestTrace(name, **attributes)
+
+
+def activate(trace):
+    """trace 为 None (计时关闭) 时不做任何事"""
+    return trace.activate() if trace is not None else nullcontext()
+
+
+@contextmanager
+def _span(trace, name: str, attributes: dict):
+    started = time.perf_counter()
+    otel = _tracer.start_as_current_span(name, attributes=attributes) if _tracer is not None else nullcontext()
+    try:
+        with otel:
+            yield
+    finally:
+        trace.record(name, (time.perf_counter() - started) * 1000)
+
+
+def span(name: str, **attributes):
+    """记录一段耗时;当前没有活动请求时什么都不做"""
+    trace = _current.get()
+    if trace is None:
+        return nullcontext()
+    return _span(trace, name, attributes)
+
+
+class EventClock:
+    """
+    根据 runner.run_async 产生的事件把等待时间归到模型或工具
+
+    相邻两个事件之间的时间 (扣除其间的会话读写和我们自己输出 SSE 的时间):
+        有工具调用还没返回结果 -> tool.<工具名>
+        否则                 -> model;第一段另记为 model.ttft (首 token 时间)
+    """
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.mark = time.perf_counter()
+        self.session_mark = trace.session_ms if trace is not None else 0.0
+        self.first = True
+        self.pending_tools = OrderedDict()     # function_call id -> 工具名
+
+    def on_event(self, event):
+        if self.trace is None:
+            return
+        now = time.perf_counter()
+        session_ms = self.trace.session_ms - self.session_mark
+        gap = max((now - self.mark) * 1000 - session_ms, 0.0)
+        if self.pending_tools:
+            self.trace.record(f"tool.{next(reversed(self.pending_tools.values()))}", gap)
+        else:
+            if self.first:
+                self.trace.record("model.ttft", gap)
+            self.trace.record("model", gap)
+        self.first = False
+
+        for call in event.get_function_calls():
+            self.pending_tools[call.id or call.name] = call.name
+        for response in event.get_function_responses():
+            self.pending_tools.pop(response.id or response.name, None)
+        self.mark, self.session_mark = now, self.trace.session_ms
+
+    @contextmanager
+    def writing(self):
+        """包住 SSE 输出 (yield),输出期间的耗时记为 sse.write"""
+        if self.trace is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.trace.record("sse.write", (now - started) * 1000)
+            self.mark = now
+
+
+def stats_event(trace) -> str:
+    return f"data: {json.dumps({'type': 'stats', **trace.stats()})}\n\n"
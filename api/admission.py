@@ -0,0 +1,269 @@
+"""
+准入控制 - 限制 /api/chat 同时运行的模型调用数
+
+突发流量下每个请求都立即开始 runner.run_async,会撞上模型的速率限制,
+同时挂起几百个 SSE 生成器把 worker 内存撑爆。这里在请求进入 Agent 之前排队:
+
+    全局并发上限    CHAT_MAX_CONCURRENCY 个请求同时运行,其余进入等待队列
+    每客户端上限    同一客户端同时运行 + 排队的请求数有上限,超出直接 429。还没有登录,
+                   前端发来的 user_id 固定为 "user",不能用来区分用户,这里按客户端 IP 计数;
+                   多人共用一个出口 IP 时调大 CHAT_MAX_PER_CLIENT,设为 0 不限制。
+                   客户端 IP 见 client_address(): 只信任可信代理追加的 X-Forwarded-For 条目
+    有界队列        队列满时直接 503;按最近请求的平均耗时估算等待时间,
+                   超过 CHAT_QUEUE_TIMEOUT 的请求不再排队,直接 503 (不让客户端白等)
+    优先级          短的非流式请求排在流式请求前面
+
+所有拒绝都带 Retry-After 响应头。流式请求的名额在 SSE 输出结束时才释放。
+同一会话的请求在进入这里之前已经由 api.single_flight 的会话锁排成一列,这里不再按会话计数;
+等会话锁和在这里排队共用一个 CHAT_QUEUE_TIMEOUT 期限 (acquire 的 timeout 传入剩余时间)。
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import defaultdict
+
+from agent.metrics import ADMISSION_ACTIVE, ADMISSION_QUEUED, ADMISSION_REJECTED, ADMISSION_WAIT
+
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", "32"))
+# 每个客户端 IP 同时运行 + 排队的请求数,0 表示不限制
+CHAT_MAX_PER_CLIENT = int(os.getenv("CHAT_MAX_PER_CLIENT", "4"))
+CHAT_QUEUE_SIZE = int(os.getenv("CHAT_QUEUE_SIZE", "64"))
+# 排队超过这个秒数仍未开始就放弃
+CHAT_QUEUE_TIMEOUT = float(os.getenv("CHAT_QUEUE_TIMEOUT", "10"))
+# 不超过这个长度的非流式请求优先
+CHAT_SHORT_MESSAGE_CHARS = int(os.getenv("CHAT_SHORT_MESSAGE_CHARS", "200"))
+# 前面有几层会往 X-Forwarded-For 末尾追加对端地址的可信代理 (Cloud Run 为 1),0 表示直接使用连接的对端地址
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+# 请求耗时的指数移动平均系数
+_EWMA_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    """请求未被接受;status 为 429 (客户端自身超限) 或 503 (服务端繁忙)"""
+
+    def __init__(self, status: int, reason: str, retry_after: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """一个运行名额;release() 可以重复调用"""
+
+    def __init__(self, controller, client: str):
+        self._controller = controller
+        self.client = client
+        self.admitted_at = time.monotonic()
+        self._released = False
+        self._callbacks = []
+
+    def add_done_callback(self, callback):
+        """名额归还之后调用 callback() (例如释放会话锁)"""
+        self._callbacks.append(callback)
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(self)
+            for callback in self._callbacks:
+                callback()
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "future")
+
+    def __init__(self, priority: int, seq: int, future):
+        self.priority = priority
+        self.seq = seq
+        self.future = future
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+def request_priority(message: str, stream: bool) -> int:
+    return PRIORITY_HIGH if not stream and len(message) <= CHAT_SHORT_MESSAGE_CHARS else PRIORITY_NORMAL
+
+
+def client_address(connection, trusted_hops: int = TRUSTED_PROXY_HOPS) -> str:
+    """
+    准入控制计数用的客户端 IP (Request 或 WebSocket)
+
+    X-Forwarded-For 左边的条目由客户端自己填写,可以随意伪造;每层可信代理把它看到的对端地址
+    追加到末尾,所以只取从右数第 trusted_hops 个条目。没有可信代理时使用连接的对端地址。
+    """
+    if trusted_hops:
+        hops = [hop.strip() for value in connection.headers.getlist("x-forwarded-for") for hop in value.split(",")]
+        hops = [hop for hop in hops if hop]
+        if len(hops) >= trusted_hops:
+            return hops[-trusted_hops]
+    return connection.client.host if connection.client else "unknown"
+
+
+class AdmissionController:
+    """单个 worker 内的准入控制,所有方法都在事件循环线程中调用"""
+
+    def __init__(self, max_concurrency: int = CHAT_MAX_CONCURRENCY, max_per_client: int = CHAT_MAX_PER_CLIENT,
+                 queue_size: int = CHAT_QUEUE_SIZE, queue_timeout: float = CHAT_QUEUE_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.max_per_client = max_per_client
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._queue = []                        # _Waiter 小顶堆
+        self._queued = 0                        # 堆中未取消的等待者
+        self._per_client = defaultdict(int)     # 运行中 + 排队中的请求数
+        self._seq = itertools.count()
+        self._service_seconds = None            # 最近请求耗时的移动平均
+        self._stats = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_client": 0,
+            "shed_queue_full": 0,
+            "shed_deadline": 0,
+            "timeouts": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+        }
+
+    # ----------------------------------------------------------------
+    # 估算
+    # ----------------------------------------------------------------
+
+    def _retry_after(self, position: int = 0) -> int:
+        service = self._service_seconds or 1.0
+        return max(1, math.ceil(service * (position + 1) / self.max_concurrency))
+
+    def _estimated_wait(self, priority: int) -> float:
+        """排在自己前面的请求全部开始所需的大致秒数;还没有耗时数据时返回 0"""
+        if self._service_seconds is None:
+            return 0.0
+        ahead = sum(1 for w in self._queue if not w.future.done() and w.priority <= priority)
+        return self._service_seconds * (ahead + 1) / self.max_concurrency
+
+    def _reject(self, status: int, reason: str, message: str, retry_after: int):
+        self._stats[reason] += 1
+        ADMISSION_REJECTED.labels(reason).inc()
+        raise AdmissionRejected(status, reason, retry_after, message)
+
+    # ----------------------------------------------------------------
+    # 申请与释放
+    # ----------------------------------------------------------------
+
+    async def acquire(self, client: str, priority: int = PRIORITY_NORMAL, timeout: float = None) -> Ticket:
+        """
+        申请一个运行名额,必要时排队等待
+
+        Args:
+            client: 计数用的客户端标识 (客户端 IP)
+            timeout: 最多排队的秒数,默认 queue_timeout;调用方之前已经等过一段时间时传入剩余的时间
+
+        Raises:
+            AdmissionRejected: 超出每客户端上限 (429),或队列已满、预计等待过长、排队超时 (503)
+        """
+        if self.max_per_client and self._per_client[client] >= self.max_per_client:
+            self._reject(429, "rejected_client", "同时进行的对话过多,请稍后再试", self._retry_after())
+
+        ticket = Ticket(self, client)
+        if self._active < self.max_concurrency and not self._queued:
+            self._admit(ticket, 0.0)
+            return ticket
+
+        if self._queued >= self.queue_size:
+            self._reject(503, "shed_queue_full", "服务繁忙,请稍后再试", self._retry_after(self._queued))
+        if timeout is None:
+            timeout = self.queue_timeout
+        estimated = self._estimated_wait(priority)
+        if estimated > timeout:
+            self._reject(503, "shed_deadline", "服务繁忙,请稍后再试", math.ceil(estimated))
+
+        waiter = _Waiter(priority, next(self._seq), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, waiter)
+        self._queued += 1
+        self._per_client[client] += 1
+        self._stats["queued"] += 1
+        ADMISSION_QUEUED.inc()
+        started = time.monotonic()
+        try:
+            await asyncio.wait({waiter.future}, timeout=max(timeout, 0))
+        except asyncio.CancelledError:
+            # 客户端断开: 还在排队就退出队列;名额已经交过来了就立即归还
+            if waiter.future.done():
+                ticket.release()
+            else:
+                self._abandon(waiter, ticket)
+            raise
+        if not waiter.future.done():
+            self._abandon(waiter, ticket)
+            self._stats["timeouts"] += 1
+            ADMISSION_REJECTED.labels("timeouts").inc()
+            raise AdmissionRejected(503, "timeouts", self._retry_after(self._queued), "排队超时,请稍后再试")
+
+        # _release 已经把名额转交给我们,并计入了 active
+        self._record_wait(time.monotonic() - started)
+        ticket.admitted_at = time.monotonic()
+        return ticket
+
+    def _admit(self, ticket: Ticket, wait_seconds: float):
+        self._active += 1
+        self._per_client[ticket.client] += 1
+        ADMISSION_ACTIVE.inc()
+        self._record_wait(wait_seconds)
+
+    def _record_wait(self, wait_seconds: float):
+        wait_ms = wait_seconds * 1000
+        self._stats["admitted"] += 1
+        self._stats["wait_ms_total"] += wait_ms
+        self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], wait_ms)
+        ADMISSION_WAIT.observe(wait_seconds)
+
+    def _abandon(self, waiter: _Waiter, ticket: Ticket):
+        # 堆中的条目不立即删除,出队时跳过已取消的
+        waiter.future.cancel()
+        self._queued -= 1
+        ADMISSION_QUEUED.dec()
+        self._forget(ticket.client)
+
+    def _forget(self, client: str):
+        self._per_client[client] -= 1
+        if not self._per_client[client]:
+            del self._per_client[client]
+
+    def _release(self, ticket: Ticket):
+        elapsed = time.monotonic() - ticket.admitted_at
+        self._service_seconds = elapsed if self._service_seconds is None else (
+            _EWMA_ALPHA * elapsed + (1 - _EWMA_ALPHA) * self._service_seconds
+        )
+        self._forget(ticket.client)
+
+        # 名额直接交给队首的等待者,active 不变
+        while self._queue:
+            waiter = heapq.heappop(self._queue)
+            if waiter.future.done():
+                continue
+            waiter.future.set_result(None)
+            self._queued -= 1
+            ADMISSION_QUEUED.dec()
+            return
+        self._active -= 1
+        ADMISSION_ACTIVE.dec()
+
+    def stats(self) -> dict:
+        admitted = self._stats["admitted"]
+        return {
+            **self._stats,
+            "active": self._active,
+            "queue_depth": self._queued,
+            "max_concurrency": self.max_concurrency,
+            "queue_size": self.queue_size,
+            "avg_service_seconds": round(self._service_seconds, 2) if self._service_seconds else None,
+            "avg_wait_ms": round(self._stats["wait_ms_total"] / admitted, 1) if admitted else 0.0,
+        }
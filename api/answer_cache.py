@@ -0,0 +1,179 @@
+"""
+FAQ 答案缓存 - 对近似重复的问题直接返回之前生成的回答,跳过模型调用
+
+问题先做归一化 (全角转半角、去标点空白、小写) 后精确匹配。缓存在所有用户之间共享,
+默认只有归一化后完全相同的问题才复用回答;把 ANSWER_CACHE_THRESHOLD 设为小于 1 时
+再用字符 bigram 的 Dice 相似度做模糊匹配,超过阈值、长度相差不超过
+ANSWER_CACHE_MAX_LENGTH_DELTA 且否定词一致才认为命中。bigram 相似度分不清
+"我应该和男朋友分手吗" 和 "我不应该和男朋友分手吗",否定词检查用来挡住这种情况。
+"""
+
+import os
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(6 * 3600)))
+# 1 表示只做精确匹配
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "1"))
+# 模糊匹配时两个问题 (归一化后) 最多相差几个字
+ANSWER_CACHE_MAX_LENGTH_DELTA = int(os.getenv("ANSWER_CACHE_MAX_LENGTH_DELTA", "2"))
+# 太短的问题 (如 "你好"、"然后呢") 往往依赖上下文,不缓存
+ANSWER_CACHE_MIN_CHARS = int(os.getenv("ANSWER_CACHE_MIN_CHARS", "4"))
+
+
+def normalize_question(text: str) -> str:
+    """全角转半角、转小写,并去掉标点、符号和空白"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return "".join(
+        ch for ch in text
+        if not unicodedata.category(ch).startswith(("P", "S", "Z", "C"))
+    )
+
+
+# 出现次数不同就说明两个问题的意思可能相反 (归一化后英文已经去掉空格和撇号)
+_NEGATIONS = ("不", "没", "别", "无", "非", "未", "勿", "莫", "否", "not", "never", "dont", "cant", "wont")
+
+
+def _same_polarity(a: str, b: str) -> bool:
+    return all(a.count(word) == b.count(word) for word in _NEGATIONS)
+
+
+def _bigrams(text: str) -> frozenset:
+    if len(text) < 2:
+        return frozenset([text])
+    return frozenset(text[i:i + 2] for i in range(len(text) - 1))
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    latency: float          # 首次生成这条回答花费的秒数
+    version: object         # 生成时的知识库版本,版本变化后不再使用
+    created_at: float = field(default_factory=time.time)
+    hits: int = 0
+
+
+class AnswerCache:
+    """带 TTL 和 LRU 淘汰的进程内答案缓存"""
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, ttl: float = ANSWER_CACHE_TTL,
+                 threshold: float = ANSWER_CACHE_THRESHOLD, min_chars: int = ANSWER_CACHE_MIN_CHARS,
+                 max_length_delta: int = ANSWER_CACHE_MAX_LENGTH_DELTA):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.max_length_delta = max_length_delta
+        self.min_chars = min_chars
+        self._entries = OrderedDict()   # 归一化问题 -> CachedAnswer,按最近使用排序
+        self._grams = {}                # bigram -> 包含它的归一化问题集合
+        self._stats = {
+            "hits": 0,
+            "fuzzy_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "saved_latency_seconds": 0.0,
+        }
+
+    def cacheable(self, question: str) -> bool:
+        return len(normalize_question(question)) >= self.min_chars
+
+    def _remove(self, key: str):
+        self._entries.pop(key, None)
+        for gram in _bigrams(key):
+            keys = self._grams.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._grams[gram]
+
+    def _alive(self, key: str, version) -> bool:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        if time.time() - entry.created_at > self.ttl or entry.version != version:
+            self._remove(key)
+            self._stats["expirations"] += 1
+            return False
+        return True
+
+    def _best_match(self, key: str):
+        grams = _bigrams(key)
+        overlap = {}
+        for gram in grams:
+            for candidate in self._grams.get(gram, ()):
+                overlap[candidate] = overlap.get(candidate, 0) + 1
+
+        best, best_score = None, 0.0
+        for candidate, shared in overlap.items():
+            if abs(len(candidate) - len(key)) > self.max_length_delta or not _same_polarity(key, candidate):
+                continue
+            score = 2 * shared / (len(grams) + len(_bigrams(candidate)))
+            if score > best_score:
+                best, best_score = candidate, score
+        return best, best_score
+
+    def lookup(self, question: str, version=None):
+        """
+        查找可以直接复用的回答
+
+        Returns:
+            Optional[CachedAnswer]: 精确命中,或开启模糊匹配且高置信度命中时返回缓存条目
+        """
+        key = normalize_question(question)
+        if len(key) < self.min_chars:
+            return None
+
+        if not self._alive(key, version):
+            if self.threshold >= 1:
+                self._stats["misses"] += 1
+                return None
+            candidate, score = self._best_match(key)
+            if candidate is None or score < self.threshold or not self._alive(candidate, version):
+                self._stats["misses"] += 1
+                return None
+            self._stats["fuzzy_hits"] += 1
+            key = candidate
+
+        entry = self._entries[key]
+        self._entries.move_to_end(key)
+        entry.hits += 1
+        self._stats["hits"] += 1
+        self._stats["saved_latency_seconds"] += entry.latency
+        return entry
+
+    def store(self, question: str, answer: str, latency: float, version=None):
+        """保存一次完整生成的回答"""
+        key = normalize_question(question)
+        if len(key) < self.min_chars or not answer.strip():
+            return
+
+        self._remove(key)
+        self._entries[key] = CachedAnswer(question=question, answer=answer, latency=latency, version=version)
+        for gram in _bigrams(key):
+            self._grams.setdefault(gram, set()).add(key)
+        self._stats["stores"] += 1
+
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._stats["evictions"] += 1
+
+    def stats(self) -> dict:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "entries": len(self._entries),
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+def split_answer(answer: str, size: int = 40) -> list:
+    """把缓存的回答切成和模型流式输出差不多大小的片段"""
+    return [answer[i:i + size] for i in range(0, len(answer), size)] or [""]
@@ -0,0 +1,101 @@
+"""
+PDF 下载 - 从 artifact_store 流式输出,支持 ETag 条件请求和单段 Range
+
+强 ETag 是文件字节的哈希 (没有记录字节哈希的旧文件只有弱 ETag,不参与 If-Range);
+浏览器/下载器断点续传时只读取请求的字节区间,不会把整个文件读进内存。
+"""
+
+import re
+from urllib.parse import quote
+
+from fastapi.responses import Response, StreamingResponse
+
+# 单段区间: "start-end"、"start-" 或 "-length",多段 (含逗号) 不匹配
+_BYTE_RANGE = re.compile(r"(\d*)-(\d*)", re.ASCII)
+
+
+def parse_range(header: str, size: int):
+    """
+    解析 "bytes=start-end" 形式的 Range 头
+
+    Returns:
+        (start, end) 闭区间;多段或格式不对 (包括 end 小于 start) 时返回 None,按 RFC 9110
+        忽略 Range 返回完整文件;格式正确但区间无法满足时返回 () (416)
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+    match = _BYTE_RANGE.fullmatch(spec.strip())
+    if match is None or match.group() == "-":
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # "bytes=-500" 表示最后 500 个字节
+        length = int(last)
+        if length == 0:
+            return ()
+        start, end = max(size - length, 0), size - 1
+    if start >= size:
+        return ()
+    return start, end
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match 使用弱比较: 忽略两边的 W/ 前缀"""
+    etag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") in (etag, "*") for tag in header.split(","))
+
+
+def artifact_response(store, info, headers) -> Response:
+    """
+    构造下载响应
+
+    Args:
+        store: ArtifactStore
+        info: ArtifactInfo
+        headers: 请求头 (request.headers)
+    """
+    base_headers = {
+        "ETag": info.etag,
+        "Accept-Ranges": "bytes",
+        # 同一个链接对应的生成参数不会变;重新生成后字节变化,ETag 随之变化
+        "Cache-Control": "private, max-age=86400",
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(info.file_name)}",
+    }
+
+    if_none_match = headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, info.etag):
+        return Response(status_code=304, headers=base_headers)
+
+    byte_range = None
+    range_header = headers.get("range")
+    if_range = headers.get("if-range")
+    # If-Range 与当前版本不一致时忽略 Range,返回完整文件;If-Range 要求强比较,弱 ETag 永远不一致
+    if range_header and (not if_range or (if_range.strip() == info.etag and not info.etag.startswith("W/"))):
+        byte_range = parse_range(range_header, info.size)
+        if byte_range == ():
+            return Response(status_code=416, headers={**base_headers, "Content-Range": f"bytes */{info.size}"})
+
+    if byte_range:
+        start, end = byte_range
+        return StreamingResponse(
+            store.read(info, start, end),
+            status_code=206,
+            media_type="application/pdf",
+            headers={
+                **base_headers,
+                "Content-Length": str(end - start + 1),
+                "Content-Range": f"bytes {start}-{end}/{info.size}",
+            },
+        )
+
+    return StreamingResponse(
+        store.read(info),
+        media_type="application/pdf",
+        headers={**base_headers, "Content-Length": str(info.size)},
+    )
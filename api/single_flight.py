@@ -0,0 +1,181 @@
+"""
+重复请求合并 - 同一会话上相同的消息只运行一次,不同的消息依次运行
+
+双击发送、客户端超时重试经常在同一个会话上发出两次相同的消息,两个 runner.run_async
+同时运行,各调用一次 Gemini,各往会话里追加一遍事件。这里:
+
+    合并    按 (user_id, session_id, 消息哈希) 记录进行中的对话,相同的请求不再运行:
+            流式请求作为又一个跟随者从头接收同一轮的输出,非流式请求等待同一个结果
+    串行    同一会话上不同的消息按到达顺序依次运行 (每个会话一把锁),
+            不会同时读写会话状态;排队等待的请求超过 CHAT_SESSION_QUEUE 个时返回 429,
+            前一轮卡住时等待超过期限 (与准入控制共用 CHAT_QUEUE_TIMEOUT) 也返回 429
+
+只合并进行中的请求,前一轮结束后再发同样的消息会正常运行新的一轮。
+没有 session_id 的请求 (新会话的第一条消息) 不合并: 还没有登录,前端发来的 user_id 固定为 "user",
+两个人同时发出相同的第一条消息时,合并会让一个人拿到另一个人的会话。
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import deque
+
+from agent.metrics import CHAT_COALESCED, SESSION_LOCK_WAIT
+from api.admission import AdmissionRejected
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "1") == "1"
+# 每个会话最多有多少个请求在等待前一轮结束
+CHAT_SESSION_QUEUE = int(os.getenv("CHAT_SESSION_QUEUE", "4"))
+
+
+class _Failure:
+    """原请求抛出的异常,转交给合并进来的请求重新抛出"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class Flight:
+    """一个进行中的请求;合并进来的请求等待 result"""
+
+    def __init__(self, key: tuple, stream: bool):
+        self.key = key
+        self.stream = stream
+        self.turn = None            # 流式请求的 StreamTurn,本轮在后台运行直到它结束
+        self.joined = 0
+        self._result = asyncio.get_running_loop().create_future()
+
+    def resolve(self, value):
+        if not self._result.done():
+            self._result.set_result(value)
+
+    def reject(self, error: BaseException):
+        self.resolve(_Failure(error))
+
+    async def result(self):
+        # shield: 合并进来的请求被取消时不影响原请求
+        value = await asyncio.shield(self._result)
+        if isinstance(value, _Failure):
+            raise value.error
+        return value
+
+
+class SessionLease:
+    """持有一个会话的锁;release() 可以重复调用"""
+
+    def __init__(self, locks, session_id):
+        self._locks = locks
+        self.session_id = session_id
+        self._released = session_id is None
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._locks._release(self.session_id)
+
+
+class SingleFlight:
+    """单个 worker 内进行中的请求和会话锁,所有方法都在事件循环线程中调用"""
+
+    def __init__(self, max_waiting: int = CHAT_SESSION_QUEUE):
+        self.max_waiting = max_waiting
+        self._flights = {}          # key -> Flight
+        self._sessions = {}         # session_id -> 等待者 future 的队列 (锁被持有时存在)
+        self._stats = {"coalesced": 0, "lock_waits": 0, "lock_timeouts": 0, "rejected_busy": 0}
+
+    # ----------------------------------------------------------------
+    # 合并
+    # ----------------------------------------------------------------
+
+    @staticmethod
+    def key(user_id: str, session_id, message: str) -> tuple:
+        return user_id, session_id, hashlib.sha256(message.encode("utf-8")).digest()
+
+    def join(self, key: tuple, stream: bool):
+        """有相同的请求正在进行时返回它的 Flight (计入合并次数),否则返回 None"""
+        # 新会话的请求不能确定来自同一个人,不合并
+        if not SINGLE_FLIGHT_ENABLED or key[1] is None:
+            return None
+        flight = self._flights.get(key)
+        # 流式和非流式的结果形式不同,不互相合并
+        if flight is None or flight.stream != stream:
+            return None
+        flight.joined += 1
+        self._stats["coalesced"] += 1
+        CHAT_COALESCED.labels("stream" if stream else "non_stream").inc()
+        return flight
+
+    def begin(self, key: tuple, stream: bool) -> Flight:
+        flight = Flight(key, stream)
+        if SINGLE_FLIGHT_ENABLED and key[1] is not None:
+            self._flights.setdefault(key, flight)
+        return flight
+
+    def end(self, flight: Flight):
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    # ----------------------------------------------------------------
+    # 会话锁
+    # ----------------------------------------------------------------
+
+    async def lock(self, session_id, timeout: float = None) -> SessionLease:
+        """
+        等到这个会话上没有其他对话在运行;session_id 为空 (新会话) 时直接返回
+
+        Args:
+            timeout: 最多等待的秒数,None 表示一直等
+
+        Raises:
+            AdmissionRejected: 这个会话上排队的请求过多,或者等待超时 (429)
+        """
+        if session_id is None:
+            return SessionLease(self, None)
+        waiters = self._sessions.get(session_id)
+        if waiters is None:
+            self._sessions[session_id] = deque()
+            return SessionLease(self, session_id)
+
+        if len(waiters) >= self.max_waiting:
+            self._stats["rejected_busy"] += 1
+            raise AdmissionRejected(429, "session_busy", 1, "这个会话上排队的消息过多,请等上一条回答完再发")
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        self._stats["lock_waits"] += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait({waiter}, timeout=timeout)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 锁已经交过来了,请求却被取消: 交给下一个
+                self._release(session_id)
+            else:
+                waiters.remove(waiter)
+            raise
+        if not waiter.done():
+            # 前一轮迟迟没有结束 (卡在模型或工具调用上),不再等下去
+            waiters.remove(waiter)
+            waiter.cancel()
+            self._stats["lock_timeouts"] += 1
+            raise AdmissionRejected(429, "session_timeout", 1, "这个会话上一条消息还在处理中,请稍后再试")
+        SESSION_LOCK_WAIT.observe(time.monotonic() - started)
+        return SessionLease(self, session_id)
+
+    def _release(self, session_id: str):
+        waiters = self._sessions[session_id]
+        # 锁直接交给下一个等待者
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        del self._sessions[session_id]
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "in_flight": len(self._flights),
+            "locked_sessions": len(self._sessions),
+            "waiting": sum(len(waiters) for waiters in self._sessions.values()),
+        }
@@ -0,0 +1,395 @@
+"""
+SSE 输出 - 合并小片段、断线续传、心跳
+
+模型流式输出的 partial 片段通常只有几个 token,逐片 json.dumps 再各写一帧,
+一次回答就是上千次小写入。移动端中途断线后,用户只能重新提问,再付一次模型和搜索的费用。
+这里把一轮回答和 HTTP 连接拆开:
+
+    TextStream      独立任务运行 runner.run_async,第一段文本立即写出 (不影响首 token 时间),
+                    之后在 SSE_COALESCE_MS 时间窗内合并,攒够 SSE_COALESCE_BYTES 提前写出
+    StreamTurn      一轮回答在后台运行,每帧带递增的 id,存入有界的环形缓冲;
+                    HTTP 响应只是跟随者,空闲时发送心跳注释,防止代理关闭连接
+    StreamRegistry  客户端带 Last-Event-ID 重连时补发缺失的帧,还在运行就继续跟随;
+                    所有客户端断开超过 SSE_RESUME_GRACE 秒才取消这一轮 (不再调用模型和工具)
+
+worker 中为一轮回答保留的数据不超过 SSE_REPLAY_FRAMES 帧,结束 SSE_REPLAY_TTL 秒后释放。
+
+背压: 环形缓冲装满、最慢的跟随者再落后一帧就会丢输出时,StreamTurn.send() 等它写出;
+TextStream 不再取走文本,未写出的文本超过 SSE_BUFFER_BYTES 后模型输出也随之暂停。
+等待有上限: 一个跟随者 SSE_SEND_TIMEOUT 秒没有写出任何一帧,就不再等它 (计入 send_timeouts),
+它之后发现缺帧时收到 error 事件,只能重新提问 (计入 overruns)。卡住的客户端因此最多让这一轮
+暂停 SSE_SEND_TIMEOUT 秒,不会一直占着会话锁和准入名额。断开后等待续传的客户端不参与背压,
+落后超过 SSE_REPLAY_FRAMES 帧同样会收到 error。
+message 帧由预先编码的前后缀和一次 JSON 字符串编码拼成。
+合并只改变分帧,客户端把所有 message 的 content 依次拼接得到的文本不变。
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import time
+import uuid
+from collections import deque
+
+from agent.metrics import SSE_STREAMS
+
+SSE_COALESCE_ENABLED = os.getenv("SSE_COALESCE_ENABLED", "1") == "1"
+SSE_COALESCE_MS = float(os.getenv("SSE_COALESCE_MS", "30"))
+SSE_COALESCE_BYTES = int(os.getenv("SSE_COALESCE_BYTES", "512"))
+# 未写出的文本超过这个字节数时生产者等待
+SSE_BUFFER_BYTES = int(os.getenv("SSE_BUFFER_BYTES", "65536"))
+# 连接空闲多少秒发送一次心跳注释
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+# 回答结束后保留多少秒供断线的客户端补齐
+SSE_REPLAY_TTL = float(os.getenv("SSE_REPLAY_TTL", "60"))
+# 每轮保留的帧数,跟随者落后这么多帧时输出暂停 (见模块说明)
+SSE_REPLAY_FRAMES = int(os.getenv("SSE_REPLAY_FRAMES", "1024"))
+# 输出暂停时最多等一个跟随者多少秒
+SSE_SEND_TIMEOUT = float(os.getenv("SSE_SEND_TIMEOUT", "10"))
+# 所有客户端都断开后继续运行多少秒等待续传,0 表示立即取消
+SSE_RESUME_GRACE = float(os.getenv("SSE_RESUME_GRACE", "30"))
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"}
+
+_MESSAGE_PREFIX = b'data: {"type": "message", "content": '
+_FRAME_SUFFIX = b"}\n\n"
+_HEARTBEAT = b": ping\n\n"
+_encode_string = json.encoder.encode_basestring_ascii
+
+
+def message_frame(text: str) -> bytes:
+    """与 json.dumps({'type': 'message', 'content': text}) 输出相同的 SSE 帧"""
+    return _MESSAGE_PREFIX + _encode_string(text).encode("ascii") + _FRAME_SUFFIX
+
+
+def event_frame(payload: dict) -> bytes:
+    return b"data: " + json.dumps(payload).encode("ascii") + b"\n\n"
+
+
+def _server_misses_disconnect(scope) -> bool:
+    # ASGI spec 2.3 及以下 Starlette 自己监听 http.disconnect 并取消 StreamingResponse 的生成器,2.4 起不再监听
+    spec_version = scope.get("asgi", {}).get("spec_version", "2.0")
+    return tuple(map(int, spec_version.split("."))) >= (2, 4)
+
+
+class _TextBuffer:
+    """生产者和写出之间的有界文本缓冲,只在事件循环线程中使用"""
+
+    def __init__(self, limit_bytes: int, flush_bytes: int):
+        self.limit_bytes = limit_bytes
+        self.flush_bytes = flush_bytes
+        self.parts = []
+        self.size = 0
+        self.closed = False
+        self._readable = asyncio.Event()    # 有文本可取
+        self._ready = asyncio.Event()       # 攒够一帧或已关闭,不必等时间窗结束
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+    async def put(self, text: str) -> bool:
+        """放入一段文本;写出端已经关闭时返回 False"""
+        while self.size >= self.limit_bytes and not self.closed:
+            self._writable.clear()
+            await self._writable.wait()
+        if self.closed:
+            return False
+        self.parts.append(text)
+        self.size += len(text.encode("utf-8"))
+        self._readable.set()
+        if self.size >= self.flush_bytes:
+            self._ready.set()
+        return True
+
+    def close(self):
+        self.closed = True
+        self._readable.set()
+        self._ready.set()
+        self._writable.set()
+
+    async def wait_readable(self):
+        await self._readable.wait()
+
+    async def wait_ready(self, timeout: float):
+        if self._ready.is_set() or timeout <= 0:
+            return
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def take(self) -> str:
+        text = "".join(self.parts)
+        self.parts.clear()
+        self.size = 0
+        if not self.closed:
+            self._readable.clear()
+            self._ready.clear()
+        self._writable.set()
+        return text
+
+
+class TextStream:
+    """
+    在后台任务中运行 produce(emit),把它 emit 的文本合并成 SSE message 帧
+
+    Args:
+        produce: async 函数,参数 emit 是 async 函数,逐段传入要输出的文本;
+                 emit 返回 False 表示写出端已经关闭
+        encode: 把合并后的文本编码成一帧,默认为 SSE message 帧
+
+    用法:
+        stream = TextStream(produce)
+        async for frame in stream.frames():
+            await turn.send(frame)
+        stream.result()   # 生产者抛出的异常在这里重新抛出
+    """
+
+    def __init__(self, produce, encode=message_frame, coalesce_ms: float = SSE_COALESCE_MS,
+                 coalesce_bytes: int = SSE_COALESCE_BYTES, buffer_bytes: int = SSE_BUFFER_BYTES):
+        self._produce = produce
+        self._encode = encode
+        self.window = coalesce_ms / 1000 if SSE_COALESCE_ENABLED else 0.0
+        self._buffer = _TextBuffer(buffer_bytes, coalesce_bytes if SSE_COALESCE_ENABLED else 1)
+        self._task = None
+        self.frames_sent = 0
+
+    async def _run(self):
+        try:
+            await self._produce(self._buffer.put)
+        finally:
+            self._buffer.close()
+
+    def cancel(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._buffer.close()
+
+    async def frames(self):
+        """依次产出合并后的 message 帧;生成器被关闭或取消时取消生产者"""
+        # 任务复制当前上下文,调用方激活的请求 trace 在生产者中照常生效
+        self._task = asyncio.create_task(self._run())
+        buffer = self._buffer
+        try:
+            first = True
+            while True:
+                await buffer.wait_readable()
+                if not first:
+                    # 首段之后在时间窗内合并,攒够一帧或生产者结束时提前写出
+                    await buffer.wait_ready(self.window - (time.monotonic() - window_started))
+                text = buffer.take()
+                if text:
+                    self.frames_sent += 1
+                    yield self._encode(text)
+                    first = False
+                    window_started = time.monotonic()
+                if buffer.closed and not buffer.parts:
+                    break
+            await asyncio.wait({self._task})
+        finally:
+            # 被取消时这里只能做同步操作
+            self.cancel()
+
+    def result(self):
+        """生产者的结果;生产者出错时重新抛出它的异常"""
+        return self._task.result()
+
+
+class StreamTurn:
+    """
+    一轮流式回答: 在后台任务中运行,与发起它的 HTTP 连接无关
+
+    产生的每一帧带上 "id: <turn_id>:<序号>",存入最多 SSE_REPLAY_FRAMES 帧的环形缓冲。
+    HTTP 响应通过 follow() 跟随输出,可以有多个;最后一个跟随者断开后
+    SSE_RESUME_GRACE 秒内没有客户端续上,才取消这一轮 (不再调用模型和工具)。
+    """
+
+    def __init__(self, turn_id: str, user_id: str, registry):
+        self.id = turn_id
+        self.user_id = user_id
+        self.frames = deque(maxlen=SSE_REPLAY_FRAMES)    # (序号, 带 id 的帧)
+        self.last_seq = 0
+        self.finished = False
+        self.followers = 0
+        self._registry = registry
+        self._wakeup = asyncio.Event()
+        self._cursors = {}                  # 参与背压的跟随者 -> 已写出的最大序号
+        self._progress = asyncio.Event()    # 有跟随者写出了帧或断开
+        self._task = None
+        self._grace = None
+
+    async def send(self, frame, timeout: float = SSE_SEND_TIMEOUT):
+        """
+        追加一帧 (str 或 bytes,以 data: 开头、空行结尾) 并通知所有跟随者
+
+        下一帧会挤掉最慢的跟随者还没写出的帧时,等它写出 (背压);
+        一个跟随者 timeout 秒没有进展就不再等它 (见模块说明)
+        """
+        if isinstance(frame, str):
+            frame = frame.encode("utf-8")
+        self.last_seq += 1
+        self.frames.append((self.last_seq, b"id: %s:%d\n%s" % (self.id.encode("ascii"), self.last_seq, frame)))
+        self._notify()
+
+        # 下一帧挤掉的是序号 last_seq + 1 - maxlen 的帧,跟随者至少要写出到这里
+        needed = self.last_seq + 1 - self.frames.maxlen
+        while self._cursors:
+            slowest = min(self._cursors, key=self._cursors.get)
+            seen = self._cursors[slowest]
+            if seen >= needed:
+                return
+            self._registry._stats["send_waits"] += 1
+            self._progress.clear()
+            try:
+                await asyncio.wait_for(self._progress.wait(), timeout)
+            except asyncio.TimeoutError:
+                if self._cursors.get(slowest) == seen:
+                    self._cursors.pop(slowest)
+                    self._registry._stats["send_timeouts"] += 1
+
+    def _notify(self):
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    def _after(self, seq: int):
+        """序号大于 seq 的帧;需要的帧已经被环形缓冲挤掉时返回 None"""
+        if not self.frames:
+            return []
+        first = self.frames[0][0]
+        if seq + 1 < first:
+            return None
+        return list(itertools.islice(self.frames, seq + 1 - first, None))
+
+    def _attach(self):
+        self.followers += 1
+        SSE_STREAMS.inc()
+        if self._grace is not None:
+            self._grace.cancel()
+            self._grace = None
+
+    def _detach(self):
+        self.followers -= 1
+        SSE_STREAMS.dec()
+        if not self.followers and not self.finished:
+            self._grace = asyncio.get_running_loop().call_later(SSE_RESUME_GRACE, self._abandon)
+
+    def _abandon(self):
+        self._grace = None
+        if not self.followers and self._task is not None and not self._task.done():
+            self._registry._stats["abandoned"] += 1
+            self._task.cancel()
+
+    async def follow(self, after: int = 0, request=None):
+        """
+        先补发序号大于 after 的帧,再跟随后续输出直到本轮结束;
+        空闲超过 SSE_HEARTBEAT_SECONDS 时发送注释行,防止代理关闭空闲连接
+
+        Args:
+            request: 当前请求。服务器按 ASGI spec 2.4 以上运行时 Starlette 不再监听断开,
+                     只有下次写入失败才发现,这时在后台监听 http.disconnect
+        """
+        self._attach()
+        cursor = object()
+        self._cursors[cursor] = after
+        disconnected = False
+        watcher = None
+        if request is not None and _server_misses_disconnect(request.scope):
+            async def watch():
+                nonlocal disconnected
+                while (await request.receive())["type"] != "http.disconnect":
+                    pass
+                disconnected = True
+                self._notify()
+
+            watcher = asyncio.create_task(watch())
+        try:
+            while not disconnected:
+                wakeup = self._wakeup
+                # 先记下是否已经结束: 写出 pending 的过程中结束时,之后追加的帧还要再取一次
+                finished = self.finished
+                pending = self._after(after)
+                if pending is None:
+                    # 断线太久或者客户端太慢,需要的帧已经被挤掉
+                    self._registry._stats["overruns"] += 1
+                    yield event_frame({"type": "error", "error": "缺少的输出已过期,请重新提问"})
+                    return
+                for seq, frame in pending:
+                    yield frame
+                    after = seq
+                    # 超时后被移出的跟随者不再参与背压
+                    if cursor in self._cursors:
+                        self._cursors[cursor] = seq
+                        self._progress.set()
+                if finished:
+                    return
+                try:
+                    await asyncio.wait_for(wakeup.wait(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield _HEARTBEAT
+        finally:
+            # 客户端断开时生成器被取消,这里只能做同步操作
+            if watcher is not None:
+                watcher.cancel()
+            self._cursors.pop(cursor, None)
+            self._progress.set()
+            self._detach()
+
+
+class StreamRegistry:
+    """
+    本 worker 上进行中和最近结束的流式回答,按 turn_id 查找
+
+    结束后保留 SSE_REPLAY_TTL 秒供断线的客户端补齐。只在本进程内有效,
+    多个 worker 时续传请求需要落到同一个 worker (按 session 粘滞)。
+    """
+
+    def __init__(self, ttl: float = SSE_REPLAY_TTL):
+        self.ttl = ttl
+        self._turns = {}
+        self._stats = {"started": 0, "resumed": 0, "resume_misses": 0, "abandoned": 0, "failed": 0, "overruns": 0,
+                       "send_waits": 0, "send_timeouts": 0}
+
+    def start(self, user_id: str, run) -> StreamTurn:
+        """在后台任务中运行 run(turn),run 通过 await turn.send() 输出"""
+        turn = StreamTurn(uuid.uuid4().hex, user_id, self)
+        self._turns[turn.id] = turn
+        self._stats["started"] += 1
+        turn._task = asyncio.create_task(self._run(turn, run))
+        return turn
+
+    async def _run(self, turn: StreamTurn, run):
+        try:
+            await run(turn)
+        except Exception as e:
+            self._stats["failed"] += 1
+            print(f"⚠️ 流式回答 {turn.id} 异常结束: {e}")
+        finally:
+            turn.finished = True
+            if turn._grace is not None:
+                turn._grace.cancel()
+                turn._grace = None
+            turn._notify()
+            asyncio.get_running_loop().call_later(self.ttl, self._turns.pop, turn.id, None)
+
+    def resume(self, last_event_id: str, user_id: str, request=None):
+        """
+        按 Last-Event-ID 续上一轮回答
+
+        Returns:
+            补发并跟随输出的异步生成器;这一轮已经过期、不存在或不属于该用户时返回 None
+        """
+        turn_id, _, seq = (last_event_id or "").rpartition(":")
+        turn = self._turns.get(turn_id)
+        if turn is None or turn.user_id != user_id or not seq.isdigit():
+            self._stats["resume_misses"] += 1
+            return None
+        self._stats["resumed"] += 1
+        return turn.follow(int(seq), request)
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "running": sum(1 for turn in self._turns.values() if not turn.finished),
+            "retained": len(self._turns),
+            "followers": sum(turn.followers for turn in self._turns.values()),
+        }
@@ -0,0 +1,308 @@
+"""
+前端静态资源 - 预压缩、长缓存、内存中的 index.html
+
+StaticFiles + FileResponse 每次请求都 stat 文件、原样发送 1.1MB 的 JS 和 358KB 的 CSS,
+浏览器每次打开页面还要用 Last-Modified 重新验证一遍。这里:
+
+    预压缩    启动时 (或构建镜像时 python -m api.static) 为文本资源生成 .gz / .br,
+              按请求的 Accept-Encoding 发送最小的版本,压缩后不变小的不保留
+    长缓存    文件名带内容哈希的资源 (Vite 输出的 assets/index-COCoc-6G.js) 设置
+              Cache-Control: immutable,内容变了文件名就会变,浏览器不再重新验证;
+              index.html 和其他文件用 no-cache + ETag 验证,命中时返回 304
+    内存      index.html 和不超过 STATIC_MEMORY_MAX_BYTES 的文件启动时读入内存,
+              不再每次 stat、打开、在线程池里分块读文件
+    零拷贝    服务器支持 http.response.pathsend 扩展时 (Hypercorn、Granian) 交给
+              FileResponse 由服务器直接 sendfile;uvicorn 不支持,优先从内存发送
+
+brotli 是可选依赖,没有安装时只生成 gzip 版本。
+文件列表在启动时确定,启动后 assets/ 中新增的文件首次被请求时再加载;
+其他路径只查启动时的列表,前端路由 (/chat/... 等回退到 index.html 的 URL) 不访问磁盘。
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import time
+from functools import lru_cache
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, PlainTextResponse, Response
+
+from api.downloads import etag_matches
+
+try:
+    import brotli
+except ImportError:  # 可选依赖
+    brotli = None
+
+STATIC_PRECOMPRESS = os.getenv("STATIC_PRECOMPRESS", "1") == "1"
+# 小于这个大小的文件不压缩
+STATIC_COMPRESS_MIN_BYTES = int(os.getenv("STATIC_COMPRESS_MIN_BYTES", "256"))
+STATIC_GZIP_LEVEL = int(os.getenv("STATIC_GZIP_LEVEL", "9"))
+# 质量 11 压缩 1.1MB 的 JS 约需 3 秒,只在没有 .br 或源文件更新时运行一次
+STATIC_BROTLI_QUALITY = int(os.getenv("STATIC_BROTLI_QUALITY", "11"))
+# 不超过这个大小的文件 (每种编码分别计算) 常驻内存
+STATIC_MEMORY_MAX_BYTES = int(os.getenv("STATIC_MEMORY_MAX_BYTES", "524288"))
+
+COMPRESSIBLE_SUFFIXES = (".html", ".js", ".mjs", ".css", ".json", ".map", ".svg", ".txt", ".xml", ".ico", ".wasm")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# Vite / Rollup 默认的输出文件名: [name]-[hash:8].[ext]
+_HASHED_NAME = re.compile(r"-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$")
+# 启动后新增的文件只在这个目录下查找
+LAZY_PREFIX = "assets/"
+
+
+# (Content-Encoding, 文件后缀),按优先顺序
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _compress(encoding: str, data: bytes) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=STATIC_BROTLI_QUALITY)
+    return gzip.compress(data, STATIC_GZIP_LEVEL, mtime=0)
+
+
+def _is_variant(name: str) -> bool:
+    return name.endswith((".br", ".gz"))
+
+
+def precompress(directory: str) -> dict:
+    """
+    为 directory 下的文本资源生成 .br / .gz,已经存在且不比源文件旧的跳过
+
+    Returns:
+        统计信息: files / written / reused / original_bytes / 各编码的字节数
+    """
+    stats = {"files": 0, "written": 0, "reused": 0, "original_bytes": 0, "br": 0, "gzip": 0}
+    encodings = [(encoding, suffix) for encoding, suffix in ENCODINGS if encoding != "br" or brotli is not None]
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if _is_variant(name) or not name.endswith(COMPRESSIBLE_SUFFIXES):
+                continue
+            path = os.path.join(root, name)
+            source = os.stat(path)
+            if source.st_size < STATIC_COMPRESS_MIN_BYTES:
+                continue
+            stats["files"] += 1
+            stats["original_bytes"] += source.st_size
+            data = None
+            for encoding, suffix in encodings:
+                target = path + suffix
+                try:
+                    existing = os.stat(target)
+                    if existing.st_mtime >= source.st_mtime:
+                        stats["reused"] += 1
+                        stats[encoding] += existing.st_size
+                        continue
+                except FileNotFoundError:
+                    pass
+
+                if data is None:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                compressed = _compress(encoding, data)
+                try:
+                    if len(compressed) >= len(data):
+                        # 压缩后不变小 (已经压缩过的内容),不保留
+                        if os.path.exists(target):
+                            os.remove(target)
+                        continue
+                    tmp = f"{target}.tmp"
+                    with open(tmp, "wb") as f:
+                        f.write(compressed)
+                    os.replace(tmp, target)
+                except OSError as e:
+                    print(f"⚠️ 无法写入预压缩文件 {target}: {e}")
+                    continue
+                stats["written"] += 1
+                stats[encoding] += len(compressed)
+    return stats
+
+
+@lru_cache(maxsize=64)
+def _accepted(accept_encoding: str) -> frozenset:
+    """解析 Accept-Encoding,返回可以使用的编码 (q=0 的除外)"""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.add(name)
+    if "*" in accepted:
+        accepted.update(encoding for encoding, _ in ENCODINGS)
+    return frozenset(accepted)
+
+
+class _Variant:
+    """一个文件的一种编码: 路径、stat、ETag,以及常驻内存时的内容"""
+
+    def __init__(self, path: str, etag: str, encoding=None, in_memory: bool = False):
+        self.path = path
+        self.etag = etag
+        self.encoding = encoding
+        self.stat = os.stat(path)
+        self.body = None
+        if in_memory or self.stat.st_size <= STATIC_MEMORY_MAX_BYTES:
+            with open(path, "rb") as f:
+                self.body = f.read()
+
+
+class StaticFile:
+    """一个静态文件及其预压缩版本"""
+
+    def __init__(self, path: str, url_path: str, in_memory: bool = False):
+        self.url_path = url_path
+        self.media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        hashed = url_path.startswith("assets/") and _HASHED_NAME.search(url_path)
+        self.cache_control = IMMUTABLE if hashed else REVALIDATE
+
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:16]
+        mtime = os.stat(path).st_mtime
+        # 按优先顺序排列,最后是原文件;不同编码是不同的表示,强 ETag 不能相同
+        self.variants = []
+        for encoding, suffix in ENCODINGS:
+            variant_path = path + suffix
+            # 比源文件旧的是上一次构建留下的
+            if os.path.exists(variant_path) and os.stat(variant_path).st_mtime >= mtime:
+                self.variants.append(_Variant(variant_path, f'"{digest}-{encoding}"', encoding, in_memory))
+        self.variants.append(_Variant(path, f'"{digest}"', None, in_memory))
+
+    def choose(self, accept_encoding: str) -> _Variant:
+        if len(self.variants) > 1:
+            accepted = _accepted(accept_encoding)
+            for variant in self.variants:
+                if variant.encoding is None or variant.encoding in accepted:
+                    return variant
+        return self.variants[-1]
+
+    def response(self, scope_headers: Headers, pathsend: bool = False) -> Response:
+        variant = self.choose(scope_headers.get("accept-encoding", ""))
+        headers = {"ETag": variant.etag, "Cache-Control": self.cache_control}
+        if len(self.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+
+        if_none_match = scope_headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, variant.etag):
+            return Response(status_code=304, headers=headers)
+
+        if variant.encoding:
+            headers["Content-Encoding"] = variant.encoding
+        # 服务器能零拷贝发送文件,或者需要处理 Range 时交给 FileResponse
+        if variant.body is None or pathsend or "range" in scope_headers:
+            return FileResponse(variant.path, stat_result=variant.stat, media_type=self.media_type, headers=headers)
+        return Response(variant.body, media_type=self.media_type, headers=headers)
+
+
+class StaticSite:
+    """
+    前端打包输出目录 (dist)
+
+    Args:
+        directory: dist 目录,其中的 index.html 常驻内存
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.realpath(directory)
+        if STATIC_PRECOMPRESS:
+            start = time.perf_counter()
+            stats = precompress(self.directory)
+            if stats["written"]:
+                print(f"🗜️ 预压缩 {stats['written']} 个静态资源文件, 耗时 {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        self._files = {}
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not _is_variant(name) and not name.endswith(".tmp"):
+                    self._load(os.path.relpath(os.path.join(root, name), self.directory).replace(os.sep, "/"))
+        self.index = self._files.get("index.html")
+
+    def _load(self, url_path: str):
+        path = os.path.realpath(os.path.join(self.directory, url_path))
+        # 不允许 ../ 跳出 dist
+        if not path.startswith(self.directory + os.sep) or not os.path.isfile(path) or _is_variant(path):
+            return None
+        static_file = self._files[url_path] = StaticFile(path, url_path, in_memory=url_path == "index.html")
+        return static_file
+
+    def file_response(self, url_path: str, headers: Headers, pathsend: bool = False):
+        """url_path 对应的文件存在时返回响应,否则返回 None"""
+        static_file = self._files.get(url_path)
+        if static_file is None:
+            if not url_path.startswith(LAZY_PREFIX):
+                return None
+            static_file = self._load(url_path)
+            if static_file is None:
+                return None
+        return static_file.response(headers, pathsend)
+
+    def index_response(self, headers: Headers) -> Response:
+        return self.index.response(headers)
+
+    def mount(self, prefix: str):
+        """把 prefix 子目录作为 ASGI 应用挂载 (app.mount("/assets", site.mount("assets"))),不经过 FastAPI 路由"""
+        return _StaticMount(self, prefix)
+
+    def stats(self) -> dict:
+        files = list(self._files.values())
+        return {
+            "files": len(files),
+            "immutable": sum(f.cache_control == IMMUTABLE for f in files),
+            "in_memory_bytes": sum(len(v.body) for f in files for v in f.variants if v.body is not None),
+            "encodings": sorted({v.encoding for f in files for v in f.variants if v.encoding}),
+        }
+
+
+def _route_path(scope) -> str:
+    """挂载点之后的路径: Starlette 的 Mount 保留完整的 path,把挂载前缀加进 root_path"""
+    path = scope["path"]
+    root_path = scope.get("root_path", "")
+    if root_path and (path == root_path or path.startswith(root_path + "/")):
+        return path[len(root_path):]
+    return path
+
+
+class _StaticMount:
+    def __init__(self, site: StaticSite, prefix: str):
+        self.site = site
+        self.prefix = prefix.strip("/") + "/"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            raise RuntimeError("静态资源只支持 HTTP 请求")
+        if scope["method"] not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+        else:
+            url_path = self.prefix + _route_path(scope).lstrip("/")
+            pathsend = "http.response.pathsend" in scope.get("extensions", {})
+            response = self.site.file_response(url_path, Headers(scope=scope), pathsend)
+            if response is None:
+                response = PlainTextResponse("Not Found", status_code=404)
+        await response(scope, receive, send)
+
+
+def main():
+    """构建镜像时预先压缩 dist,启动时直接使用"""
+    directory = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dist")
+    start = time.perf_counter()
+    stats = precompress(directory)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"🗜️ 预压缩完成: {stats['files']} 个文件, 写入 {stats['written']} 个, 复用 {stats['reused']} 个, 耗时 {elapsed_ms:.0f} ms")
+    print(f"   原始 {stats['original_bytes'] / 1024:.0f}KB -> gzip {stats['gzip'] / 1024:.0f}KB"
+          + (f", br {stats['br'] / 1024:.0f}KB" if brotli is not None else " (未安装 brotli)"))
+
+
+if __name__ == "__main__":
+    main()
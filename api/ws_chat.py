@@ -0,0 +1,142 @@
+"""
+WebSocket 对话 - 一个连接上同时进行多个会话的对话
+
+每条消息都走 HTTP POST /api/chat 时,每次都要建立请求、解析请求体、新建 StreamingResponse;
+聊天频繁的前端可以改用 /api/ws 保持一个长连接,在上面发起任意多个会话的对话。
+
+协议 (JSON 文本消息,服务端发出的帧都带上对应 chat 消息的 id):
+    客户端 -> 服务端
+        {"type": "chat", "id": "r1", "message": "...", "session_id": "可选,不填则新建会话"}
+        {"type": "cancel", "id": "r1"}          中途取消这一轮,不再调用模型和工具
+        {"type": "ping"}
+    服务端 -> 客户端
+        {"id":"r1","type":"session_id","session_id":"..."}
+        {"id":"r1","type":"message","content":"..."}      按时间窗合并的回答片段
+        {"id":"r1","type":"stats","total_ms":...,"stages":{...}}
+        {"id":"r1","type":"done"}
+        {"id":"r1","type":"cancelled"}
+        {"id":"r1","type":"error","error":"...","reason":"...","retry_after":1}
+        {"type":"pong"}
+
+同一连接上同时进行的对话不超过 WS_MAX_INFLIGHT 个,准入控制和 HTTP 请求共用。
+连接断开时取消该连接上所有进行中的对话。
+"""
+
+import asyncio
+import json
+import os
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+WS_MAX_INFLIGHT = int(os.getenv("WS_MAX_INFLIGHT", "4"))
+# 单条客户端消息的最大字节数 (UTF-8 编码后)
+WS_MAX_MESSAGE_BYTES = int(os.getenv("WS_MAX_MESSAGE_BYTES", "32768"))
+
+
+def encode(payload: dict) -> str:
+    """紧凑的 JSON 帧: 不转义中文,不加空格"""
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+class ChatConnection:
+    """
+    一个 WebSocket 连接及其上的状态
+
+    Args:
+        run_turn: async 函数 run_turn(connection, request_id, message, session_id),
+                  通过 connection.send() 输出这一轮的帧
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: str, run_turn):
+        self.websocket = websocket
+        self.user_id = user_id
+        self._run_turn = run_turn
+        self.turns = {}             # 请求 id -> 进行中的 asyncio.Task
+        self.sessions = set()       # 本连接上已经完成过对话的会话 (不再是第一轮)
+        self.closed = False
+        self._send_lock = asyncio.Lock()
+
+    async def send_text(self, text: str):
+        if self.closed:
+            return
+        # 多个对话同时输出,逐帧写出
+        async with self._send_lock:
+            try:
+                await self.websocket.send_text(text)
+            except (WebSocketDisconnect, RuntimeError):
+                self.closed = True
+
+    async def send(self, request_id, type: str, **fields):
+        await self.send_text(encode({"id": request_id, "type": type, **fields}))
+
+    async def serve(self):
+        """接收并分发客户端消息,直到连接断开"""
+        try:
+            while True:
+                text = await self.websocket.receive_text()
+                await self._dispatch(text)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self.closed = True
+            for task in list(self.turns.values()):
+                task.cancel()
+
+    async def _dispatch(self, text: str):
+        # 一个中文字符占 3 个字节,字符数没有超出时仍要按字节检查
+        if len(text) > WS_MAX_MESSAGE_BYTES or len(text.encode("utf-8")) > WS_MAX_MESSAGE_BYTES:
+            await self.send(None, "error", error="消息过长", reason="too_large")
+            return
+        try:
+            message = json.loads(text)
+            kind = message["type"]
+        except (ValueError, KeyError, TypeError):
+            await self.send(None, "error", error="无法解析的消息", reason="bad_message")
+            return
+        # id 用作 self.turns 的键并原样发回,只接受字符串和整数
+        request_id = message.get("id")
+        if request_id is not None and (not isinstance(request_id, (str, int)) or isinstance(request_id, bool)):
+            await self.send(None, "error", error="id 必须是字符串或整数", reason="bad_message")
+            return
+
+        if kind == "ping":
+            await self.send_text('{"type":"pong"}')
+        elif kind == "cancel":
+            task = self.turns.get(request_id)
+            if task is not None:
+                task.cancel()
+        elif kind == "chat":
+            await self._start(request_id, message)
+        else:
+            await self.send(request_id, "error", error=f"未知的消息类型: {kind}", reason="bad_message")
+
+    async def _start(self, request_id, message: dict):
+        if request_id is None or request_id in self.turns:
+            await self.send(request_id, "error", error="chat 消息需要一个本连接内唯一的 id", reason="bad_message")
+            return
+        if not isinstance(message.get("message"), str) or not message["message"]:
+            await self.send(request_id, "error", error="message 不能为空", reason="bad_message")
+            return
+        if not isinstance(message.get("session_id"), (str, type(None))):
+            await self.send(request_id, "error", error="session_id 必须是字符串", reason="bad_message")
+            return
+        if len(self.turns) >= WS_MAX_INFLIGHT:
+            await self.send(request_id, "error", error="这个连接上同时进行的对话过多,请稍后再试",
+                            reason="too_many_inflight", retry_after=1)
+            return
+        self.turns[request_id] = asyncio.create_task(
+            self._turn(request_id, message["message"], message.get("session_id"))
+        )
+
+    async def _turn(self, request_id, text: str, session_id):
+        try:
+            await self._run_turn(self, request_id, text, session_id)
+        except asyncio.CancelledError:
+            await self.send(request_id, "cancelled")
+            # 继续抛出,任务保持已取消状态,等待它的调用方 (和 asyncio.timeout 等) 才能看到取消
+            raise
+        except Exception as e:
+            print(f"⚠️ WebSocket 对话 {request_id} 异常结束: {e}")
+            await self.send(request_id, "error", error=str(e))
+        finally:
+            self.turns.pop(request_id, None)
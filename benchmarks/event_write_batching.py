@@ -0,0 +1,96 @@
+"""
+会话事件写入的事务数和 SQL 语句数
+
+模拟 SESSIONS 个并发会话各进行 TURNS 轮对话,每轮追加 用户消息 / 工具调用 /
+工具结果 / 模型回复 4 个事件,轮次结束时调用 flush() (与 main.py 相同)。
+分别统计直接使用 DatabaseSessionService 和套上 WriteBehindSessionService 时
+提交的事务数、执行的 SQL 语句数和总耗时。数据库为临时 SQLite 文件。
+
+运行: python benchmarks/event_write_batching.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.adk.events import Event, EventActions
+from google.adk.sessions import DatabaseSessionService
+from google.genai import types
+from sqlalchemy import event as sa_event
+
+from agent.sessions.write_behind import WriteBehindSessionService
+
+SESSIONS = 20
+TURNS = 10
+
+
+def _text(author: str, text: str) -> Event:
+    role = "user" if author == "user" else "model"
+    return Event(author=author, invocation_id="bench", content=types.Content(role=role, parts=[types.Part(text=text)]))
+
+
+def _turn_events(turn: int) -> list:
+    call = types.FunctionCall(name="create_date_plan_pdf", args={"title": f"约会计划 {turn}"})
+    result = types.FunctionResponse(name="create_date_plan_pdf", response={"success": True})
+    return [
+        _text("user", f"第 {turn} 个问题: 帮我规划一次约会"),
+        Event(author="root_agent", invocation_id="bench", content=types.Content(role="model", parts=[types.Part(function_call=call)])),
+        Event(author="root_agent", invocation_id="bench", content=types.Content(role="user", parts=[types.Part(function_response=result)])),
+        Event(author="root_agent", invocation_id="bench", content=types.Content(role="model", parts=[types.Part(text="计划已经生成。" * 20)]),
+              actions=EventActions(state_delta={"last_turn": turn})),
+    ]
+
+
+async def _conversation(service, session_id: str):
+    session = await service.get_session(app_name="agent", user_id="user", session_id=session_id)
+    for turn in range(1, TURNS + 1):
+        for event in _turn_events(turn):
+            await service.append_event(session, event)
+            # 模拟模型和工具调用之间的间隔
+            await asyncio.sleep(0.005)
+        await service.flush()
+
+
+async def run(write_behind: bool) -> dict:
+    db_path = os.path.join(tempfile.mkdtemp(prefix="event_bench_"), "sessions.db")
+    inner = DatabaseSessionService(db_url=f"sqlite+aiosqlite:///{db_path}")
+    service = WriteBehindSessionService(inner) if write_behind else inner
+
+    sessions = [await service.create_session(app_name="agent", user_id="user") for _ in range(SESSIONS)]
+    counts = {"commits": 0, "statements": 0}
+
+    def count(name):
+        return lambda *args: counts.__setitem__(name, counts[name] + 1)
+
+    sa_event.listen(inner.db_engine.sync_engine, "commit", count("commits"))
+    sa_event.listen(inner.db_engine.sync_engine, "before_cursor_execute", count("statements"))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_conversation(service, s.id) for s in sessions))
+    elapsed = time.perf_counter() - start
+    if write_behind:
+        await service.stop()
+
+    stored = 0
+    for s in sessions:
+        stored += len((await inner.get_session(app_name="agent", user_id="user", session_id=s.id)).events)
+    await inner.close()
+    return {**counts, "elapsed": elapsed, "stored": stored}
+
+
+async def main():
+    total = SESSIONS * TURNS * 4
+    print(f"{SESSIONS} 个会话 x {TURNS} 轮 x 4 个事件 = {total} 个事件\n")
+    for name, write_behind in (("DatabaseSessionService", False), ("WriteBehindSessionService", True)):
+        result = await run(write_behind)
+        print(f"{name}:")
+        print(f"  事务 {result['commits']:>5}  SQL {result['statements']:>5}  耗时 {result['elapsed']:.2f}s  "
+              f"落库事件 {result['stored']}/{total}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
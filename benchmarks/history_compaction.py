@@ -0,0 +1,68 @@
+"""
+长对话每轮发送给模型的 token 数
+
+用桩模型模拟 200 轮对话: 每轮追加一条用户消息,按 Runner 的方式把完整历史
+放进 LlmRequest,经过 compact_history 回调后统计 contents + 系统提示词的 token 数,
+再追加一段固定长度的 "模型回复"。不压缩时 token 数随轮数线性增长,
+压缩后应稳定在 HISTORY_TOKEN_BUDGET + 摘要上限附近。
+
+运行: python benchmarks/history_compaction.py
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.adk.models.llm_request import LlmRequest
+from google.genai import types
+
+from agent.sessions.compaction import (
+    HISTORY_SUMMARY_MAX_TOKENS, HISTORY_TOKEN_BUDGET, compact_history, content_tokens, estimate_tokens,
+)
+
+TURNS = 200
+REPORT_AT = (1, 10, 25, 50, 100, 150, 200)
+
+
+class StubContext:
+    """只提供回调用到的 state"""
+
+    def __init__(self):
+        self.state = {}
+
+
+def stub_model(turn: int) -> types.Content:
+    answer = f"关于第 {turn} 个问题,我的建议是先坦诚沟通彼此的期待,再一起制定具体的计划。" * 6
+    return types.Content(role="model", parts=[types.Part(text=answer)])
+
+
+def prompt_tokens(request: LlmRequest) -> int:
+    system = request.config.system_instruction if request.config else None
+    return content_tokens(request.contents) + (estimate_tokens(system) if isinstance(system, str) else 0)
+
+
+async def simulate(compact: bool) -> dict:
+    history, context, report = [], StubContext(), {}
+    for turn in range(1, TURNS + 1):
+        history.append(types.Content(role="user", parts=[types.Part(text=f"第 {turn} 个问题: 异地恋怎么保持感情?")]))
+        request = LlmRequest(contents=list(history), config=types.GenerateContentConfig())
+        if compact:
+            await compact_history(context, request)
+        if turn in REPORT_AT:
+            report[turn] = prompt_tokens(request)
+        history.append(stub_model(turn))
+    return report
+
+
+async def main():
+    print(f"预算 {HISTORY_TOKEN_BUDGET} tokens, 摘要上限 {HISTORY_SUMMARY_MAX_TOKENS} tokens\n")
+    before, after = await simulate(False), await simulate(True)
+    print(f"{'轮数':>6}{'不压缩 tokens':>16}{'压缩后 tokens':>16}")
+    for turn in REPORT_AT:
+        print(f"{turn:>6}{before[turn]:>16}{after[turn]:>16}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
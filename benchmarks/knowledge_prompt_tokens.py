@@ -0,0 +1,77 @@
+"""
+知识库注入方式的提示词大小对比
+
+对比两种方式每轮需要发送给模型的知识库 token 数:
+  - 旧方式: 把所有文档全文拼进 system_instruction
+  - 新方式: 按用户问题检索 top-k 条目再注入
+
+同时把文档复制 N 份模拟知识库增长,观察两种方式随语料变大的变化。
+token 数按 Gemini 的经验值估算: 每个汉字约 1 token,其余字符约 4 个一个 token。
+
+运行: python benchmarks/knowledge_prompt_tokens.py
+"""
+
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from knowledge import KNOWLEDGE_DIR, MemoryIndex, format_results, list_documents, load_entries
+from knowledge.retrieval import KNOWLEDGE_MIN_SCORE, KNOWLEDGE_TOP_K
+
+QUESTIONS = [
+    "如何克服单身焦虑",
+    "情侣吵架冷战怎么解决",
+    "婆媳矛盾怎么办",
+    "七夕想给女朋友一个惊喜",
+    "结婚以后两个人花钱观念不一样",
+    "你好",
+]
+
+_CJK = re.compile(r"[\u4e00-\u9fff\u3000-\u303f\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def full_injection(copies: int) -> str:
+    # 与旧版 load_knowledge() 相同的拼接方式
+    combined = ""
+    for doc_path in list_documents(KNOWLEDGE_DIR):
+        with open(doc_path, "r", encoding="utf-8") as f:
+            combined += f"\n\n--- 文档: {doc_path} ---\n{f.read()}"
+    return combined * copies
+
+
+def main():
+    base_entries = load_entries()
+    print(f"📚 知识库: {len(base_entries)} 条问答, top_k={KNOWLEDGE_TOP_K}\n")
+
+    print(f"{'语料倍数':<8}{'条目数':>8}{'旧方式 tokens/轮':>18}{'新方式 tokens/轮(平均)':>24}{'检索耗时(ms)':>14}")
+    for copies in (1, 10, 100):
+        index = MemoryIndex(base_entries * copies)
+        before = estimate_tokens(full_injection(copies))
+
+        after_total = 0
+        start = time.perf_counter()
+        for question in QUESTIONS:
+            results = index.search(question, top_k=KNOWLEDGE_TOP_K, min_score=KNOWLEDGE_MIN_SCORE)
+            after_total += estimate_tokens(format_results(results))
+        elapsed_ms = (time.perf_counter() - start) * 1000 / len(QUESTIONS)
+
+        print(f"{copies:<8}{len(index):>8}{before:>18}{after_total // len(QUESTIONS):>24}{elapsed_ms:>14.2f}")
+
+    print("\n--- 单个问题的注入明细 (1 倍语料) ---")
+    index = MemoryIndex(base_entries)
+    for question in QUESTIONS:
+        results = index.search(question, top_k=KNOWLEDGE_TOP_K, min_score=KNOWLEDGE_MIN_SCORE)
+        hits = ", ".join(entry.question for entry, _ in results) or "(无注入)"
+        print(f"👉 {question}: {estimate_tokens(format_results(results))} tokens -> {hits}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+知识库冷启动耗时对比
+
+对比把文档复制 N 份后:
+  - 每次启动重新解析分词并构建内存索引
+  - 打开预先构建好的 mmap 索引 (只读取 header)
+
+运行: python benchmarks/knowledge_startup.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from knowledge import KNOWLEDGE_DIR, MemoryIndex, MmapIndex, build_persistent_index, list_documents, load_entries
+
+
+def main():
+    print(f"{'语料倍数':<8}{'条目数':>8}{'解析+建索引(ms)':>18}{'mmap 打开(ms)':>16}{'首次查询(ms)':>16}")
+    for copies in (1, 10, 100):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            doc_dir = os.path.join(tmp_dir, "document")
+            index_dir = os.path.join(tmp_dir, "index")
+            os.makedirs(doc_dir)
+            for i in range(copies):
+                for path in list_documents(KNOWLEDGE_DIR):
+                    shutil.copy(path, os.path.join(doc_dir, f"{i:03d}_{os.path.basename(path)}"))
+
+            start = time.perf_counter()
+            MemoryIndex(load_entries(doc_dir))
+            parse_ms = (time.perf_counter() - start) * 1000
+
+            stats = build_persistent_index(doc_dir, index_dir)
+            start = time.perf_counter()
+            index = MmapIndex(stats["index_path"])
+            open_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            index.search("情侣吵架冷战怎么解决")
+            query_ms = (time.perf_counter() - start) * 1000
+
+            print(f"{copies:<8}{len(index):>8}{parse_ms:>18.2f}{open_ms:>16.3f}{query_ms:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+离线压测 - 用桩模型和桩搜索驱动 /api/chat,测量服务自身的开销
+
+在子进程中启动 uvicorn (main:app),root_agent 的模型和 google_search 换成
+benchmarks/offline.py 中的替身,会话存储默认使用内存库,整个过程不访问网络。
+每个虚拟用户在自己的会话中连续对话,分别以流式、非流式和 WebSocket 模式运行,报告:
+
+    吞吐量 (请求/秒)、首字节时间 TTFB 和总耗时的 p50/p95/p99、错误数、
+    服务进程每个请求消耗的 CPU 时间和内存
+
+流式和 WebSocket 模式的 TTFB 是收到第一个 message 片段的时间;非流式模式下等于总耗时。
+WebSocket 模式下每个虚拟用户只建立一个连接,所有轮次都在这个连接上进行。
+模型本身的耗时由 --first-token-ms / --tokens-per-second / --search-ms 固定,
+结果中超出这部分的就是服务自身的开销。
+
+作为性能回归门禁:
+    python benchmarks/load_test.py --save baseline.json            # 在改动前记录基线
+    python benchmarks/load_test.py --baseline baseline.json        # 改动后对比,退步超过阈值时退出码为 1
+
+运行: python benchmarks/load_test.py --concurrency 20 --turns 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 对比基线时检查的指标: (模式, 指标, 越大越好)
+GATED_METRICS = (
+    ("stream", "throughput_rps", True),
+    ("stream", "ttfb_ms_p95", False),
+    ("stream", "latency_ms_p95", False),
+    ("non_stream", "throughput_rps", True),
+    ("non_stream", "latency_ms_p95", False),
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="离线压测 /api/chat")
+    parser.add_argument("--concurrency", type=int, default=10, help="并发的虚拟用户数")
+    parser.add_argument("--turns", type=int, default=5, help="每个虚拟用户的对话轮数")
+    parser.add_argument("--modes", default="stream,non_stream,websocket", help="要测试的模式,逗号分隔")
+    parser.add_argument("--first-token-ms", type=float, default=300.0, help="桩模型的首 token 延迟")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="桩模型的输出速率")
+    parser.add_argument("--answer-tokens", type=int, default=200, help="每次回答的长度")
+    parser.add_argument("--tool-call-ratio", type=float, default=0.5, help="先调用 google_search 的问题比例")
+    parser.add_argument("--search-ms", type=float, default=500.0, help="桩搜索工具的延迟")
+    parser.add_argument("--session-backend", default="memory", help="SESSION_BACKEND (memory / sqlite / postgres)")
+    parser.add_argument("--answer-cache", action="store_true", help="开启 FAQ 答案缓存 (默认关闭,每个请求都走模型)")
+    parser.add_argument("--save", help="把结果写入 JSON 文件,作为之后对比的基线")
+    parser.add_argument("--baseline", help="与之前保存的基线对比")
+    parser.add_argument("--max-regression", type=float, default=0.10, help="允许的最大退步比例")
+    # 内部使用: 以服务端模式运行
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+# ----------------------------------------------------------------
+# 服务端 (子进程)
+# ----------------------------------------------------------------
+
+def serve(args):
+    os.environ.setdefault("SESSION_BACKEND", args.session_backend)
+    os.environ.setdefault("ANSWER_CACHE_ENABLED", "1" if args.answer_cache else "0")
+    os.environ.setdefault("KNOWLEDGE_WATCH", "0")
+    os.environ.setdefault("PDF_STORE_BACKEND", "memory")
+    # 所有虚拟用户都从 127.0.0.1 连接,不按客户端 IP 限制
+    os.environ.setdefault("CHAT_MAX_PER_CLIENT", "0")
+
+    import uvicorn
+
+    import main
+    from agent import root_agent
+    from offline import FakeGemini, install_offline_agent
+
+    install_offline_agent(root_agent, FakeGemini(
+        first_token_ms=args.first_token_ms,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens,
+        tool_call_ratio=args.tool_call_ratio,
+    ), search_latency_ms=args.search_ms)
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+# ----------------------------------------------------------------
+# 压测端
+# ----------------------------------------------------------------
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _memory_mb(pid: int) -> dict:
+    """服务进程当前和峰值的常驻内存 (Linux /proc)"""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    values[key] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return {"rss_mb": values.get("VmRSS"), "peak_rss_mb": values.get("VmHWM")}
+
+
+def _cpu_seconds(pid: int) -> float:
+    """服务进程累计的用户态 + 内核态 CPU 时间 (Linux /proc)"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return 0.0
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def _percentiles(samples: list, prefix: str) -> dict:
+    samples = sorted(samples)
+    if not samples:
+        return {}
+
+    def percentile(p: float) -> float:
+        return round(samples[min(len(samples) - 1, int(len(samples) * p))], 1)
+
+    return {f"{prefix}_p50": percentile(0.5), f"{prefix}_p95": percentile(0.95), f"{prefix}_p99": percentile(0.99)}
+
+
+async def _wait_ready(client: httpx.AsyncClient, process, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务进程启动失败,退出码 {process.returncode}")
+        try:
+            if (await client.get("/api/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("等待服务就绪超时")
+
+
+async def _chat_stream(client, payload: dict) -> tuple:
+    started = time.perf_counter()
+    ttfb = session_id = None
+    async with client.stream("POST", "/api/chat", json=payload) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            data = json.loads(line[6:])
+            if data["type"] == "session_id":
+                session_id = data["session_id"]
+            elif data["type"] == "message" and ttfb is None:
+                ttfb = time.perf_counter() - started
+            elif data["type"] == "error":
+                raise RuntimeError(data["error"])
+    total = time.perf_counter() - started
+    return session_id, (ttfb if ttfb is not None else total), total
+
+
+async def _chat(client, payload: dict) -> tuple:
+    started = time.perf_counter()
+    response = await client.post("/api/chat", json=payload)
+    response.raise_for_status()
+    total = time.perf_counter() - started
+    return response.json()["session_id"], total, total
+
+
+async def _chat_websocket(connection, payload: dict) -> tuple:
+    started = time.perf_counter()
+    ttfb = session_id = None
+    await connection.send(json.dumps({"type": "chat", "id": payload["turn"], "message": payload["message"],
+                                      "session_id": payload["session_id"]}))
+    while True:
+        data = json.loads(await connection.recv())
+        if data["type"] == "session_id":
+            session_id = data["session_id"]
+        elif data["type"] == "message" and ttfb is None:
+            ttfb = time.perf_counter() - started
+        elif data["type"] == "error":
+            raise RuntimeError(data["error"])
+        elif data["type"] == "done":
+            break
+    total = time.perf_counter() - started
+    return session_id, (ttfb if ttfb is not None else total), total
+
+
+async def _virtual_user(client, user: int, turns: int, mode: str, results: dict):
+    session_id = None
+    connection = None
+    if mode == "websocket":
+        url = str(client.base_url).replace("http://", "ws://").rstrip("/")
+        connection = await websockets.connect(f"{url}/api/ws?user_id=load-{user}")
+    try:
+        for turn in range(turns):
+            payload = {
+                "message": f"用户{user}的第{turn + 1}个问题: 我和对象因为{user * 31 + turn}件小事吵架了,应该怎么和好?",
+                "user_id": f"load-{user}",
+                "session_id": session_id,
+                "stream": mode == "stream",
+            }
+            try:
+                if connection is not None:
+                    session_id, ttfb, total = await _chat_websocket(connection, {**payload, "turn": turn})
+                else:
+                    session_id, ttfb, total = await (_chat_stream if mode == "stream" else _chat)(client, payload)
+            except Exception as e:
+                results["errors"] += 1
+                results["last_error"] = str(e) or type(e).__name__
+                continue
+            results["ttfb"].append(ttfb * 1000)
+            results["latency"].append(total * 1000)
+    finally:
+        if connection is not None:
+            await connection.close()
+
+
+async def run_mode(client, pid: int, args, mode: str) -> dict:
+    results = {"ttfb": [], "latency": [], "errors": 0, "last_error": None}
+    started = time.perf_counter()
+    cpu = _cpu_seconds(pid)
+    await asyncio.gather(*(_virtual_user(client, user, args.turns, mode, results) for user in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    cpu = _cpu_seconds(pid) - cpu
+    completed = len(results["latency"])
+    return {
+        "requests": completed + results["errors"],
+        "errors": results["errors"],
+        "last_error": results["last_error"],
+        "duration_s": round(elapsed, 2),
+        "throughput_rps": round(completed / elapsed, 2) if elapsed else 0.0,
+        "cpu_ms_per_request": round(cpu * 1000 / completed, 2) if completed else None,
+        **_percentiles(results["ttfb"], "ttfb_ms"),
+        **_percentiles(results["latency"], "latency_ms"),
+        **_memory_mb(pid),
+    }
+
+
+async def drive(args) -> dict:
+    port = _free_port()
+    command = [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port)] + sys.argv[1:]
+    process = subprocess.Popen(command, cwd=ROOT)
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120, limits=limits) as client:
+            await _wait_ready(client, process)
+            report = {"config": {k: v for k, v in vars(args).items() if k not in ("save", "baseline", "serve", "port")},
+                      "startup": _memory_mb(process.pid)}
+            for mode in args.modes.split(","):
+                report[mode] = await run_mode(client, process.pid, args, mode)
+            return report
+    finally:
+        # 与 Ctrl+C 相同,让 uvicorn 执行 lifespan 的关闭流程 (停止 PDF 渲染进程池等)
+        process.send_signal(signal.SIGINT)
+        process.wait(timeout=30)
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> list:
+    """返回退步超过阈值的指标"""
+    regressions = []
+    for mode, metric, higher_is_better in GATED_METRICS:
+        old, new = baseline.get(mode, {}).get(metric), report.get(mode, {}).get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if (change < -max_regression) if higher_is_better else (change > max_regression):
+            regressions.append(f"{mode}.{metric}: {old} -> {new} ({change:+.1%})")
+    return regressions
+
+
+def print_report(report: dict):
+    config = report["config"]
+    print(f"\n{config['concurrency']} 个并发用户 x {config['turns']} 轮, 首 token {config['first_token_ms']}ms, "
+          f"{config['tokens_per_second']} tokens/s, 搜索 {config['search_ms']}ms, 会话存储 {config['session_backend']}")
+    print(f"启动后内存: {report['startup']['rss_mb']}MB")
+    for mode in ("stream", "non_stream", "websocket"):
+        result = report.get(mode)
+        if result is None:
+            continue
+        print(f"\n{mode}:")
+        print(f"  请求 {result['requests']}  错误 {result['errors']}  耗时 {result['duration_s']}s  "
+              f"吞吐 {result['throughput_rps']} req/s")
+        print(f"  TTFB    p50 {result.get('ttfb_ms_p50')}ms  p95 {result.get('ttfb_ms_p95')}ms  p99 {result.get('ttfb_ms_p99')}ms")
+        print(f"  总耗时  p50 {result.get('latency_ms_p50')}ms  p95 {result.get('latency_ms_p95')}ms  p99 {result.get('latency_ms_p99')}ms")
+        print(f"  CPU     {result['cpu_ms_per_request']}ms/请求")
+        print(f"  内存    当前 {result['rss_mb']}MB  峰值 {result['peak_rss_mb']}MB")
+        if result["last_error"]:
+            print(f"  最后一个错误: {result['last_error']}")
+
+
+def main():
+    args = parse_args()
+    if args.serve:
+        serve(args)
+        return
+
+    report = asyncio.run(drive(args))
+    print_report(report)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 结果已保存到 {args.save}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        if regressions:
+            print(f"\n❌ 以下指标退步超过 {args.max_regression:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\n✅ 与基线相比没有超过 {args.max_regression:.0%} 的退步")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+离线替身 - 本地桩模型和桩搜索工具,不需要 Gemini key 和网络
+
+    FakeGemini          按配置的首 token 延迟和输出速率生成固定回答;
+                        收到用户问题时按比例先发起一次 google_search 工具调用
+    make_fake_search    与搜索子 Agent 同名同参数的桩工具,等待固定延迟后返回预设结果
+    install_offline_agent(root_agent, ...)
+                        把 root_agent 的模型和搜索工具换成上面两个替身,
+                        知识库注入、历史压缩、工具缓存等回调照常执行
+
+同一个问题的行为是确定的 (是否调用工具由问题文本的哈希决定),多次运行结果可比较。
+"""
+
+import asyncio
+import zlib
+from typing import AsyncGenerator
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.tools import FunctionTool
+from google.genai import types
+
+from agent.sessions.compaction import content_tokens, estimate_tokens
+
+ANSWER = (
+    "我能理解你现在的心情。吵架之后先给彼此一点冷静的时间,再找一个轻松的时机坦诚沟通,"
+    "说出自己的感受而不是指责对方。可以一起制定一个小约定,比如每周安排一次不看手机的约会。"
+)
+SEARCH_RESULT = {
+    "result": "心理学研究认为,冲突后 24 小时内主动修复关系的情侣满意度更高。"
+              "参考来源: 知乎「情侣吵架后如何和好」; Psychology Today「Repair Attempts」",
+}
+
+
+def _user_text(content) -> str:
+    return "".join(part.text for part in content.parts or [] if part.text)
+
+
+class FakeGemini(BaseLlm):
+    """
+    确定性的本地桩模型
+
+    Args:
+        first_token_ms: 收到请求到第一个输出片段的延迟
+        tokens_per_second: 输出速率,流式模式下按 chunk_tokens 个 token 一片输出
+        answer_tokens: 回答长度 (按一个汉字一个 token 计)
+        tool_call_ratio: 收到用户问题时先调用 google_search 的比例,0 表示从不调用
+    """
+
+    model: str = "fake-gemini"
+    first_token_ms: float = 300.0
+    tokens_per_second: float = 80.0
+    answer_tokens: int = 200
+    chunk_tokens: int = 8
+    tool_call_ratio: float = 0.5
+
+    @staticmethod
+    def _usage(llm_request: LlmRequest, output: str) -> types.GenerateContentResponseUsageMetadata:
+        prompt = content_tokens(llm_request.contents or [])
+        completion = estimate_tokens(output)
+        return types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt, candidates_token_count=completion, total_token_count=prompt + completion
+        )
+
+    def _wants_tool(self, llm_request: LlmRequest) -> bool:
+        last = llm_request.contents[-1] if llm_request.contents else None
+        if last is None or any(part.function_response for part in last.parts or []):
+            return False
+        bucket = zlib.crc32(_user_text(last).encode("utf-8")) % 1000
+        return bucket < self.tool_call_ratio * 1000
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        await asyncio.sleep(self.first_token_ms / 1000)
+        if self._wants_tool(llm_request):
+            query = _user_text(llm_request.contents[-1])[:40]
+            call = types.FunctionCall(name="google_search", args={"request": query})
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(function_call=call)]),
+                              usage_metadata=self._usage(llm_request, query))
+            return
+
+        text = (ANSWER * (self.answer_tokens // len(ANSWER) + 1))[:self.answer_tokens]
+        delay = self.chunk_tokens / self.tokens_per_second
+        if stream:
+            for i in range(0, len(text), self.chunk_tokens):
+                if i:
+                    await asyncio.sleep(delay)
+                chunk = text[i:i + self.chunk_tokens]
+                yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=chunk)]), partial=True)
+        else:
+            await asyncio.sleep(delay * (len(text) // self.chunk_tokens))
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]), turn_complete=True,
+                          usage_metadata=self._usage(llm_request, text))
+
+
+def make_fake_search(latency_ms: float = 500.0) -> FunctionTool:
+    """与搜索子 Agent 同名 (google_search)、同参数 (request) 的桩工具"""
+
+    async def google_search(request: str) -> dict:
+        """搜索给定的查询词,返回整理后的观点和来源"""
+        await asyncio.sleep(latency_ms / 1000)
+        return {**SEARCH_RESULT, "query": request}
+
+    return FunctionTool(google_search)
+
+
+def install_offline_agent(root_agent, model: FakeGemini, search_latency_ms: float = 500.0):
+    """把 root_agent 的模型和搜索工具换成离线替身,其余工具和回调保持不变"""
+    fake_search = make_fake_search(search_latency_ms)
+    root_agent.model = model
+    root_agent.tools = [
+        fake_search if getattr(tool, "name", None) == "google_search" else tool
+        for tool in root_agent.tools
+    ]
@@ -0,0 +1,80 @@
+"""
+PDF 渲染对事件循环的影响
+
+模拟同一个 worker 上正在进行的 SSE 流: 一个每 10ms 醒来一次的任务
+记录实际被调度的延迟。分别在事件循环里直接渲染 PDF 和交给进程池
+渲染时统计这个延迟,延迟越大说明其他对话的流式输出被卡得越久。
+
+运行: python benchmarks/pdf_event_loop_lag.py
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.tools.pdf_generator import build_date_plan_pdf
+from agent.tools.pdf_service import PdfRenderService
+
+JOBS = 8
+TICK = 0.01
+
+PLAN = dict(
+    title="七夕约会计划",
+    restaurant_info={"name": "浪漫西餐厅", "time": "晚上7:00", "address": "市中心广场3楼", "phone": "010-12345678"},
+    activity_schedule=[{"time": f"{h}:00", "activity": "散步", "location": "中央公园"} for h in range(10, 22)],
+    gift_list=[{"name": "玫瑰花", "price": "99元", "status": "已购买"}] * 10,
+    additional_notes="记得带伞",
+)
+
+
+async def measure(render) -> dict:
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lags.append((time.perf_counter() - start - TICK) * 1000)
+
+    task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(render() for _ in range(JOBS)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await task
+
+    lags.sort()
+    return {
+        "elapsed_s": elapsed,
+        "lag_p50_ms": statistics.median(lags),
+        "lag_max_ms": lags[-1],
+    }
+
+
+async def main():
+    async def inline():
+        build_date_plan_pdf(**PLAN)
+
+    service = PdfRenderService(max_pending=JOBS)
+    service.start()
+    await service.render(build_date_plan_pdf, **PLAN)  # 等待进程池预热
+
+    async def pooled():
+        await service.render(build_date_plan_pdf, **PLAN)
+
+    for name, render in (("事件循环内渲染", inline), ("进程池渲染", pooled)):
+        result = await measure(render)
+        print(f"{name}: {JOBS} 个 PDF 耗时 {result['elapsed_s']:.2f}s, "
+              f"事件循环延迟 p50={result['lag_p50_ms']:.1f}ms max={result['lag_max_ms']:.1f}ms")
+
+    print(service.stats())
+    service.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,51 @@
+"""
+PDF 列表接口延迟与已存储 PDF 数量的关系
+
+索引中分别登记 1k / 10k / 100k 个 PDF (分散在 100 个用户名下),
+测量取第一页和翻到第 5 页的耗时。游标分页只走 (user_id, created_at)
+索引的一小段,耗时应该基本不随总量增长。
+
+运行: python benchmarks/pdf_listing.py
+"""
+
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.tools.artifact_index import ArtifactIndex
+from agent.tools.artifact_store import ArtifactInfo
+
+USERS = 100
+REPEAT = 200
+
+
+def fill(index: ArtifactIndex, total: int):
+    now = time.time()
+    for i in range(total):
+        info = ArtifactInfo(f"{i:064x}", f"约会计划_{i}.pdf", 4096, now - i)
+        index.add(f"user{i % USERS}", info, created_at=now - i)
+
+
+def measure(index: ArtifactIndex, pages: int) -> float:
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        cursor = None
+        for _ in range(pages):
+            cursor = index.page("user7", 20, cursor)["next_cursor"]
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    for total in (1_000, 10_000, 100_000):
+        index = ArtifactIndex(":memory:")
+        fill(index, total)
+        print(f"{total:>7} 个 PDF: 第一页 {measure(index, 1):.3f}ms, 前 5 页 {measure(index, 5):.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+PDF 渲染吞吐量 (PDFs/秒)
+
+对比两种方式连续渲染 N 个约会计划 PDF:
+  - 每个 PDF 新建渲染上下文 (等同于改造前: 每次重新注册字体、重建样式表)
+  - 所有 PDF 共用一个渲染上下文
+
+每个 PDF 的标题不同,避免命中内容寻址缓存;输出写到临时目录。
+
+运行: python benchmarks/pdf_render_throughput.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("PDF_OUTPUT_DIR", tempfile.mkdtemp(prefix="pdf_bench_"))
+
+from agent.tools.pdf_generator import PdfRenderContext, generate_date_plan_pdf, get_render_context
+
+ROUNDS = 50
+
+
+def render(i: int, context: PdfRenderContext, tag: str):
+    result = generate_date_plan_pdf(
+        title=f"七夕约会计划_{tag}_{i}",
+        restaurant_info={"name": "浪漫西餐厅", "time": "晚上7:00", "address": "市中心广场3楼", "phone": "010-12345678"},
+        activity_schedule=[{"time": f"{h}:00", "activity": "散步", "location": "中央公园"} for h in range(14, 22)],
+        gift_list=[{"name": "玫瑰花", "price": "99元", "status": "已购买"}] * 4,
+        additional_notes="记得带伞",
+        context=context,
+    )
+    assert result["success"], result["message"]
+
+
+def main():
+    print(f"📂 输出目录: {os.environ['PDF_OUTPUT_DIR']}")
+    ctx = get_render_context()
+    print(f"🔤 字体: {ctx.font_name} ({ctx.font_path or '内置'})\n")
+
+    start = time.perf_counter()
+    for i in range(ROUNDS):
+        render(i, PdfRenderContext(), "before")
+    before = ROUNDS / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(ROUNDS):
+        render(i, ctx, "after")
+    after = ROUNDS / (time.perf_counter() - start)
+
+    print(f"每次新建上下文: {before:.1f} PDFs/秒")
+    print(f"共用渲染上下文: {after:.1f} PDFs/秒 ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+每轮对话的数据库往返次数和会话加载耗时
+
+模拟 Runner 的一轮对话: get_session 加载会话,然后追加用户消息和模型回复两个事件。
+分别统计直接使用 DatabaseSessionService 和套上 CachingSessionService 时,
+每轮执行的 SQL 语句数和 get_session 耗时。数据库为临时 SQLite 文件。
+
+运行: python benchmarks/session_round_trips.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.adk.events import Event
+from google.adk.sessions import DatabaseSessionService
+from google.genai import types
+from sqlalchemy import event as sa_event
+
+from agent.sessions.cache import CachingSessionService
+
+TURNS = 60
+REPORT_AT = (1, 10, 30, 60)
+
+
+def _event(author: str, text: str) -> Event:
+    return Event(author=author, invocation_id="bench", content=types.Content(role="user" if author == "user" else "model", parts=[types.Part(text=text)]))
+
+
+async def run(cached: bool) -> dict:
+    db_path = os.path.join(tempfile.mkdtemp(prefix="session_bench_"), "sessions.db")
+    inner = DatabaseSessionService(db_url=f"sqlite+aiosqlite:///{db_path}")
+    service = CachingSessionService(inner) if cached else inner
+
+    statements = [0]
+    sa_event.listen(inner.db_engine.sync_engine, "before_cursor_execute", lambda *args: statements.__setitem__(0, statements[0] + 1))
+
+    session = await service.create_session(app_name="agent", user_id="user")
+    report = {}
+    for turn in range(1, TURNS + 1):
+        before = statements[0]
+        start = time.perf_counter()
+        session = await service.get_session(app_name="agent", user_id="user", session_id=session.id)
+        get_ms = (time.perf_counter() - start) * 1000
+        get_statements = statements[0] - before
+        await service.append_event(session, _event("user", f"第 {turn} 个问题: 第一次约会去哪里比较好?" * 3))
+        await service.append_event(session, _event("root_agent", "可以选择安静的咖啡馆或者公园散步。" * 20))
+        if turn in REPORT_AT:
+            report[turn] = (statements[0] - before, get_statements, get_ms)
+
+    await inner.close()
+    return report
+
+
+async def main():
+    for name, cached in (("DatabaseSessionService", False), ("CachingSessionService", True)):
+        print(f"{name}:")
+        for turn, (total, get_statements, get_ms) in (await run(cached)).items():
+            print(f"  第 {turn:>2} 轮: 共 {total:>2} 条 SQL (get_session {get_statements} 条), get_session {get_ms:.2f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
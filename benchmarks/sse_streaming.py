@@ -0,0 +1,124 @@
+"""
+SSE 输出的帧数和 CPU 开销
+
+STREAMS 个并发流式回答,每个回答由桩模型以 TOKENS_PER_SECOND 的速率逐 token 产出
+ANSWER_TOKENS 个 partial 片段 (与 Gemini 流式输出的粒度相近)。分别用改动前的写法
+(每个片段 json.dumps 一帧) 和 api.sse.TextStream (按时间窗合并) 输出到一个模拟的
+socket,统计每个回答的帧数、字节数、CPU 时间和每秒写出的帧数。
+
+最后模拟一个读得很慢的客户端: 逐片段输出时每帧只带一个片段,积压随回答长度增长;
+合并后每次写出都带走缓冲中的全部文本,积压不超过一次读取间隔内的输出
+(再多则由 SSE_BUFFER_BYTES 上限让模型流暂停)。
+
+运行: python benchmarks/sse_streaming.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.sse import SSE_COALESCE_BYTES, SSE_COALESCE_MS, TextStream
+
+STREAMS = 50
+ANSWER_TOKENS = 400
+TOKENS_PER_SECOND = 200
+TOKEN = "理解"
+
+
+async def produce(emit):
+    """桩模型: 按固定速率逐个输出 token"""
+    interval = 1 / TOKENS_PER_SECOND
+    for _ in range(ANSWER_TOKENS):
+        await asyncio.sleep(interval)
+        await emit(TOKEN)
+
+
+async def per_token_frames(produce=produce):
+    """改动前: 每个片段立即 json.dumps 成一帧"""
+    queue = asyncio.Queue()
+
+    async def emit(text):
+        await queue.put(text)
+
+    task = asyncio.create_task(produce(emit))
+    while not (task.done() and queue.empty()):
+        try:
+            text = await asyncio.wait_for(queue.get(), 0.1)
+        except asyncio.TimeoutError:
+            continue
+        yield f"data: {json.dumps({'type': 'message', 'content': text})}\n\n"
+
+
+async def coalesced_frames(produce=produce):
+    stream = TextStream(produce)
+    async for frame in stream.frames():
+        yield frame
+    stream.result()
+
+
+async def send(frame, sink: dict):
+    """模拟 Starlette 写出一帧: 编码并交给 socket"""
+    if isinstance(frame, str):
+        frame = frame.encode("utf-8")
+    sink["frames"] += 1
+    sink["bytes"] += len(frame)
+    await asyncio.sleep(0)
+
+
+async def run(frames) -> dict:
+    sink = {"frames": 0, "bytes": 0}
+
+    async def one():
+        async for frame in frames():
+            await send(frame, sink)
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    await asyncio.gather(*(one() for _ in range(STREAMS)))
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    return {**sink, "wall": wall, "cpu": cpu}
+
+
+async def slow_client(frames, read_interval: float) -> int:
+    """客户端每 read_interval 秒读走一帧;返回模型已经产出、还没交给客户端的最大字数"""
+    produced = 0
+
+    async def counting_produce(emit):
+        async def counting_emit(text):
+            nonlocal produced
+            result = await emit(text)
+            produced += len(text)
+            return result
+        await produce(counting_emit)
+
+    delivered = peak = 0
+    async for frame in frames(counting_produce):
+        peak = max(peak, produced - delivered)
+        await asyncio.sleep(read_interval)
+        frame = frame.decode("ascii") if isinstance(frame, bytes) else frame
+        delivered += len(json.loads(frame[len("data: "):])["content"])
+    return peak
+
+
+async def main():
+    print(f"{STREAMS} 个并发流 x {ANSWER_TOKENS} 个 partial 片段, 模型输出 {TOKENS_PER_SECOND} token/s, "
+          f"合并窗口 {SSE_COALESCE_MS:.0f}ms / {SSE_COALESCE_BYTES} 字节\n")
+    for name, frames in (("逐片段输出", per_token_frames), ("TextStream 合并", coalesced_frames)):
+        result = await run(frames)
+        per_stream = result["frames"] / STREAMS
+        print(f"{name}:")
+        print(f"  每个回答 {per_stream:>6.0f} 帧 {result['bytes'] / STREAMS / 1024:>6.1f}KB  "
+              f"CPU {result['cpu'] / STREAMS * 1000:>6.2f}ms/回答  "
+              f"写出 {result['frames'] / result['wall']:>8.0f} 帧/s  总耗时 {result['wall']:.2f}s")
+
+    print("\n慢客户端 (每 100ms 读一帧):")
+    for name, frames in (("逐片段输出", per_token_frames), ("TextStream 合并", coalesced_frames)):
+        peak = await slow_client(frames, 0.1)
+        print(f"  {name}: 最多 {peak} 字已生成但未写出")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
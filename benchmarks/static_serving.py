@@ -0,0 +1,209 @@
+"""
+前端首页 (SPA 外壳) 的传输字节数和吞吐量
+
+分别在子进程中用 uvicorn 启动两个只包含静态资源的应用:
+    改动前    StaticFiles 挂载 /assets,其他路径 FileResponse(index.html)
+    改动后    api.static.StaticSite (预压缩、immutable 缓存、index.html 常驻内存)
+
+并发的虚拟浏览器 (Accept-Encoding: gzip, deflate, br) 反复打开首页,每次访问请求
+index.html、JS、CSS 和 favicon.ico,报告每次访问传输的字节数、每秒完成的访问和请求数、
+服务进程每次访问消耗的 CPU 时间:
+
+    首次访问    浏览器没有缓存
+    再次访问    浏览器有缓存: 改动前的响应没有 Cache-Control,按逐个用 ETag 重新验证计算;
+                改动后带哈希的资源 immutable 不再请求,其余用 ETag 验证 (304)
+    只请求 index.html
+
+运行: python benchmarks/static_serving.py --concurrency 20 --seconds 5
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from load_test import _cpu_seconds, _free_port
+
+DIST_DIR = os.path.join(ROOT, "dist")
+ACCEPT_ENCODING = "gzip, deflate, br"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="静态资源传输字节数和吞吐量")
+    parser.add_argument("--concurrency", type=int, default=20, help="并发的虚拟浏览器数")
+    parser.add_argument("--seconds", type=float, default=5.0, help="每个场景的持续时间")
+    parser.add_argument("--serve", choices=("old", "new"), help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+# ----------------------------------------------------------------
+# 服务端
+# ----------------------------------------------------------------
+
+def old_app():
+    from fastapi import FastAPI
+    from fastapi.responses import FileResponse
+    from fastapi.staticfiles import StaticFiles
+
+    app = FastAPI()
+    app.mount("/assets", StaticFiles(directory=os.path.join(DIST_DIR, "assets")), name="assets")
+
+    @app.get("/{full_path:path}")
+    async def serve_vue_app(full_path: str):
+        if full_path.startswith("api/"):
+            return {"error": "API route not found"}
+        return FileResponse(os.path.join(DIST_DIR, "index.html"))
+
+    return app
+
+
+def new_app():
+    from fastapi import FastAPI, Request
+
+    from api.static import StaticSite
+
+    app = FastAPI()
+    static_site = StaticSite(DIST_DIR)
+    app.mount("/assets", static_site.mount("assets"), name="assets")
+
+    @app.get("/{full_path:path}")
+    async def serve_vue_app(full_path: str, request: Request):
+        if full_path.startswith("api/"):
+            return {"error": "API route not found"}
+        response = static_site.file_response(full_path, request.headers)
+        if response is not None:
+            return response
+        return static_site.index_response(request.headers)
+
+    return app
+
+
+def serve(args):
+    import uvicorn
+
+    app = old_app() if args.serve == "old" else new_app()
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+# ----------------------------------------------------------------
+# 压测端
+# ----------------------------------------------------------------
+
+def _shell_paths() -> list:
+    """index.html 引用的资源,与浏览器打开首页时请求的相同"""
+    assets = sorted(os.listdir(os.path.join(DIST_DIR, "assets")))
+    return ["/"] + [f"/assets/{name}" for name in assets if not name.endswith((".gz", ".br"))] + ["/favicon.ico"]
+
+
+class Browser:
+    """一个虚拟浏览器的 HTTP 缓存: 按 Cache-Control 决定是否请求、带上 If-None-Match"""
+
+    def __init__(self):
+        self.cache = {}             # path -> (etag, immutable)
+
+    async def get(self, client, path: str, use_cache: bool) -> tuple:
+        """返回 (是否发出了请求, 下载的字节数)"""
+        headers = {"Accept-Encoding": ACCEPT_ENCODING}
+        cached = self.cache.get(path) if use_cache else None
+        if cached:
+            etag, immutable = cached
+            if immutable:
+                return False, 0
+            headers["If-None-Match"] = etag
+        response = await client.get(path, headers=headers)
+        if response.status_code not in (200, 304):
+            raise RuntimeError(f"GET {path} 返回 {response.status_code}")
+        if response.status_code == 200:
+            self.cache[path] = (response.headers.get("etag"), "immutable" in response.headers.get("cache-control", ""))
+        return True, response.num_bytes_downloaded
+
+
+async def run_scenario(client, pid: int, args, paths: list, use_cache: bool) -> dict:
+    totals = {"visits": 0, "requests": 0, "bytes": 0}
+    deadline = time.monotonic() + args.seconds
+
+    async def browser_loop():
+        browser = Browser()
+        if use_cache:
+            for path in paths:
+                await browser.get(client, path, use_cache=False)
+        while time.monotonic() < deadline:
+            for path in paths:
+                sent, size = await browser.get(client, path, use_cache)
+                totals["requests"] += sent
+                totals["bytes"] += size
+            totals["visits"] += 1
+
+    cpu = _cpu_seconds(pid)
+    started = time.perf_counter()
+    await asyncio.gather(*(browser_loop() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    cpu = _cpu_seconds(pid) - cpu
+    visits = max(totals["visits"], 1)
+    return {
+        "kb_per_visit": round(totals["bytes"] / visits / 1024, 1),
+        "requests_per_visit": round(totals["requests"] / visits, 1),
+        "visits_per_second": round(totals["visits"] / elapsed, 1),
+        "requests_per_second": round(totals["requests"] / elapsed, 1),
+        "cpu_ms_per_visit": round(cpu * 1000 / visits, 2),
+    }
+
+
+async def drive(args, which: str) -> dict:
+    port = _free_port()
+    command = [sys.executable, os.path.abspath(__file__), "--serve", which, "--port", str(port)]
+    process = subprocess.Popen(command, cwd=ROOT)
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60, limits=limits) as client:
+            deadline = time.monotonic() + 60
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"服务进程启动失败,退出码 {process.returncode}")
+                try:
+                    await client.get("/")
+                    break
+                except httpx.TransportError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError("等待服务就绪超时")
+                    await asyncio.sleep(0.2)
+
+            paths = _shell_paths()
+            return {
+                "首次访问": await run_scenario(client, process.pid, args, paths, use_cache=False),
+                "再次访问": await run_scenario(client, process.pid, args, paths, use_cache=True),
+                "只请求 index.html": await run_scenario(client, process.pid, args, ["/"], use_cache=False),
+            }
+    finally:
+        process.send_signal(signal.SIGINT)
+        process.wait(timeout=30)
+
+
+def main():
+    args = parse_args()
+    if args.serve:
+        serve(args)
+        return
+
+    print(f"{args.concurrency} 个并发浏览器, 每个场景 {args.seconds:.0f}s, 资源: {', '.join(_shell_paths())}\n")
+    for which, name in (("old", "改动前 StaticFiles + FileResponse"), ("new", "改动后 StaticSite")):
+        report = asyncio.run(drive(args, which))
+        print(f"{name}:")
+        for scenario, result in report.items():
+            print(f"  {scenario:<12} {result['kb_per_visit']:>8.1f}KB/次 {result['requests_per_visit']:>4.1f} 个请求/次  "
+                  f"{result['visits_per_second']:>7.1f} 次/s {result['requests_per_second']:>7.1f} 请求/s  "
+                  f"CPU {result['cpu_ms_per_visit']:>6.2f}ms/次")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+本地知识库检索 - 只把与用户问题相关的问答条目注入提示词
+"""
+
+import os
+
+from .parser import KnowledgeEntry, parse_file, parse_markdown, list_documents
+from .index import BaseIndex, MemoryIndex, tokenize
+from .store import IndexFormatError, MmapIndex, build_persistent_index
+
+# 项目根目录下的 document 文件夹
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KNOWLEDGE_DIR = os.getenv("KNOWLEDGE_DIR", os.path.join(BASE_DIR, "document"))
+# 持久化索引目录; 镜像构建时预先生成后可以关闭启动校验,启动只需 mmap 一个文件
+KNOWLEDGE_INDEX_DIR = os.getenv("KNOWLEDGE_INDEX_DIR", os.path.join(BASE_DIR, ".knowledge_index"))
+KNOWLEDGE_INDEX_VERIFY = os.getenv("KNOWLEDGE_INDEX_VERIFY", "1") == "1"
+
+
+def load_entries(doc_dir: str = KNOWLEDGE_DIR) -> list:
+    """解析知识库目录下的全部文档"""
+    entries = []
+    for path in list_documents(doc_dir):
+        entries.extend(parse_file(path))
+    return entries
+
+
+def build_index(doc_dir: str = KNOWLEDGE_DIR) -> MemoryIndex:
+    """解析文档并构建内存 BM25 索引"""
+    return MemoryIndex(load_entries(doc_dir))
+
+
+def load_index(doc_dir: str = KNOWLEDGE_DIR, index_dir: str = KNOWLEDGE_INDEX_DIR,
+               verify: bool = KNOWLEDGE_INDEX_VERIFY) -> MmapIndex:
+    """
+    打开持久化索引
+
+    verify=True 时先做一次增量构建 (文档未变化时只有 stat 开销);
+    verify=False 时直接映射已有索引文件,不存在或损坏才构建。
+    """
+    index_path = os.path.join(index_dir, "knowledge.idx")
+    if verify:
+        build_persistent_index(doc_dir, index_dir)
+    try:
+        return MmapIndex(index_path)
+    except FileNotFoundError:
+        pass
+    except IndexFormatError as e:
+        # 空文件或损坏的索引: 清单仍与文档一致时增量构建不会重写它,先删除
+        print(f"⚠️ {e}, 重新构建")
+        try:
+            os.remove(index_path)
+        except FileNotFoundError:
+            pass
+    build_persistent_index(doc_dir, index_dir)
+    return MmapIndex(index_path)
+
+
+def format_results(results: list) -> str:
+    """把检索结果拼成注入提示词的文本"""
+    return "\n\n".join(entry.render() for entry, _ in results)
+
+
+__all__ = [
+    "KnowledgeEntry",
+    "BaseIndex",
+    "MemoryIndex",
+    "MmapIndex",
+    "IndexFormatError",
+    "KNOWLEDGE_DIR",
+    "KNOWLEDGE_INDEX_DIR",
+    "build_index",
+    "build_persistent_index",
+    "format_results",
+    "list_documents",
+    "load_entries",
+    "load_index",
+    "parse_file",
+    "parse_markdown",
+    "tokenize",
+]
@@ -0,0 +1,22 @@
+"""
+知识库索引构建脚本 - 部署前预先生成 mmap 索引
+
+运行: python -m knowledge.build
+"""
+
+import time
+
+from . import KNOWLEDGE_DIR, KNOWLEDGE_INDEX_DIR, build_persistent_index
+
+
+def main():
+    start = time.perf_counter()
+    stats = build_persistent_index(KNOWLEDGE_DIR, KNOWLEDGE_INDEX_DIR)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"📚 索引构建完成: {stats['index_path']}")
+    print(f"   重新解析 {stats['reparsed']} 个文档, 复用 {stats['reused']} 个, "
+          f"{'已重写' if stats['rewritten'] else '无需重写'}索引文件, 耗时 {elapsed_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+知识库检索索引 - 中文字符 n-gram 分词 + BM25 打分
+"""
+
+import math
+import re
+from collections import Counter
+
+# 连续的中日韩汉字 / 连续的英文数字
+_CJK_RUN = re.compile(r"[\u4e00-\u9fff]+")
+_WORD = re.compile(r"[a-z0-9]+")
+
+# 问题标题比正文更能代表条目主题,建索引时重复计入
+QUESTION_WEIGHT = 2
+
+
+def tokenize(text: str) -> list:
+    """
+    分词: 汉字按单字 + 相邻双字 (bigram) 切分,英文数字按单词切分
+
+    例如 "吵架冷战" -> ["吵", "架", "冷", "战", "吵架", "架冷", "冷战"]
+    """
+    text = text.lower()
+    tokens = []
+    for run in _CJK_RUN.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(_WORD.findall(text))
+    return tokens
+
+
+def entry_terms(entry) -> Counter:
+    """统计一个条目的词频 (问题标题加权)"""
+    counts = Counter(tokenize(entry.answer))
+    for token in tokenize(entry.question):
+        counts[token] += QUESTION_WEIGHT
+    return counts
+
+
+class BaseIndex:
+    """
+    BM25 检索的公共实现
+
+    子类只需要提供倒排表、条目长度和条目内容的访问方式,
+    内存索引与磁盘索引因此共用同一套打分逻辑。
+    """
+
+    k1 = 1.5
+    b = 0.75
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    @property
+    def avg_doc_length(self) -> float:
+        raise NotImplementedError
+
+    def postings(self, term: str):
+        """返回 [(条目编号, 词频), ...],词不存在时返回空列表"""
+        raise NotImplementedError
+
+    def doc_length(self, doc_id: int) -> int:
+        raise NotImplementedError
+
+    def entry(self, doc_id: int):
+        raise NotImplementedError
+
+    def search(self, query: str, top_k: int = 3, min_score: float = 0.0) -> list:
+        """
+        检索与 query 最相关的条目
+
+        Returns:
+            list[tuple[KnowledgeEntry, float]]: 按分数从高到低排列
+        """
+        total = len(self)
+        if total == 0:
+            return []
+
+        avgdl = self.avg_doc_length or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings(term)
+            df = len(postings)
+            if df == 0:
+                continue
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_length(doc_id) / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [
+            (self.entry(doc_id), score)
+            for doc_id, score in ranked[:top_k]
+            if score > min_score
+        ]
+
+
+class MemoryIndex(BaseIndex):
+    """启动时在内存里构建的 BM25 索引"""
+
+    def __init__(self, entries: list):
+        self._entries = list(entries)
+        self._lengths = []
+        self._postings = {}
+        for doc_id, entry in enumerate(self._entries):
+            counts = entry_terms(entry)
+            self._lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self._postings.setdefault(term, []).append((doc_id, tf))
+        self._avgdl = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def avg_doc_length(self) -> float:
+        return self._avgdl
+
+    def postings(self, term: str):
+        return self._postings.get(term, [])
+
+    def doc_length(self, doc_id: int) -> int:
+        return self._lengths[doc_id]
+
+    def entry(self, doc_id: int):
+        return self._entries[doc_id]
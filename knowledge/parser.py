@@ -0,0 +1,81 @@
+"""
+知识库文档解析 - 把 Markdown 问答文档按 "####" 问题标题拆分成独立条目
+"""
+
+import os
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class KnowledgeEntry:
+    """知识库中的一条问答记录"""
+    doc: str        # 来源文档文件名
+    category: str   # 文档分类 (例如 "单身篇")
+    question: str   # "####" 标题里的问题
+    answer: str     # 标题下方的正文 (含推荐课程)
+
+    def render(self) -> str:
+        """渲染成注入提示词时使用的 Markdown 片段"""
+        return f"#### [{self.category}] {self.question}\n{self.answer}"
+
+
+def _category_from(title: str, doc_name: str) -> str:
+    # 文档标题形如 "恋爱常见问题和回答 - 单身篇",取 " - " 之后的部分
+    source = title or os.path.splitext(doc_name)[0]
+    return source.rsplit(" - ", 1)[-1].strip()
+
+
+def parse_markdown(text: str, doc_name: str) -> list:
+    """
+    解析单个 Markdown 文档
+
+    Args:
+        text: 文档全文
+        doc_name: 文档文件名,写入每个条目的 doc 字段
+
+    Returns:
+        list[KnowledgeEntry]: 按文档顺序排列的问答条目
+    """
+    title = ""
+    entries = []
+    question = None
+    body = []
+
+    def flush():
+        if question:
+            entries.append(KnowledgeEntry(
+                doc=doc_name,
+                category=_category_from(title, doc_name),
+                question=question,
+                answer="\n".join(body).strip(),
+            ))
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("#### "):
+            flush()
+            question = stripped[5:].strip()
+            body = []
+        elif stripped.startswith("# ") and not title:
+            title = stripped[2:].strip()
+        elif question is not None:
+            body.append(line.rstrip())
+    flush()
+    return entries
+
+
+def parse_file(path: str) -> list:
+    """读取并解析一个 Markdown 文档"""
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_markdown(f.read(), os.path.basename(path))
+
+
+def list_documents(doc_dir: str) -> list:
+    """列出知识库目录下所有 Markdown 文档 (按文件名排序,保证条目顺序稳定)"""
+    if not os.path.isdir(doc_dir):
+        return []
+    return sorted(
+        os.path.join(doc_dir, name)
+        for name in os.listdir(doc_dir)
+        if name.endswith(".md")
+    )
@@ -0,0 +1,117 @@
+"""
+知识库检索接入 Agent - 每次调用模型前按用户问题检索 top-k 条目并追加到系统提示词
+"""
+
+import contextvars
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from . import KNOWLEDGE_DIR, KNOWLEDGE_INDEX_DIR, MmapIndex, build_persistent_index, format_results, load_index
+
+# 每轮注入的条目数量,以及低于该分数的条目视为不相关
+KNOWLEDGE_TOP_K = int(os.getenv("KNOWLEDGE_TOP_K", "3"))
+KNOWLEDGE_MIN_SCORE = float(os.getenv("KNOWLEDGE_MIN_SCORE", "2.0"))
+
+
+@dataclass(frozen=True)
+class KnowledgeSnapshot:
+    """某一版本的知识库视图,热更新时整体替换,旧版本由仍在使用它的请求持有"""
+    version: int
+    index: object
+    loaded_at: float
+    reload_ms: float
+
+    def describe(self) -> dict:
+        return {
+            "version": self.version,
+            "entries": len(self.index),
+            "loaded_at": self.loaded_at,
+            "last_reload_ms": round(self.reload_ms, 2),
+        }
+
+
+_snapshot = None
+_reload_lock = threading.Lock()
+# 每个请求开始时固定一个快照,流式输出过程中发生热更新也不会换掉它
+_pinned = contextvars.ContextVar("knowledge_snapshot", default=None)
+
+
+def current_snapshot() -> KnowledgeSnapshot:
+    """返回最新的知识库快照,首次调用时打开 (必要时增量构建) 持久化索引"""
+    global _snapshot
+    if _snapshot is None:
+        with _reload_lock:
+            if _snapshot is None:
+                start = time.perf_counter()
+                index = load_index()
+                _snapshot = KnowledgeSnapshot(1, index, time.time(), (time.perf_counter() - start) * 1000)
+                print(f"📚 知识库索引已加载: {len(index)} 条问答")
+    return _snapshot
+
+
+def pin_snapshot() -> KnowledgeSnapshot:
+    """把当前快照固定到本请求的上下文中"""
+    snapshot = current_snapshot()
+    _pinned.set(snapshot)
+    return snapshot
+
+
+def get_index():
+    """优先使用请求固定的快照,否则使用最新快照"""
+    snapshot = _pinned.get() or current_snapshot()
+    return snapshot.index
+
+
+def reload_snapshot() -> KnowledgeSnapshot:
+    """
+    增量重建索引并原子替换当前快照 (在后台线程中调用)
+
+    其它 worker 可能已经重建过索引文件,这里只要发现文件换了就重新映射。
+    """
+    global _snapshot
+    with _reload_lock:
+        start = time.perf_counter()
+        stats = build_persistent_index(KNOWLEDGE_DIR, KNOWLEDGE_INDEX_DIR)
+        old = _snapshot
+        if old is not None and os.stat(stats["index_path"]).st_ino == old.index.inode:
+            return old
+        index = MmapIndex(stats["index_path"])
+        version = old.version + 1 if old else 1
+        _snapshot = KnowledgeSnapshot(version, index, time.time(), (time.perf_counter() - start) * 1000)
+        print(f"🔄 知识库已热更新到版本 {version}: {len(index)} 条问答, "
+              f"重新解析 {stats['reparsed']} 个文档, 耗时 {_snapshot.reload_ms:.1f} ms")
+        return _snapshot
+
+
+def retrieve(query: str, top_k: int = KNOWLEDGE_TOP_K) -> str:
+    """检索与 query 相关的知识库片段,没有命中时返回空字符串"""
+    if not query or not query.strip():
+        return ""
+    results = get_index().search(query, top_k=top_k, min_score=KNOWLEDGE_MIN_SCORE)
+    return format_results(results)
+
+
+def _latest_user_text(llm_request) -> str:
+    # 工具返回结果也是 role="user",但没有 text,会被自然跳过
+    for content in reversed(llm_request.contents or []):
+        if content.role != "user" or not content.parts:
+            continue
+        text = "".join(part.text for part in content.parts if part.text)
+        if text:
+            return text
+    return ""
+
+
+def inject_knowledge(callback_context, llm_request):
+    """
+    before_model_callback: 把与最新用户消息相关的条目追加到系统提示词
+
+    Returns:
+        None: 不拦截模型调用,只修改请求
+    """
+    context = retrieve(_latest_user_text(llm_request))
+    if context:
+        llm_request.append_instructions([f"【核心知识库内容】\n{context}"])
+    return None
@@ -0,0 +1,295 @@
+"""
+知识库持久化索引 - 紧凑的倒排表 + 条目偏移表,启动时直接 mmap 映射
+
+文件布局 (knowledge.idx,本机字节序,每段按 8 字节对齐):
+    header          魔数/版本/条目数/词数/平均长度/各段偏移
+    term_offsets    uint32[n_terms + 1]  词在 term_blob 中的起止位置 (按 UTF-8 字节序排序)
+    term_blob       所有词的 UTF-8 字节
+    post_offsets    uint32[n_terms + 1]  词的倒排表在 postings 中的起止位置 (以 (条目, 词频) 对计)
+    postings        uint32[2 * n_postings]  交错存放 (条目编号, 词频)
+    doc_lengths     uint32[n_docs]
+    entry_offsets   uint32[n_docs + 1]  条目 JSON 在 entry_blob 中的起止位置
+    entry_blob      每个条目的 JSON (UTF-8)
+
+打开索引只需读取 header,查询时按需访问映射页,多个 uvicorn worker
+映射同一个文件时共享操作系统的页缓存。
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import Counter
+
+from .index import BaseIndex, entry_terms
+from .parser import KnowledgeEntry, parse_file, list_documents
+
+try:
+    import fcntl
+except ImportError:  # Windows 本地开发时没有 fcntl,退化为不加锁
+    fcntl = None
+
+MAGIC = b"LKIX"
+FORMAT_VERSION = 1
+INDEX_FILE = "knowledge.idx"
+MANIFEST_FILE = "manifest.json"
+SEGMENT_DIR = "segments"
+
+# magic, version, byteorder, n_docs, n_terms, avgdl, 7 个段偏移
+_HEADER = struct.Struct("<4sIBxxxIIdQQQQQQQ")
+_BYTEORDER = 1 if sys.byteorder == "little" else 2
+
+
+class IndexFormatError(Exception):
+    """索引文件损坏或版本不兼容"""
+
+
+def _align(buf: bytearray):
+    buf.extend(b"\0" * (-len(buf) % 8))
+
+
+def write_index(path: str, entries: list, term_counts: list):
+    """
+    把条目和词频写成 mmap 索引文件 (先写临时文件再原子替换)
+
+    Args:
+        path: 索引文件路径
+        entries: list[KnowledgeEntry]
+        term_counts: 与 entries 一一对应的词频 Counter
+    """
+    postings = {}
+    lengths = array("I")
+    for doc_id, counts in enumerate(term_counts):
+        lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            postings.setdefault(term.encode("utf-8"), []).append((doc_id, tf))
+
+    terms = sorted(postings)
+    term_offsets, post_offsets, post_data = array("I", [0]), array("I", [0]), array("I")
+    term_blob = bytearray()
+    for term in terms:
+        term_blob += term
+        term_offsets.append(len(term_blob))
+        for doc_id, tf in postings[term]:
+            post_data.append(doc_id)
+            post_data.append(tf)
+        post_offsets.append(len(post_data) // 2)
+
+    entry_offsets, entry_blob = array("I", [0]), bytearray()
+    for entry in entries:
+        entry_blob += json.dumps(entry.__dict__, ensure_ascii=False).encode("utf-8")
+        entry_offsets.append(len(entry_blob))
+
+    body = bytearray(_HEADER.size)
+    _align(body)
+    offsets = []
+    for section in (term_offsets, term_blob, post_offsets, post_data, lengths, entry_offsets, entry_blob):
+        offsets.append(len(body))
+        body += section.tobytes() if isinstance(section, array) else section
+        _align(body)
+
+    avgdl = sum(lengths) / len(lengths) if lengths else 0.0
+    body[:_HEADER.size] = _HEADER.pack(
+        MAGIC, FORMAT_VERSION, _BYTEORDER, len(entries), len(terms), avgdl, *offsets
+    )
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    # 已经映射旧文件的进程仍持有旧 inode,替换不会影响它们
+    os.replace(tmp_path, path)
+
+
+class MmapIndex(BaseIndex):
+    """基于 mmap 的只读索引,打开时只解析 header"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            # 空文件无法 mmap (ValueError),与过短的文件一样按格式错误处理,由调用方重建
+            if st.st_size < _HEADER.size:
+                raise IndexFormatError(f"索引文件过短: {path}")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            # 记录映射的是哪个 inode,热更新时据此判断文件是否已被替换
+            self.inode = st.st_ino
+        (magic, version, byteorder, self._n_docs, self._n_terms, self._avgdl,
+         *offsets) = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or byteorder != _BYTEORDER:
+            raise IndexFormatError(f"索引文件格式不兼容: {path}")
+
+        view = memoryview(self._mm)
+        (term_off, term_blob_off, post_off, post_data_off,
+         len_off, entry_off, entry_blob_off) = offsets
+        n_terms, n_docs = self._n_terms, self._n_docs
+        self._term_offsets = view[term_off:term_off + 4 * (n_terms + 1)].cast("I")
+        self._term_blob = term_blob_off
+        self._post_offsets = view[post_off:post_off + 4 * (n_terms + 1)].cast("I")
+        n_pairs = self._post_offsets[n_terms] if n_terms else 0
+        self._postings = view[post_data_off:post_data_off + 8 * n_pairs].cast("I")
+        self._lengths = view[len_off:len_off + 4 * n_docs].cast("I")
+        self._entry_offsets = view[entry_off:entry_off + 4 * (n_docs + 1)].cast("I")
+        self._entry_blob = entry_blob_off
+        self._entry_cache = {}
+
+    def __len__(self) -> int:
+        return self._n_docs
+
+    @property
+    def avg_doc_length(self) -> float:
+        return self._avgdl
+
+    def _term_at(self, i: int) -> bytes:
+        start = self._term_blob + self._term_offsets[i]
+        end = self._term_blob + self._term_offsets[i + 1]
+        return self._mm[start:end]
+
+    def _find_term(self, term: bytes) -> int:
+        lo, hi = 0, self._n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_at(mid) < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._n_terms and self._term_at(lo) == term:
+            return lo
+        return -1
+
+    def postings(self, term: str):
+        i = self._find_term(term.encode("utf-8"))
+        if i < 0:
+            return []
+        pairs = self._postings[2 * self._post_offsets[i]:2 * self._post_offsets[i + 1]]
+        return list(zip(pairs[0::2], pairs[1::2]))
+
+    def doc_length(self, doc_id: int) -> int:
+        return self._lengths[doc_id]
+
+    def entry(self, doc_id: int):
+        entry = self._entry_cache.get(doc_id)
+        if entry is None:
+            start = self._entry_blob + self._entry_offsets[doc_id]
+            end = self._entry_blob + self._entry_offsets[doc_id + 1]
+            entry = KnowledgeEntry(**json.loads(self._mm[start:end].decode("utf-8")))
+            self._entry_cache[doc_id] = entry
+        return entry
+
+
+# ----------------------------------------------------------------
+# 增量构建: 每个文档的解析结果按内容哈希缓存为一个 segment,
+# 只有 mtime/大小变化且内容哈希也变化的文档才会重新解析分词
+# ----------------------------------------------------------------
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _read_json(path: str, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return default
+
+
+def _write_json(path: str, data):
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class _BuildLock:
+    """多个 worker 同时启动时只让一个进程构建索引"""
+
+    def __init__(self, index_dir: str):
+        self._path = os.path.join(index_dir, ".lock")
+        self._f = None
+
+    def __enter__(self):
+        self._f = open(self._path, "a")
+        if fcntl is not None:
+            fcntl.flock(self._f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+        self._f.close()
+
+
+def build_persistent_index(doc_dir: str, index_dir: str) -> dict:
+    """
+    增量构建持久化索引
+
+    Args:
+        doc_dir: 知识库文档目录
+        index_dir: 索引与 segment 缓存目录
+
+    Returns:
+        dict: {"index_path": str, "reparsed": int, "reused": int, "rewritten": bool}
+    """
+    os.makedirs(os.path.join(index_dir, SEGMENT_DIR), exist_ok=True)
+    index_path = os.path.join(index_dir, INDEX_FILE)
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+
+    with _BuildLock(index_dir):
+        manifest = _read_json(manifest_path, {})
+        if manifest.get("format") != FORMAT_VERSION:
+            manifest = {}
+        old_docs = manifest.get("docs", {})
+
+        docs, reparsed, reused = {}, 0, 0
+        for path in list_documents(doc_dir):
+            name = os.path.basename(path)
+            stat = os.stat(path)
+            old = old_docs.get(name)
+            if old and old["mtime_ns"] == stat.st_mtime_ns and old["size"] == stat.st_size:
+                sha = old["sha256"]
+            else:
+                sha = _file_sha256(path)
+            segment_path = os.path.join(index_dir, SEGMENT_DIR, f"{sha}.json")
+
+            if os.path.exists(segment_path):
+                reused += 1
+            else:
+                entries = parse_file(path)
+                _write_json(segment_path, [
+                    {"entry": entry.__dict__, "terms": entry_terms(entry)}
+                    for entry in entries
+                ])
+                reparsed += 1
+            docs[name] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": sha}
+
+        digest = hashlib.sha256(
+            json.dumps(sorted((name, d["sha256"]) for name, d in docs.items())).encode("utf-8")
+        ).hexdigest()
+        rewritten = digest != manifest.get("digest") or not os.path.exists(index_path)
+        if rewritten:
+            entries, term_counts = [], []
+            for name in sorted(docs):
+                segment_path = os.path.join(index_dir, SEGMENT_DIR, f"{docs[name]['sha256']}.json")
+                for record in _read_json(segment_path, []):
+                    entries.append(KnowledgeEntry(**record["entry"]))
+                    term_counts.append(Counter(record["terms"]))
+            write_index(index_path, entries, term_counts)
+
+        # 清理已经没有文档引用的 segment
+        live = {f"{d['sha256']}.json" for d in docs.values()}
+        for stale in os.listdir(os.path.join(index_dir, SEGMENT_DIR)):
+            if stale not in live:
+                os.remove(os.path.join(index_dir, SEGMENT_DIR, stale))
+
+        _write_json(manifest_path, {"format": FORMAT_VERSION, "digest": digest, "docs": docs})
+
+    return {"index_path": index_path, "reparsed": reparsed, "reused": reused, "rewritten": rewritten}
@@ -0,0 +1,95 @@
+"""
+知识库文档监听 - document 目录变化时在后台增量重建索引并热替换
+
+优先使用 watchfiles (基于 inotify 等系统通知),没有安装时退化为定时轮询 mtime。
+"""
+
+import asyncio
+import os
+import time
+
+from . import KNOWLEDGE_DIR
+from .retrieval import reload_snapshot
+
+try:
+    from watchfiles import awatch
+except ImportError:  # 可选依赖
+    awatch = None
+
+KNOWLEDGE_WATCH_INTERVAL = float(os.getenv("KNOWLEDGE_WATCH_INTERVAL", "2.0"))
+# 编辑器保存文件时可能连续触发多次变化,等待这段时间后再合并处理
+KNOWLEDGE_WATCH_DEBOUNCE = float(os.getenv("KNOWLEDGE_WATCH_DEBOUNCE", "0.5"))
+
+
+def _scan(doc_dir: str) -> dict:
+    """记录目录下每个 Markdown 文档的 (mtime, 大小)"""
+    try:
+        return {
+            entry.name: (entry.stat().st_mtime_ns, entry.stat().st_size)
+            for entry in os.scandir(doc_dir)
+            if entry.name.endswith(".md")
+        }
+    except FileNotFoundError:
+        return {}
+
+
+class KnowledgeWatcher:
+    """在 FastAPI lifespan 中启动的后台任务"""
+
+    def __init__(self, doc_dir: str = KNOWLEDGE_DIR, interval: float = KNOWLEDGE_WATCH_INTERVAL):
+        self.doc_dir = doc_dir
+        self.interval = interval
+        self.backend = "inotify" if awatch is not None else "polling"
+        self.reload_count = 0
+        self.last_error = None
+        self.last_checked_at = None
+        self._task = None
+        self._stop = asyncio.Event()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        print(f"👀 知识库监听已启动 ({self.backend}): {self.doc_dir}")
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def describe(self) -> dict:
+        return {
+            "backend": self.backend,
+            "reload_count": self.reload_count,
+            "last_checked_at": self.last_checked_at,
+            "last_error": self.last_error,
+        }
+
+    async def _reload(self):
+        await asyncio.sleep(KNOWLEDGE_WATCH_DEBOUNCE)
+        try:
+            # 解析和写索引是阻塞操作,放到线程里执行,不阻塞正在进行的流式响应
+            await asyncio.to_thread(reload_snapshot)
+            self.reload_count += 1
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"❌ 知识库热更新失败: {e}")
+
+    async def _run(self):
+        if awatch is not None:
+            async for _ in awatch(self.doc_dir, stop_event=self._stop, debounce=int(self.interval * 1000)):
+                self.last_checked_at = time.time()
+                await self._reload()
+            return
+
+        seen = _scan(self.doc_dir)
+        while not self._stop.is_set():
+            await asyncio.sleep(self.interval)
+            self.last_checked_at = time.time()
+            current = await asyncio.to_thread(_scan, self.doc_dir)
+            if current != seen:
+                seen = current
+                await self._reload()
@@ -3,23 +3,100 @@ FastAPI 主应用
 """
 import sys
 import os
-from fastapi.staticfiles import StaticFiles
 
 # 添加父目录到路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel, Field
 from typing import Optional
+from contextlib import asynccontextmanager
 import json
+import time
+import uuid
+from urllib.parse import quote
 
-from agent import runner, session_service
+from agent import event_writer, root_agent, runner, session_service, tool_cache
+from agent.tools import get_artifact_store, pdf_service
+from agent.sessions.cache import CachingSessionService
+from agent.sessions.pool import PoolWarmer, pool_stats
+from agent.metrics import (
+    METRICS_ENABLED, ChatObserver, MetricsSampler, mark_process_dead, render_metrics,
+)
+from agent.tracing import EventClock, activate, setup_tracing, shutdown_tracing, span, start_trace, stats_event
+from agent.tools.artifact_gc import PDF_GC_ENABLED, ArtifactCollector
+from agent.tools.artifact_index import InvalidCursorError
 from google.genai import types
+from google.adk.events import Event
 from google.adk.agents.run_config import RunConfig, StreamingMode
+from knowledge.retrieval import current_snapshot, pin_snapshot
+from knowledge.watcher import KnowledgeWatcher
+from api.admission import AdmissionController, AdmissionRejected, client_address, request_priority
+from api.answer_cache import ANSWER_CACHE_ENABLED, AnswerCache, split_answer
+from api.single_flight import SingleFlight
+from api.static import StaticSite
+from api.sse import SSE_HEADERS, StreamRegistry, StreamTurn, TextStream, message_frame
+from api.ws_chat import ChatConnection, encode as ws_encode
+from api.downloads import artifact_response
+
+# 是否监听 document 目录并热更新知识库
+KNOWLEDGE_WATCH = os.getenv("KNOWLEDGE_WATCH", "1") == "1"
+knowledge_watcher = KnowledgeWatcher() if KNOWLEDGE_WATCH else None
+answer_cache = AnswerCache() if ANSWER_CACHE_ENABLED else None
+# 限制同时运行的对话数,超出的排队或直接拒绝
+admission = AdmissionController()
+# 进行中和刚结束的流式回答,供断线的客户端续传
+stream_turns = StreamRegistry()
+# 合并重复的请求,同一会话上的对话依次运行
+single_flight = SingleFlight()
+# 启动时预先建立数据库连接,完成前 /api/health 返回 503
+pool_warmer = PoolWarmer(session_service.db_engine)
+# 只有本地目录后端需要后台清理磁盘上的 PDF
+artifact_store = get_artifact_store()
+pdf_collector = ArtifactCollector(artifact_store) if PDF_GC_ENABLED and artifact_store.backend.name == "local" else None
+# 连接池和各级缓存的统计定期复制到 /metrics
+metrics_sampler = MetricsSampler(
+    pool_stats=lambda: pool_stats(session_service.db_engine),
+    caches={
+        "answer": lambda: answer_cache.stats() if answer_cache is not None else None,
+        "tool": lambda: tool_cache.stats() if tool_cache is not None else None,
+        "session": lambda: session_service.stats() if isinstance(session_service, CachingSessionService) else None,
+        "pdf": artifact_store.stats,
+    },
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用启动/关闭时的后台任务管理"""
+    setup_tracing()
+    pool_warmer.start()
+    if event_writer is not None:
+        event_writer.start()
+    if knowledge_watcher is not None:
+        knowledge_watcher.start()
+    pdf_service.start()
+    if pdf_collector is not None:
+        pdf_collector.start()
+    metrics_sampler.start()
+    yield
+    await metrics_sampler.stop()
+    if pdf_collector is not None:
+        await pdf_collector.stop()
+    pdf_service.shutdown()
+    if knowledge_watcher is not None:
+        await knowledge_watcher.stop()
+    # 先写入缓冲中的会话事件,再释放连接池
+    if event_writer is not None:
+        await event_writer.stop()
+    await pool_warmer.stop()
+    shutdown_tracing()
+    mark_process_dead()
+
 
 # 创建 FastAPI 应用
-app = FastAPI(title="Google ADK Agent API", version="1.0.0",debug=True)
+app = FastAPI(title="Google ADK Agent API", version="1.0.0",debug=True, lifespan=lifespan)
 
 # 配置 CORS
 app.add_middleware(
@@ -30,36 +107,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ----------------------------------------------------------------
-# 【Vue 前端挂载配置】
-# ----------------------------------------------------------------
-
-# 1. 定位 dist 文件夹
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DIST_DIR = os.path.join(BASE_DIR, "dist")
-
-if os.path.exists(DIST_DIR):
-    # 2. 挂载静态资源 (js, css, img)
-    # Vue 打包后通常会把静态资源放在 dist/assets 目录下
-    # 我们把它挂载到 /assets 路径，这样 index.html 里的引用就能找到文件了
-    app.mount("/assets", StaticFiles(directory=os.path.join(DIST_DIR, "assets")), name="assets")
-
-
-    # 3. 处理根路由和所有“未知路由” (Vue Router 专用模式)
-    # 无论用户访问 / 还是 /chat 还是 /login，都返回 index.html
-    # 让 Vue 在前端自己去跳转页面
-    @app.get("/{full_path:path}")
-    async def serve_vue_app(full_path: str):
-        # 如果请求的是 API，跳过这里 (FastAPI 会自动优先匹配上面的 API 路由)
-        if full_path.startswith("api/"):
-            return {"error": "API route not found"}
-
-        # 否则返回 index.html
-        return FileResponse(os.path.join(DIST_DIR, "index.html"))
-
-else:
-    print(f"⚠️ 警告: 找不到 dist 文件夹。请确保你已经运行了 npm run build 并把 dist 放到根目录。")
-
 # 配置流式模式
 run_config = RunConfig(streaming_mode=StreamingMode.SSE)
 
@@ -78,16 +125,74 @@ class SessionCreate(BaseModel):
 
 
 # API 路由
-@app.get("/")
-async def root():
-    return {"message": "Google ADK Agent API", "version": "1.0.0"}
-
-
 @app.get("/api/health")
 async def health():
+    # 数据库连接预热完成之前不接流量,避免第一批请求承担建连开销
+    if not pool_warmer.ready:
+        return JSONResponse(status_code=503, content={"status": "warming", "db": pool_warmer.describe()})
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 指标"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="metrics disabled")
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/api/diagnostics/db")
+async def db_diagnostics():
+    """数据库连接池状态: 已借出连接数、等待数和取连接耗时,以及会话事件的批量写入情况"""
+    return {
+        "warmup": pool_warmer.describe(),
+        "pool": pool_stats(session_service.db_engine),
+        "event_writer": event_writer.stats() if event_writer is not None else None,
+    }
+
+
+@app.get("/api/diagnostics/knowledge")
+async def knowledge_diagnostics():
+    """知识库当前版本与最近一次热更新信息"""
+    return {
+        "snapshot": current_snapshot().describe(),
+        "watcher": knowledge_watcher.describe() if knowledge_watcher is not None else None,
+    }
+
+
+@app.get("/api/diagnostics/cache")
+async def cache_diagnostics():
+    """FAQ 答案缓存、工具结果缓存和会话缓存的命中率、节省的延迟和淘汰次数"""
+    return {
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+        "tool_cache": tool_cache.stats() if tool_cache is not None else None,
+        "session_cache": session_service.stats() if isinstance(session_service, CachingSessionService) else None,
+    }
+
+
+@app.get("/api/diagnostics/pdf")
+async def pdf_diagnostics():
+    """PDF 渲染进程池的排队情况和耗时,产物存储的命中率和内存占用,以及后台清理情况"""
+    return {
+        "pdf_service": pdf_service.stats(),
+        "artifact_store": artifact_store.stats(),
+        "gc": pdf_collector.stats() if pdf_collector is not None else None,
+    }
+
+
+@app.get("/api/diagnostics/admission")
+async def admission_diagnostics():
+    """/api/chat 的准入控制: 运行中和排队的请求数、平均排队时间、各类拒绝次数,以及重复请求的合并情况"""
+    return {**admission.stats(), "single_flight": single_flight.stats()}
+
+
+@app.get("/api/diagnostics/streams")
+async def stream_diagnostics():
+    """流式回答: 运行中和保留中的轮次、跟随的连接数、续传和因无人续传而取消的次数"""
+    return stream_turns.stats()
+
+
 @app.post("/api/create_session")
 async def create_session(request: SessionCreate):
     """创建新会话"""
@@ -101,91 +206,424 @@ async def create_session(request: SessionCreate):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/chat")
-async def chat(request: ChatRequest):
-    """与 Agent 对话"""
-    try:
-        # 如果没有 session_id，创建新会话
-        session_id = request.session_id
-        if not session_id:
+# ----------------------------------------------------------------
+# 【FAQ 答案缓存】
+# 只对会话的第一轮问题生效: 后续轮次的回答依赖上下文,不能跨会话复用
+# ----------------------------------------------------------------
+
+async def _user_turns(user_id: str, session_id: str):
+    """会话里已有的用户消息数和会话本身;会话不存在时返回 (None, None)"""
+    session = await session_service.get_session(app_name="agent", user_id=user_id, session_id=session_id)
+    if session is None:
+        return None, None
+    return sum(1 for event in session.events if event.author == "user"), session
+
+
+async def _flush_turn(app_name: str, user_id: str, session_id: str):
+    """
+    等这一轮的事件写入数据库;没有开启批量写入时 append_event 已经直接写库,不需要等待
+
+    Raises:
+        StaleSessionError: 其他 worker 先写了这个会话,这一轮的事件没能写入
+    """
+    if event_writer is None:
+        return
+    await session_service.flush(app_name=app_name, user_id=user_id, session_id=session_id)
+
+
+async def _record_cached_turn(session, content, answer: str):
+    """把缓存命中的问答写回会话,保证后续轮次的上下文完整"""
+    invocation_id = f"e-{uuid.uuid4()}"
+    await session_service.append_event(session, Event(invocation_id=invocation_id, author="user", content=content))
+    await session_service.append_event(session, Event(
+        invocation_id=invocation_id,
+        author=root_agent.name,
+        content=types.Content(role="model", parts=[types.Part(text=answer)]),
+    ))
+    await _flush_turn(session.app_name, session.user_id, session.id)
+
+
+async def _lookup_cached_answer(request, session_id: str, session, version):
+    if answer_cache is None or not answer_cache.cacheable(request.message):
+        return None
+    if session is None:
+        # 先检查再查缓存 (不计入命中): 会话里还不能有用户消息,否则回答要考虑之前的对话
+        user_turns, session = await _user_turns(request.user_id, session_id)
+        if user_turns != 0:
+            return None
+    cached = answer_cache.lookup(request.message, version=version)
+    if cached is None:
+        return None
+    await _record_cached_turn(session, types.Content(role="user", parts=[types.Part(text=request.message)]),
+                              cached.answer)
+    return cached
+
+
+async def _store_answer(request, session_id: str, is_new_session: bool, answer: str, elapsed: float, version):
+    if answer_cache is None or not answer_cache.cacheable(request.message):
+        return
+    if not is_new_session:
+        # 写入前检查: 这一轮已经写入会话,只能有刚才这一条用户消息
+        user_turns, _ = await _user_turns(request.user_id, session_id)
+        if user_turns is None or user_turns > 1:
+            return
+    answer_cache.store(request.message, answer, elapsed, version=version)
+
+
+def _collect_event(event, answer_parts: list) -> bool:
+    """
+    收集最终回复文本 (流式模式下跳过 partial 片段,只取汇总后的完整事件)
+
+    Returns:
+        bool: 本事件是否包含除 google_search 以外的工具调用 (如生成 PDF),这类回答不缓存
+    """
+    uses_tool = False
+    if event.content and event.content.parts:
+        for part in event.content.parts:
+            if part.function_call and part.function_call.name != "google_search":
+                uses_tool = True
+            if part.text and not event.partial:
+                answer_parts.append(part.text)
+    return uses_tool
+
+
+async def _prepare_turn(request: ChatRequest, trace, use_cache: bool = True):
+    """
+    开始一轮对话: 固定知识库版本、必要时新建会话、查 FAQ 答案缓存 (HTTP 和 WebSocket 共用)
+
+    Returns:
+        (知识库快照, session_id, 是否新会话, 用户消息, 命中的缓存或 None)
+    """
+    # 固定本轮使用的知识库版本,流式输出期间热更新不影响本轮
+    snapshot = pin_snapshot()
+
+    # 如果没有 session_id，创建新会话
+    session_id = request.session_id
+    session = None
+    if not session_id:
+        with span("session.create"):
             session = await session_service.create_session(
                 user_id=request.user_id,
                 app_name="agent"
             )
-            session_id = session.id
-        
-        content = types.Content(role="user", parts=[types.Part(text=request.message)])
-        
-        # 流式响应
+        session_id = session.id
+    if trace is not None:
+        trace.set_attribute("session.id", session_id)
+
+    content = types.Content(role="user", parts=[types.Part(text=request.message)])
+
+    # 高频 FAQ 直接返回缓存的回答,格式与模型输出一致
+    cached = None
+    if use_cache:
+        with span("answer_cache"):
+            cached = await _lookup_cached_answer(request, session_id, session, snapshot.version)
+    return snapshot, session_id, session is not None, content, cached
+
+
+async def _answer_frames(request: ChatRequest, session_id: str, content, trace, observer, outcome: dict,
+                         encode=message_frame):
+    """
+    运行一轮模型调用,产出按时间窗合并后的文本帧 (SSE 和 WebSocket 共用);
+    需要在 activate(trace) 内迭代,正常结束后 outcome 中有 answer 和 uses_tool
+    """
+    answer_parts = []
+    uses_tool = False
+    clock = EventClock(trace)
+
+    async def produce(emit):
+        nonlocal uses_tool
+        async for event in runner.run_async(
+            user_id=request.user_id,
+            session_id=session_id,
+            new_message=content,
+            run_config=run_config
+        ):
+            clock.on_event(event)
+            observer.on_event(event)
+            uses_tool = _collect_event(event, answer_parts) or uses_tool
+            # 提取文本内容
+            if event.content and event.content.parts:
+                for part in event.content.parts:
+                    if part.text:
+                        with clock.writing():
+                            await emit(part.text)
+
+        # 本轮事件落库后再通知客户端结束
+        with span("session.flush"):
+            await _flush_turn("agent", request.user_id, session_id)
+
+    # 小片段按时间窗合并成帧
+    stream = TextStream(produce, encode)
+    async for frame in stream.frames():
+        yield frame
+    stream.result()
+    if trace is not None:
+        trace.set_attribute("sse.frames", stream.frames_sent)
+    outcome["answer"] = "".join(answer_parts)
+    outcome["uses_tool"] = uses_tool
+
+
+@app.post("/api/chat")
+async def chat(request: ChatRequest, response: Response, http_request: Request):
+    """与 Agent 对话"""
+    # 流式请求断线重发时带着 Last-Event-ID: 这一轮还在 (运行中或刚结束) 就续上,不再调用模型
+    last_event_id = http_request.headers.get("last-event-id")
+    if request.stream and last_event_id:
+        resumed = stream_turns.resume(last_event_id, request.user_id, http_request)
+        if resumed is not None:
+            return StreamingResponse(resumed, media_type="text/event-stream", headers=SSE_HEADERS)
+
+    # 双击、重试发来的相同消息: 跟随正在进行的那一轮,不再调用模型
+    key = single_flight.key(request.user_id, request.session_id, request.message)
+    flight = single_flight.join(key, request.stream)
+    if flight is not None:
+        result = await flight.result()
+        if isinstance(result, StreamTurn):
+            return StreamingResponse(result.follow(request=http_request), media_type="text/event-stream",
+                                     headers=SSE_HEADERS)
+        return result
+
+    flight = single_flight.begin(key, request.stream)
+    try:
+        result = await _chat_turn(request, response, http_request, flight)
+        # 流式请求交出后台运行的那一轮,合并进来的请求各自跟随它的输出
+        flight.resolve(flight.turn if flight.turn is not None else result)
+        return result
+    except Exception as e:
+        flight.reject(e)
+        raise
+    finally:
+        flight.reject(HTTPException(status_code=503, detail="相同的请求已被取消,请重试"))
+        # 流式的一轮在后台运行,结束时再移除
+        if flight.turn is None:
+            single_flight.end(flight)
+
+
+async def _admit(client: str, session_id: Optional[str], message: str, stream: bool):
+    """
+    等前一轮结束 (同一会话依次运行) 并取得运行名额;归还名额时一并释放会话锁
+
+    Raises:
+        AdmissionRejected: 会话排队过多、超出并发限制或服务繁忙
+    """
+    # 等会话锁和排队名额共用一个期限
+    deadline = time.monotonic() + admission.queue_timeout
+    lease = await single_flight.lock(session_id, timeout=admission.queue_timeout)
+    try:
+        ticket = await admission.acquire(client, request_priority(message, stream), timeout=deadline - time.monotonic())
+    except BaseException:
+        lease.release()
+        raise
+    ticket.add_done_callback(lease.release)
+    return ticket
+
+
+async def _chat_turn(request: ChatRequest, response: Response, http_request: Request, flight):
+    # 各阶段耗时: 非流式放进 Server-Timing 响应头,流式在 done 之前发送 stats 事件
+    try:
+        ticket = await _admit(client_address(http_request), request.session_id, request.message, request.stream)
+    except AdmissionRejected as e:
+        return JSONResponse(
+            status_code=e.status,
+            content={"detail": str(e), "reason": e.reason},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    trace = start_trace("chat", stream=request.stream)
+    observer = ChatObserver("stream" if request.stream else "non_stream")
+    streaming = False
+    try:
+        with activate(trace):
+            snapshot, session_id, is_new_session, content, cached = await _prepare_turn(request, trace)
+        if cached is not None:
+            if request.stream:
+                async def run_cached(turn):
+                    try:
+                        await turn.send(f"data: {json.dumps({'type': 'session_id', 'session_id': session_id})}\n\n")
+                        for chunk in split_answer(cached.answer):
+                            await turn.send(message_frame(chunk))
+                        if trace is not None:
+                            await turn.send(stats_event(trace))
+                        await turn.send(f"data: {json.dumps({'type': 'done'})}\n\n")
+                    finally:
+                        ticket.release()
+                        single_flight.end(flight)
+                        observer.finish("cached")
+                        if trace is not None:
+                            trace.finish()
+
+                streaming = True
+                turn = flight.turn = stream_turns.start(request.user_id, run_cached)
+                return StreamingResponse(turn.follow(request=http_request), media_type="text/event-stream",
+                                         headers=SSE_HEADERS)
+            observer.finish("cached")
+            if trace is not None:
+                response.headers["Server-Timing"] = trace.server_timing()
+            return {"session_id": session_id, "message": cached.answer, "user_id": request.user_id}
+
+        started = time.perf_counter()
+
+        # 流式响应: 本轮在后台运行,客户端断线后可以带 Last-Event-ID 续上
         if request.stream:
-            async def event_generator():
-                try:
-                    yield f"data: {json.dumps({'type': 'session_id', 'session_id': session_id})}\n\n"
-                    
-                    # 使用 run_async 进行流式输出
-                    async for event in runner.run_async(
-                        user_id=request.user_id,
-                        session_id=session_id,
-                        new_message=content,
-                        run_config=run_config
-                    ):
-                        # 提取文本内容
-                        if event.content and event.content.parts:
-                            for part in event.content.parts:
-                                if part.text:
-                                    yield f"data: {json.dumps({'type': 'message', 'content': part.text})}\n\n"
-                    
-                    yield f"data: {json.dumps({'type': 'done'})}\n\n"
-                except Exception as e:
-                    yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
-            
-            return StreamingResponse(
-                event_generator(),
-                media_type="text/event-stream",
-                headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
-            )
-        
+            async def run_turn(turn):
+                outcome = {}
+                error = None
+                with activate(trace):
+                    try:
+                        await turn.send(f"data: {json.dumps({'type': 'session_id', 'session_id': session_id})}\n\n")
+                        async for frame in _answer_frames(request, session_id, content, trace, observer, outcome):
+                            await turn.send(frame)
+                        if trace is not None:
+                            await turn.send(stats_event(trace))
+                        await turn.send(f"data: {json.dumps({'type': 'done'})}\n\n")
+                    except Exception as e:
+                        error = str(e)
+                        await turn.send(f"data: {json.dumps({'type': 'error', 'error': error})}\n\n")
+                        return
+                    finally:
+                        ticket.release()
+                        single_flight.end(flight)
+                        # 既没有完成也没有出错: 客户端断开后没有续上,本轮被取消
+                        observer.finish("ok" if outcome else "error" if error else "cancelled")
+                        if trace is not None:
+                            trace.finish(error)
+
+                if not outcome["uses_tool"]:
+                    await _store_answer(request, session_id, is_new_session, outcome["answer"],
+                                        time.perf_counter() - started, snapshot.version)
+
+            streaming = True
+            turn = flight.turn = stream_turns.start(request.user_id, run_turn)
+            return StreamingResponse(turn.follow(request=http_request), media_type="text/event-stream",
+                                     headers=SSE_HEADERS)
+
         # 非流式响应
         else:
-            full_response = ""
-            
-            # 使用 run_async 收集完整响应
-            async for event in runner.run_async(
-                user_id=request.user_id,
-                session_id=session_id,
-                new_message=content,
-            ):
-                if event.content and event.content.parts:
-                    for part in event.content.parts:
-                        if part.text:
-                            full_response += part.text
-            
+            answer_parts = []
+            uses_tool = False
+
+            with activate(trace):
+                clock = EventClock(trace)
+                # 使用 run_async 收集完整响应
+                async for event in runner.run_async(
+                    user_id=request.user_id,
+                    session_id=session_id,
+                    new_message=content,
+                ):
+                    clock.on_event(event)
+                    observer.on_event(event)
+                    uses_tool = _collect_event(event, answer_parts) or uses_tool
+                with span("session.flush"):
+                    await _flush_turn("agent", request.user_id, session_id)
+            full_response = "".join(answer_parts)
+
+            if not uses_tool:
+                await _store_answer(request, session_id, is_new_session, full_response,
+                                    time.perf_counter() - started, snapshot.version)
+
+            observer.finish()
+            if trace is not None:
+                response.headers["Server-Timing"] = trace.server_timing()
             return {"session_id": session_id, "message": full_response, "user_id": request.user_id}
     
     except Exception as e:
+        observer.finish("error")
+        if trace is not None:
+            trace.finish(str(e))
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # 流式响应在生成器结束时再收尾
+        if not streaming:
+            ticket.release()
+            if trace is not None:
+                trace.finish()
+
+
+@app.get("/api/chat/resume")
+async def resume_chat(http_request: Request, user_id: str = "user", last_event_id: Optional[str] = None):
+    """
+    续上断线的流式回答: 补发 Last-Event-ID 之后的帧,本轮还在运行就继续跟随
+
+    EventSource 重连时自动带 Last-Event-ID 请求头;fetch 客户端也可以用 last_event_id 参数
+    """
+    event_id = http_request.headers.get("last-event-id") or last_event_id
+    resumed = stream_turns.resume(event_id, user_id, http_request) if event_id else None
+    if resumed is None:
+        raise HTTPException(status_code=404, detail="这次回答已过期或不存在,请重新提问")
+    return StreamingResponse(resumed, media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.websocket("/api/ws")
+async def chat_websocket(websocket: WebSocket, user_id: str = "user"):
+    """WebSocket 对话: 一个连接上同时进行多个会话的对话,协议见 api/ws_chat.py"""
+    await websocket.accept()
+    await ChatConnection(websocket, user_id, _websocket_turn).serve()
+
+
+async def _websocket_turn(connection: ChatConnection, request_id, message: str, session_id: Optional[str]):
+    """WebSocket 上的一轮对话,与流式 /api/chat 相同,只是帧格式不同"""
+    request = ChatRequest(message=message, user_id=connection.user_id, session_id=session_id, stream=True)
+    try:
+        ticket = await _admit(client_address(connection.websocket), request.session_id, request.message, request.stream)
+    except AdmissionRejected as e:
+        await connection.send(request_id, "error", error=str(e), reason=e.reason, retry_after=e.retry_after)
+        return
+
+    trace = start_trace("chat", stream=True, transport="websocket")
+    observer = ChatObserver("websocket")
+    outcome = {}
+    error = None
+    cached = None
+    # 本连接上已经聊过的会话不是第一轮,跳过 FAQ 缓存的查找和写入
+    known_session = session_id in connection.sessions
+    try:
+        with activate(trace):
+            snapshot, session_id, is_new_session, content, cached = await _prepare_turn(
+                request, trace, use_cache=not known_session
+            )
+            request.session_id = session_id
+            started = time.perf_counter()
+            await connection.send(request_id, "session_id", session_id=session_id)
+            if cached is not None:
+                for chunk in split_answer(cached.answer):
+                    await connection.send(request_id, "message", content=chunk)
+            else:
+                def encode(text):
+                    return ws_encode({"id": request_id, "type": "message", "content": text})
+
+                async for frame in _answer_frames(request, session_id, content, trace, observer, outcome, encode):
+                    await connection.send_text(frame)
+            if trace is not None:
+                await connection.send(request_id, "stats", **trace.stats())
+            await connection.send(request_id, "done")
+            connection.sessions.add(session_id)
+    except Exception as e:
+        error = str(e)
+        await connection.send(request_id, "error", error=error)
+        return
+    finally:
+        ticket.release()
+        observer.finish("cached" if cached is not None else "ok" if outcome else "error" if error else "cancelled")
+        if trace is not None:
+            trace.finish(error)
+
+    if outcome and not outcome["uses_tool"] and not known_session:
+        await _store_answer(request, session_id, is_new_session, outcome["answer"],
+                            time.perf_counter() - started, snapshot.version)
 
 
 @app.get("/api/download_pdf/{file_name}")
-async def download_pdf(file_name: str):
-    """下载生成的 PDF 文件"""
+async def download_pdf(file_name: str, request: Request):
+    """下载生成的 PDF 文件 (支持 ETag 和 Range)"""
     try:
-        # 获取 PDF 输出目录
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        pdf_dir = os.path.join(base_dir, "generated_pdfs")
-        file_path = os.path.join(pdf_dir, file_name)
+        # 友好文件名 -> 内容寻址存储中的条目
+        info = await artifact_store.offload(artifact_store.resolve, file_name)
         
-        # 检查文件是否存在
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="PDF 文件不存在")
+        # 检查文件是否存在 (内存后端中的文件过期后也会找不到)
+        if info is None:
+            raise HTTPException(status_code=404, detail="PDF 文件不存在或已过期")
         
-        # 返回文件
-        return FileResponse(
-            path=file_path,
-            media_type="application/pdf",
-            filename=file_name,
-            headers={"Content-Disposition": f"attachment; filename={file_name}"}
-        )
+        return artifact_response(artifact_store, info, request.headers)
     except HTTPException:
         raise
     except Exception as e:
@@ -193,37 +631,69 @@ async def download_pdf(file_name: str):
 
 
 @app.get("/api/list_pdfs")
-async def list_pdfs():
-    """列出所有生成的 PDF 文件"""
+async def list_pdfs(user_id: str = "user", limit: Optional[int] = None, cursor: Optional[str] = None):
+    """
+    列出某个用户生成的 PDF 文件,按创建时间倒序分页
+
+    返回的 next_cursor 不为空时,带上 cursor=next_cursor 获取下一页
+    """
     try:
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        pdf_dir = os.path.join(base_dir, "generated_pdfs")
-        
-        # 确保目录存在
-        if not os.path.exists(pdf_dir):
-            return {"pdfs": []}
-        
-        # 获取所有 PDF 文件
-        pdf_files = []
-        for file in os.listdir(pdf_dir):
-            if file.endswith(".pdf"):
-                file_path = os.path.join(pdf_dir, file)
-                file_stat = os.stat(file_path)
-                pdf_files.append({
-                    "name": file,
-                    "size": file_stat.st_size,
-                    "created_at": file_stat.st_ctime,
-                    "download_url": f"/api/download_pdf/{file}"
-                })
-        
-        # 按创建时间倒序排列
-        pdf_files.sort(key=lambda x: x["created_at"], reverse=True)
+        page = await artifact_store.offload(artifact_store.page, user_id, limit, cursor)
+        pdf_files = [
+            {**item, "download_url": f"/api/download_pdf/{quote(item['name'])}"}
+            for item in page["items"]
+        ]
         
-        return {"pdfs": pdf_files}
+        return {"pdfs": pdf_files, "next_cursor": page["next_cursor"]}
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ----------------------------------------------------------------
+# 【Vue 前端挂载配置】
+# ----------------------------------------------------------------
+
+# 1. 定位 dist 文件夹
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DIST_DIR = os.path.join(BASE_DIR, "dist")
+
+if os.path.exists(DIST_DIR):
+    # 2. 挂载静态资源 (js, css, img)
+    # Vue 打包后通常会把静态资源放在 dist/assets 目录下
+    # 我们把它挂载到 /assets 路径，这样 index.html 里的引用就能找到文件了
+    # 启动时预压缩 (gzip/brotli),带内容哈希的文件长期缓存,index.html 常驻内存
+    static_site = StaticSite(DIST_DIR)
+    app.mount("/assets", static_site.mount("assets"), name="assets")
+
+
+    # 3. 处理根路由和所有“未知路由” (Vue Router 专用模式)
+    # 必须放在所有 API 路由之后注册,否则会抢先匹配 GET /api/* 请求
+    # 无论用户访问 / 还是 /chat 还是 /login，都返回 index.html
+    # 让 Vue 在前端自己去跳转页面
+    @app.get("/{full_path:path}")
+    async def serve_vue_app(full_path: str, request: Request):
+        # 如果请求的是 API，跳过这里 (FastAPI 会自动优先匹配上面的 API 路由)
+        if full_path.startswith("api/"):
+            return {"error": "API route not found"}
+
+        # dist 根目录下的文件 (favicon.ico 等)
+        response = static_site.file_response(full_path, request.headers)
+        if response is not None:
+            return response
+
+        # 否则返回 index.html
+        return static_site.index_response(request.headers)
+
+else:
+    print(f"⚠️ 警告: 找不到 dist 文件夹。请确保你已经运行了 npm run build 并把 dist 放到根目录。")
+
+    @app.get("/")
+    async def root():
+        return {"message": "Google ADK Agent API", "version": "1.0.0"}
+
+
 # if __name__ == "__main__":
 #     import uvicorn
 #     uvicorn.run("api.main:app", host="0.0.0.0", port=8080, reload=True)
@@ -0,0 +1,182 @@
+"""
+准入控制测试脚本
+"""
+
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+
+# 添加当前目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from starlette.datastructures import Headers
+
+from api.admission import PRIORITY_HIGH, PRIORITY_NORMAL, AdmissionController, AdmissionRejected, client_address
+
+
+async def _queue(controller, client: str, priority: int = PRIORITY_NORMAL):
+    """开始排队,返回等待中的任务"""
+    task = asyncio.create_task(controller.acquire(client, priority))
+    await asyncio.sleep(0)
+    assert not task.done()
+    return task
+
+
+def test_release_hands_slot_to_highest_priority_waiter():
+    async def run():
+        controller = AdmissionController(max_concurrency=1, max_per_client=0, queue_timeout=5)
+        first = await controller.acquire("a")
+        normal = await _queue(controller, "b", PRIORITY_NORMAL)
+        high = await _queue(controller, "c", PRIORITY_HIGH)
+        assert controller.stats()["queue_depth"] == 2
+
+        # 名额直接转交,active 不变
+        first.release()
+        ticket = await high
+        assert ticket.client == "c" and not normal.done()
+        assert controller.stats()["active"] == 1 and controller.stats()["queue_depth"] == 1
+
+        ticket.release()
+        (await normal).release()
+        return controller.stats(), controller._per_client
+
+    stats, per_client = asyncio.run(run())
+    assert stats["active"] == 0 and stats["queue_depth"] == 0 and stats["admitted"] == 3
+    assert not per_client
+
+
+def test_per_client_limit():
+    async def run():
+        controller = AdmissionController(max_concurrency=4, max_per_client=1)
+        ticket = await controller.acquire("10.0.0.1")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("10.0.0.1")
+        assert rejected.value.status == 429 and rejected.value.reason == "rejected_client"
+        # 其他客户端不受影响
+        (await controller.acquire("10.0.0.2")).release()
+        ticket.release()
+
+        unlimited = AdmissionController(max_concurrency=4, max_per_client=0)
+        tickets = [await unlimited.acquire("10.0.0.1") for _ in range(3)]
+        for ticket in tickets:
+            ticket.release()
+        return controller.stats(), unlimited.stats()
+
+    stats, unlimited = asyncio.run(run())
+    assert stats["rejected_client"] == 1 and stats["active"] == 0
+    assert unlimited["rejected_client"] == 0 and unlimited["active"] == 0
+
+
+def test_cancelled_waiter_is_abandoned_and_skipped():
+    async def run():
+        controller = AdmissionController(max_concurrency=1, max_per_client=0, queue_timeout=5)
+        first = await controller.acquire("a")
+        cancelled = await _queue(controller, "b")
+        waiting = await _queue(controller, "c")
+
+        cancelled.cancel()
+        try:
+            await cancelled
+        except asyncio.CancelledError:
+            pass
+        assert controller.stats()["queue_depth"] == 1 and "b" not in controller._per_client
+
+        # 堆中已取消的条目出队时跳过,名额交给后面的等待者
+        first.release()
+        ticket = await waiting
+        assert ticket.client == "c"
+        ticket.release()
+        return controller.stats(), controller._queue
+
+    stats, queue = asyncio.run(run())
+    assert stats["active"] == 0 and stats["queue_depth"] == 0 and not queue
+
+
+def test_queue_timeout_and_queue_full():
+    async def run():
+        controller = AdmissionController(max_concurrency=1, max_per_client=0, queue_size=1, queue_timeout=0.05)
+        first = await controller.acquire("a")
+        waiting = await _queue(controller, "b")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("c")
+        assert rejected.value.status == 503 and rejected.value.reason == "shed_queue_full"
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await waiting
+        assert rejected.value.status == 503 and rejected.value.reason == "timeouts"
+        assert controller.stats()["queue_depth"] == 0 and "b" not in controller._per_client
+
+        # 超时的等待者不会拿走名额
+        first.release()
+        return controller.stats()
+
+    stats = asyncio.run(run())
+    assert stats["active"] == 0 and stats["timeouts"] == 1 and stats["shed_queue_full"] == 1
+
+
+def test_waiter_cancelled_after_grant_passes_slot_on():
+    """名额已经转交,等待者却在恢复运行之前被取消: 名额要继续交给下一个,不能丢失"""
+    async def run():
+        controller = AdmissionController(max_concurrency=1, max_per_client=0, queue_timeout=5)
+        first = await controller.acquire("a")
+        granted = await _queue(controller, "b")
+        waiting = await _queue(controller, "c")
+
+        first.release()
+        granted.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await granted
+        assert "b" not in controller._per_client
+
+        ticket = await waiting
+        assert controller.stats()["active"] == 1
+        ticket.release()
+        # 重复释放不会重复计数
+        ticket.release()
+        return controller.stats()
+
+    stats = asyncio.run(run())
+    assert stats["active"] == 0 and stats["queue_depth"] == 0
+
+
+def test_acquire_uses_remaining_timeout():
+    """等会话锁已经用掉了大部分期限时,排队只等剩余的时间"""
+    async def run():
+        controller = AdmissionController(max_concurrency=1, max_per_client=0, queue_timeout=5)
+        first = await controller.acquire("a")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("b", timeout=0.05)
+        assert rejected.value.reason == "timeouts"
+        first.release()
+        return controller.stats()
+
+    stats = asyncio.run(run())
+    assert stats["active"] == 0 and stats["queue_depth"] == 0
+
+
+def test_client_address_ignores_forged_forwarded_for():
+    def connection(forwarded=None, peer="169.254.1.1"):
+        raw = [(b"x-forwarded-for", value.encode()) for value in forwarded or []]
+        return SimpleNamespace(headers=Headers(raw=raw), client=SimpleNamespace(host=peer))
+
+    # 没有可信代理: 不看请求头
+    assert client_address(connection(["1.1.1.1"]), trusted_hops=0) == "169.254.1.1"
+    # Cloud Run 把真实地址追加在最后,客户端伪造的条目在左边
+    assert client_address(connection(["1.1.1.1, 203.0.113.7"]), trusted_hops=1) == "203.0.113.7"
+    assert client_address(connection(["1.1.1.1", "203.0.113.7"]), trusted_hops=1) == "203.0.113.7"
+    assert client_address(connection(["1.1.1.1, 198.51.100.2, 10.0.0.3"]), trusted_hops=2) == "198.51.100.2"
+    # 条目比可信代理少: 请求没有经过代理,使用对端地址
+    assert client_address(connection(), trusted_hops=1) == "169.254.1.1"
+
+
+if __name__ == "__main__":
+    test_release_hands_slot_to_highest_priority_waiter()
+    test_per_client_limit()
+    test_cancelled_waiter_is_abandoned_and_skipped()
+    test_queue_timeout_and_queue_full()
+    test_waiter_cancelled_after_grant_passes_slot_on()
+    test_acquire_uses_remaining_timeout()
+    test_client_address_ignores_forged_forwarded_for()
+    print("✅ 准入控制测试通过")
@@ -0,0 +1,86 @@
+"""
+FAQ 答案缓存测试脚本
+"""
+
+import sys
+import os
+import time
+
+# 添加当前目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from api.answer_cache import AnswerCache, normalize_question
+
+
+def test_normalize_question():
+    assert normalize_question("如何克服 单身焦虑？！") == normalize_question("如何克服单身焦虑?")
+
+
+def test_exact_and_fuzzy_hit():
+    cache = AnswerCache(threshold=0.8)
+    cache.store("如何克服单身时对恋爱的焦虑情绪？", "先正视焦虑...", latency=3.0, version=1)
+
+    assert cache.lookup("如何克服单身时对恋爱的焦虑情绪", version=1).answer == "先正视焦虑..."
+    assert cache.lookup("如何克服单身时对恋爱的焦虑", version=1) is not None
+    assert cache.lookup("婚后夫妻消费观念不同怎么办", version=1) is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["fuzzy_hits"] == 1 and stats["misses"] == 1
+    assert stats["saved_latency_seconds"] == 6.0
+
+
+def test_exact_match_by_default():
+    cache = AnswerCache()
+    cache.store("如何克服单身时对恋爱的焦虑情绪？", "先正视焦虑...", latency=3.0)
+
+    assert cache.lookup("如何克服 单身时对恋爱的焦虑情绪", version=None) is not None
+    assert cache.lookup("如何克服单身时对恋爱的焦虑", version=None) is None
+
+
+def test_fuzzy_match_rejects_negation_and_length_change():
+    cache = AnswerCache(threshold=0.8)
+    cache.store("我应该和男朋友分手吗", "a", latency=1.0)
+    cache.store("婚后夫妻消费观念不同的时候应该怎么沟通", "b", latency=1.0)
+
+    # bigram 相似度约 0.84,但意思相反
+    assert cache.lookup("我不应该和男朋友分手吗") is None
+    assert cache.lookup("婚后夫妻消费观念不同的时候不应该怎么沟通") is None
+    # 加了限定条件的长问题
+    assert cache.lookup("我应该和男朋友分手吗他出轨了") is None
+    assert cache.lookup("应该和男朋友分手吗").answer == "a"
+
+
+def test_ttl_version_and_lru_eviction():
+    cache = AnswerCache(max_entries=2, ttl=60)
+    cache.store("情侣吵架冷战怎么解决", "a", latency=1.0, version=1)
+    cache.store("婆媳矛盾怎么处理比较好", "b", latency=1.0, version=1)
+    cache.lookup("情侣吵架冷战怎么解决", version=1)
+    cache.store("七夕送女朋友什么礼物", "c", latency=1.0, version=1)
+
+    # 最久未使用的 "婆媳矛盾" 被淘汰
+    assert cache.lookup("婆媳矛盾怎么处理比较好", version=1) is None
+    assert cache.stats()["evictions"] == 1
+
+    # 知识库版本变化后旧回答失效
+    assert cache.lookup("情侣吵架冷战怎么解决", version=2) is None
+
+    cache.ttl = 0
+    time.sleep(0.01)
+    assert cache.lookup("七夕送女朋友什么礼物", version=1) is None
+    assert cache.stats()["expirations"] == 2
+
+
+def test_short_questions_not_cached():
+    cache = AnswerCache()
+    cache.store("你好", "你好呀", latency=1.0)
+    assert cache.stats()["entries"] == 0
+
+
+if __name__ == "__main__":
+    test_normalize_question()
+    test_exact_and_fuzzy_hit()
+    test_exact_match_by_default()
+    test_fuzzy_match_rejects_negation_and_length_change()
+    test_ttl_version_and_lru_eviction()
+    test_short_questions_not_cached()
+    print("✅ 答案缓存测试通过")
@@ -0,0 +1,127 @@
+"""
+PDF 产物存储与下载测试脚本
+"""
+
+import sys
+import os
+import json
+import asyncio
+import hashlib
+import tempfile
+import threading
+
+# 添加当前目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from agent.tools.artifact_store import ArtifactStore, LocalDirBackend, MemoryBackend
+from api.downloads import artifact_response
+
+DIGEST = "ab" * 32
+
+
+def test_etag_follows_bytes_after_regeneration():
+    """同样的生成参数重新渲染出不同的字节时 ETag 随之变化,旧 ETag 的 If-Range 续传返回完整文件"""
+    backend = MemoryBackend(budget=1024)
+    store = ArtifactStore(backend)
+    first = store.put(DIGEST, b"%PDF-first", "plan.pdf")
+    assert first.etag == f'"{hashlib.sha256(b"%PDF-first").hexdigest()}"'
+
+    backend.delete(DIGEST)
+    second = store.put(DIGEST, b"%PDF-second", "plan.pdf")
+    assert second.etag != first.etag
+
+    resumed = artifact_response(store, second, {"range": "bytes=5-", "if-range": first.etag})
+    assert resumed.status_code == 200
+    resumed = artifact_response(store, second, {"range": "bytes=5-", "if-range": second.etag})
+    assert resumed.status_code == 206
+
+
+def test_local_backend_keeps_first_render():
+    """并发生成相同参数时不覆盖先写入的文件,已经发出的 ETag 仍然对应文件内容"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backend = LocalDirBackend(tmp_dir)
+        first = backend.put(DIGEST, b"%PDF-first", "plan.pdf")
+        second = backend.put(DIGEST, b"%PDF-second", "plan.pdf")
+        assert second.etag == first.etag and second.file_name == first.file_name
+        assert b"".join(backend.read(second, 0, second.size - 1)) == b"%PDF-first"
+
+
+def test_legacy_entry_gets_weak_etag():
+    """没有记录字节哈希的旧文件: If-None-Match 可以命中,If-Range 不能续传"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backend = LocalDirBackend(tmp_dir)
+        info = backend.put(DIGEST, b"%PDF-legacy", "plan.pdf")
+        entry = backend._read_meta(DIGEST)
+        del entry["sha256"]
+        backend._write_meta(DIGEST, entry)
+
+        store = ArtifactStore(backend)
+        legacy = store.resolve(info.file_name)
+        assert legacy.etag.startswith('W/"')
+        assert artifact_response(store, legacy, {"if-none-match": legacy.etag}).status_code == 304
+        assert artifact_response(store, legacy, {"range": "bytes=5-", "if-range": legacy.etag}).status_code == 200
+
+
+def test_invalid_range_is_ignored():
+    """格式不对的 Range (end 小于 start) 按 RFC 9110 忽略,返回完整文件;区间无法满足才返回 416"""
+    store = ArtifactStore(MemoryBackend(budget=1024))
+    info = store.put(DIGEST, b"%PDF-range", "plan.pdf")
+    for header in ("bytes=5-3", "bytes=-", "bytes=1-2,4-5"):
+        response = artifact_response(store, info, {"range": header})
+        assert response.status_code == 200, header
+    assert artifact_response(store, info, {"range": "bytes=100-"}).status_code == 416
+    assert artifact_response(store, info, {"range": "bytes=5-100"}).status_code == 206
+
+
+def test_local_manifest_is_migrated():
+    """之前版本的 manifest.json 拆成逐个文件的元数据,旧的下载链接仍然有效"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backend = LocalDirBackend(tmp_dir)
+        backend.put(DIGEST, b"%PDF-old", "约会计划.pdf")
+        entry = backend._read_meta(DIGEST)
+        os.remove(backend.meta_path(DIGEST))
+        os.remove(backend.name_path("约会计划.pdf"))
+        with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump({"names": {"约会计划.pdf": DIGEST}, "objects": {DIGEST: entry}}, f)
+
+        migrated = LocalDirBackend(tmp_dir)
+        assert not os.path.exists(os.path.join(tmp_dir, "manifest.json"))
+        assert migrated.resolve("约会计划.pdf").digest == DIGEST
+        assert [info.file_name for info in migrated.list()] == ["约会计划.pdf"]
+
+        # 同名的新文件换一个名字,删除后指针和元数据一起清理
+        other = migrated.put("cd" * 32, b"%PDF-new", "约会计划.pdf")
+        assert other.file_name == "约会计划_cdcdcdcd.pdf"
+        migrated.delete(DIGEST)
+        assert migrated.resolve("约会计划.pdf") is None and migrated.get(DIGEST) is None
+        assert migrated.resolve(other.file_name).digest == "cd" * 32
+
+
+def test_store_runs_backend_io_off_the_event_loop():
+    """本地目录和 S3 后端的调用在线程中执行"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = ArtifactStore(LocalDirBackend(tmp_dir))
+
+        async def run():
+            loop_thread = threading.get_ident()
+            threads = []
+
+            def put():
+                threads.append(threading.get_ident())
+                return store.put(DIGEST, b"%PDF-async", "plan.pdf")
+
+            info = await store.offload(put)
+            return threads[0] != loop_thread, await store.offload(store.resolve, info.file_name)
+
+        in_thread, resolved = asyncio.run(run())
+        assert in_thread and resolved.digest == DIGEST
+
+
+if __name__ == "__main__":
+    test_etag_follows_bytes_after_regeneration()
+    test_local_backend_keeps_first_render()
+    test_legacy_entry_gets_weak_etag()
+    test_invalid_range_is_ignored()
+    test_local_manifest_is_migrated()
+    test_store_runs_backend_io_off_the_event_loop()
+    print("✅ PDF 产物存储测试通过")
@@ -0,0 +1,99 @@
+"""
+/api/chat 整轮对话测试脚本 (离线桩模型)
+
+每种配置在单独的子进程中导入 main,会话服务的组合在导入时按环境变量确定。
+"""
+
+import sys
+import os
+import json
+import subprocess
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+OFFLINE_APP = """
+import json
+import sys
+
+sys.path.insert(0, "benchmarks")
+
+from fastapi.testclient import TestClient
+
+import main
+from agent import root_agent
+from offline import FakeGemini, install_offline_agent
+
+install_offline_agent(root_agent, FakeGemini(first_token_ms=0, tokens_per_second=10000, answer_tokens=10,
+                                             tool_call_ratio=0), search_latency_ms=0)
+"""
+
+CHAT_SCRIPT = OFFLINE_APP + """
+with TestClient(main.app) as client:
+    reply = client.post("/api/chat", json={"message": "吵架了怎么办", "stream": False})
+    assert reply.status_code == 200, reply.text
+    session_id = reply.json()["session_id"]
+    streamed = client.post("/api/chat", json={"message": "还是很生气", "session_id": session_id, "stream": True})
+    assert streamed.status_code == 200, streamed.text
+    events = [json.loads(line[6:]) for line in streamed.text.splitlines() if line.startswith("data: ")]
+    print(json.dumps({"message": reply.json()["message"], "events": [event["type"] for event in events]}))
+"""
+
+CACHE_SCRIPT = OFFLINE_APP + """
+QUESTION = "异地恋怎么维持感情"
+with TestClient(main.app) as client:
+    def ask(message, session_id=None):
+        reply = client.post("/api/chat", json={"message": message, "session_id": session_id, "stream": False})
+        assert reply.status_code == 200, reply.text
+        return reply.json()["session_id"]
+
+    ask(QUESTION)
+    hits = [main.answer_cache.stats()["hits"]]
+    # 已有一轮对话的会话再问缓存中的问题,回答要考虑上下文
+    session_id = ask("男朋友最近总是不回消息")
+    ask(QUESTION, session_id)
+    hits.append(main.answer_cache.stats()["hits"])
+    # 新会话的第一轮照常命中
+    ask(QUESTION)
+    hits.append(main.answer_cache.stats()["hits"])
+    print(json.dumps({"hits": hits}))
+"""
+
+
+def _run_chat(script: str = CHAT_SCRIPT, **env) -> dict:
+    env = {
+        **os.environ,
+        "SESSION_BACKEND": "memory",
+        "KNOWLEDGE_WATCH": "0",
+        "PDF_STORE_BACKEND": "memory",
+        "ANSWER_CACHE_ENABLED": "0",
+        **env,
+    }
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr[-2000:]
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_chat_with_write_behind():
+    result = _run_chat(EVENT_WRITE_BEHIND="1")
+    assert result["message"] and result["events"][-1] == "done"
+
+
+def test_chat_without_write_behind():
+    """EVENT_WRITE_BEHIND=0 时 flush 不能把会话参数传给 ADK 的 flush()"""
+    for session_cache in ("1", "0"):
+        result = _run_chat(EVENT_WRITE_BEHIND="0", SESSION_CACHE_ENABLED=session_cache)
+        assert result["message"]
+        assert "error" not in result["events"] and result["events"][-1] == "done"
+
+
+def test_answer_cache_only_serves_first_turns():
+    result = _run_chat(CACHE_SCRIPT, ANSWER_CACHE_ENABLED="1")
+    assert result["hits"] == [0, 0, 1]
+
+
+if __name__ == "__main__":
+    test_chat_with_write_behind()
+    test_chat_without_write_behind()
+    test_answer_cache_only_serves_first_turns()
+    print("✅ /api/chat 整轮对话测试通过")
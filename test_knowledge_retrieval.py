@@ -0,0 +1,85 @@
+"""
+知识库检索测试脚本
+"""
+
+import sys
+import os
+import tempfile
+
+# 添加当前目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from knowledge import (KNOWLEDGE_DIR, IndexFormatError, MemoryIndex, MmapIndex, build_persistent_index,
+                       load_entries, load_index, parse_markdown, tokenize)
+
+
+def test_parse_markdown():
+    """按 #### 标题拆分条目,并从一级标题中取出分类"""
+    text = "# 恋爱常见问题和回答 - 单身篇\n#### 问题一？\n回答一\n\n#### 问题二？\n回答二\n推荐课程: xxx\n"
+    entries = parse_markdown(text, "单身篇.md")
+
+    assert [e.question for e in entries] == ["问题一？", "问题二？"]
+    assert entries[0].category == "单身篇"
+    assert entries[1].answer == "回答二\n推荐课程: xxx"
+
+
+def test_tokenize_cjk_bigrams():
+    assert tokenize("冷战 ABC") == ["冷", "战", "冷战", "abc"]
+
+
+def test_search_returns_relevant_entry():
+    index = MemoryIndex(load_entries())
+    assert len(index) == 15
+
+    results = index.search("如何克服单身焦虑", top_k=3)
+    assert results[0][0].question == "如何克服单身时对恋爱的焦虑情绪？"
+
+    results = index.search("婆媳矛盾怎么办", top_k=1)
+    assert results[0][0].category == "已婚篇"
+
+
+def test_search_without_match():
+    index = MemoryIndex(load_entries())
+    assert index.search("hello world") == []
+
+
+def test_mmap_index_matches_memory_index(tmp_path):
+    """持久化索引与内存索引的检索结果一致,且文档不变时不会重新解析"""
+    stats = build_persistent_index(KNOWLEDGE_DIR, str(tmp_path))
+    assert stats["reparsed"] == 3 and stats["rewritten"]
+
+    mmap_index = MmapIndex(stats["index_path"])
+    memory_index = MemoryIndex(load_entries())
+    for query in ["如何克服单身焦虑", "情侣吵架冷战怎么解决", "hello world"]:
+        expected = [(e, round(s, 6)) for e, s in memory_index.search(query)]
+        assert [(e, round(s, 6)) for e, s in mmap_index.search(query)] == expected
+
+    stats = build_persistent_index(KNOWLEDGE_DIR, str(tmp_path))
+    assert stats["reparsed"] == 0 and stats["reused"] == 3 and not stats["rewritten"]
+
+
+def test_empty_index_file_is_rebuilt(tmp_path):
+    """空的索引文件 (写入中途断电等) 按格式错误处理,启动时重建而不是崩溃"""
+    stats = build_persistent_index(KNOWLEDGE_DIR, str(tmp_path))
+    open(stats["index_path"], "wb").close()
+    with pytest.raises(IndexFormatError):
+        MmapIndex(stats["index_path"])
+
+    for verify in (False, True):
+        index = load_index(KNOWLEDGE_DIR, str(tmp_path), verify=verify)
+        assert len(index) == 15
+        open(stats["index_path"], "wb").close()
+
+
+if __name__ == "__main__":
+    test_parse_markdown()
+    test_tokenize_cjk_bigrams()
+    test_search_returns_relevant_entry()
+    test_search_without_match()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_mmap_index_matches_memory_index(tmp_dir)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_empty_index_file_is_rebuilt(tmp_dir)
+    print("✅ 知识库检索测试通过")
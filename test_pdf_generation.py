@@ -7,10 +7,14 @@ csv.field_size_limit(100 * 1024 * 1024)
 
 import sys
 import os
+import tempfile
 
 # 添加父目录到路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from agent.tools import artifact_store
+from agent.tools.artifact_index import ArtifactIndex
+from agent.tools.artifact_store import ArtifactStore, LocalDirBackend
 from agent.tools.pdf_generator import generate_date_plan_pdf
 import json
 
@@ -52,15 +56,21 @@ def test_pdf_generation():
     5. 保持手机电量充足
     """
     
-    # 生成 PDF
+    # 生成 PDF (写到临时目录,不污染 generated_pdfs/)
     print("📝 生成 PDF 文档...")
-    result = generate_date_plan_pdf(
-        title=title,
-        restaurant_info=restaurant_info,
-        activity_schedule=activity_schedule,
-        gift_list=gift_list,
-        additional_notes=additional_notes
-    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        previous = artifact_store._store
+        artifact_store._store = ArtifactStore(LocalDirBackend(tmp_dir), ArtifactIndex(os.path.join(tmp_dir, "index.sqlite3")))
+        try:
+            result = generate_date_plan_pdf(
+                title=title,
+                restaurant_info=restaurant_info,
+                activity_schedule=activity_schedule,
+                gift_list=gift_list,
+                additional_notes=additional_notes
+            )
+        finally:
+            artifact_store._store = previous
     
     # 打印结果
     print("\n" + "="*60)
@@ -72,12 +82,13 @@ def test_pdf_generation():
     if result["success"]:
         print(f"\n✅ 测试成功!")
         print(f"📄 PDF 文件已生成: {result['file_name']}")
-        print(f"📂 文件路径: {result['file_path']}")
-        print(f"\n💡 下载链接: http://localhost:8000/api/download_pdf/{result['file_name']}")
+        print(f"📦 文件大小: {result['size']} 字节")
+        print(f"\n💡 下载链接: http://localhost:8000{result['download_url']}")
     else:
         print(f"\n❌ 测试失败: {result['message']}")
     
     print("\n" + "="*60)
+    assert result["success"], result["message"]
 
 if __name__ == "__main__":
     test_pdf_generation()
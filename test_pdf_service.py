@@ -0,0 +1,51 @@
+"""
+PDF 渲染进程池测试脚本
+"""
+
+import sys
+import os
+import asyncio
+import time
+
+# 添加当前目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from agent.tools.pdf_service import PdfRenderService, PdfServiceBusyError
+
+
+def slow_render(seconds: float) -> bytes:
+    time.sleep(seconds)
+    return b"%PDF"
+
+
+def test_timeout_keeps_slot_until_worker_finishes():
+    """超时后 worker 仍在渲染,名额要等它真正结束才释放"""
+    async def run():
+        service = PdfRenderService(workers=1, max_pending=1, timeout=0.2)
+        try:
+            assert await service.render(slow_render, seconds=0) == b"%PDF"
+            assert service.stats()["pending"] == 0
+
+            with pytest.raises(asyncio.TimeoutError):
+                await service.render(slow_render, seconds=1.0)
+            assert service.stats()["pending"] == 1
+            # 名额仍被超时的任务占用
+            with pytest.raises(PdfServiceBusyError):
+                await service.render(slow_render, seconds=0)
+
+            await asyncio.sleep(1.2)
+            assert service.stats()["pending"] == 0
+            assert await service.render(slow_render, seconds=0) == b"%PDF"
+            return service.stats()
+        finally:
+            service.shutdown()
+
+    stats = asyncio.run(run())
+    assert stats["timeouts"] == 1 and stats["rejected"] == 1 and stats["succeeded"] == 2
+
+
+if __name__ == "__main__":
+    test_timeout_keeps_slot_until_worker_finishes()
+    print("✅ PDF 渲染进程池测试通过")
@@ -0,0 +1,188 @@
+"""
+重复请求合并和会话锁测试脚本
+"""
+
+import sys
+import os
+import asyncio
+
+# 添加当前目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from api.admission import AdmissionRejected
+from api.single_flight import SingleFlight
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_join_follows_in_flight_request():
+    async def run():
+        flights = SingleFlight()
+        key = flights.key("user", "s1", "你好")
+        assert flights.join(key, stream=False) is None
+
+        flight = flights.begin(key, stream=False)
+        # 流式和非流式不互相合并,不同的消息不合并
+        assert flights.join(key, stream=True) is None
+        assert flights.join(flights.key("user", "s1", "再见"), stream=False) is None
+        joined = flights.join(key, stream=False)
+        assert joined is flight and flight.joined == 1
+
+        waiting = asyncio.create_task(joined.result())
+        flight.resolve({"message": "答案"})
+        # 原请求的 finally 里还会 reject 一次,已经有结果时不生效
+        flight.reject(RuntimeError("cancelled"))
+        assert await waiting == {"message": "答案"}
+        assert await flight.result() == {"message": "答案"}
+
+        flights.end(flight)
+        assert flights.join(key, stream=False) is None
+        return flights.stats()
+
+    stats = asyncio.run(run())
+    assert stats["coalesced"] == 1 and stats["in_flight"] == 0
+
+
+def test_rejected_flight_raises_in_joined_requests():
+    async def run():
+        flights = SingleFlight()
+        key = flights.key("user", "s1", "你好")
+        flight = flights.begin(key, stream=True)
+        joined = asyncio.create_task(flights.join(key, stream=True).result())
+        # 合并进来的请求被取消不影响原请求
+        cancelled = asyncio.create_task(flights.join(key, stream=True).result())
+        await _settle()
+        cancelled.cancel()
+        await _settle()
+
+        flight.reject(RuntimeError("模型调用失败"))
+        flight.resolve("太晚了")
+        with pytest.raises(RuntimeError, match="模型调用失败"):
+            await joined
+
+    asyncio.run(run())
+
+
+def test_new_sessions_are_never_coalesced():
+    """没有 session_id 时 user_id 都是默认的 "user",合并会把一个人的新会话交给另一个人"""
+    async def run():
+        flights = SingleFlight()
+        key = flights.key("user", None, "你好")
+        first = flights.begin(key, stream=True)
+        assert flights.join(key, stream=True) is None
+        second = flights.begin(key, stream=True)
+        assert second is not first
+        flights.end(first)
+        return flights.stats()
+
+    stats = asyncio.run(run())
+    assert stats["coalesced"] == 0 and stats["in_flight"] == 0
+
+
+def test_lock_is_handed_to_waiters_in_order():
+    async def run():
+        flights = SingleFlight()
+        assert (await flights.lock(None)).session_id is None
+        assert flights.stats()["locked_sessions"] == 0
+
+        first = await flights.lock("s1")
+        order = []
+
+        async def wait(name):
+            lease = await flights.lock("s1")
+            order.append(name)
+            return lease
+
+        second = asyncio.create_task(wait("second"))
+        third = asyncio.create_task(wait("third"))
+        await _settle()
+        assert flights.stats()["waiting"] == 2
+        # 其他会话不受影响
+        (await flights.lock("s2")).release()
+
+        first.release()
+        first.release()
+        lease = await second
+        await _settle()
+        assert order == ["second"] and not third.done()
+        lease.release()
+        (await third).release()
+        return order, flights.stats()
+
+    order, stats = asyncio.run(run())
+    assert order == ["second", "third"]
+    assert stats["locked_sessions"] == 0 and stats["lock_waits"] == 2
+
+
+def test_cancelled_waiters_do_not_hold_the_lock():
+    async def run():
+        flights = SingleFlight()
+        first = await flights.lock("s1")
+        before_handoff = asyncio.create_task(flights.lock("s1"))
+        after_handoff = asyncio.create_task(flights.lock("s1"))
+        last = asyncio.create_task(flights.lock("s1"))
+        await _settle()
+
+        # 排队时被取消: 退出队列
+        before_handoff.cancel()
+        await _settle()
+        assert flights.stats()["waiting"] == 2
+
+        # 锁已经交过来,还没恢复运行就被取消: 交给下一个
+        first.release()
+        after_handoff.cancel()
+        await _settle()
+        assert after_handoff.cancelled() and before_handoff.cancelled()
+        (await last).release()
+        return flights.stats()
+
+    stats = asyncio.run(run())
+    assert stats["locked_sessions"] == 0 and stats["waiting"] == 0
+
+
+def test_too_many_waiters_is_rejected():
+    async def run():
+        flights = SingleFlight(max_waiting=1)
+        first = await flights.lock("s1")
+        waiting = asyncio.create_task(flights.lock("s1"))
+        await _settle()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await flights.lock("s1")
+        assert rejected.value.status == 429 and rejected.value.reason == "session_busy"
+        first.release()
+        (await waiting).release()
+        return flights.stats()
+
+    stats = asyncio.run(run())
+    assert stats["rejected_busy"] == 1 and stats["locked_sessions"] == 0
+
+
+def test_lock_wait_times_out_behind_a_stuck_turn():
+    async def run():
+        flights = SingleFlight()
+        stuck = await flights.lock("s1")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await flights.lock("s1", timeout=0.05)
+        assert rejected.value.status == 429 and rejected.value.reason == "session_timeout"
+        assert flights.stats()["waiting"] == 0
+        stuck.release()
+        return flights.stats()
+
+    stats = asyncio.run(run())
+    assert stats["lock_timeouts"] == 1 and stats["locked_sessions"] == 0
+
+
+if __name__ == "__main__":
+    test_join_follows_in_flight_request()
+    test_rejected_flight_raises_in_joined_requests()
+    test_new_sessions_are_never_coalesced()
+    test_lock_is_handed_to_waiters_in_order()
+    test_cancelled_waiters_do_not_hold_the_lock()
+    test_too_many_waiters_is_rejected()
+    test_lock_wait_times_out_behind_a_stuck_turn()
+    print("✅ 重复请求合并和会话锁测试通过")
@@ -0,0 +1,84 @@
+"""
+SSE 流式回答背压测试脚本
+"""
+
+import sys
+import os
+import asyncio
+from collections import deque
+
+# 添加当前目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from api.sse import StreamRegistry, StreamTurn, event_frame
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def _turn(registry: StreamRegistry, frames: int = 4) -> StreamTurn:
+    turn = StreamTurn("t1", "user", registry)
+    turn.frames = deque(maxlen=frames)
+    return turn
+
+
+async def _produce(turn: StreamTurn, count: int, timeout: float):
+    for i in range(count):
+        await turn.send(event_frame({"type": "message", "content": str(i)}), timeout=timeout)
+    turn.finished = True
+    turn._notify()
+
+
+def test_send_waits_for_slow_follower():
+    """环形缓冲装满时输出暂停,慢客户端收到完整的回答"""
+    async def run():
+        registry = StreamRegistry()
+        turn = _turn(registry)
+        follower = turn.follow()
+        first = asyncio.create_task(follower.__anext__())
+        await _settle()
+
+        producer = asyncio.create_task(_produce(turn, 10, timeout=5))
+        await _settle()
+        # 跟随者还没写出第一帧,再发一帧就会挤掉它
+        paused_at = turn.last_seq
+        assert not producer.done()
+
+        frames = [await first]
+        async for frame in follower:
+            frames.append(frame)
+        await producer
+        return paused_at, frames, registry.stats()
+
+    paused_at, frames, stats = asyncio.run(run())
+    assert paused_at == 4
+    assert len(frames) == 10 and b"error" not in frames[-1]
+    assert stats["send_waits"] > 0 and stats["send_timeouts"] == 0 and stats["overruns"] == 0
+
+
+def test_stuck_follower_stops_holding_back_output():
+    """卡住的客户端只让输出暂停一次,超时后它缺帧时收到 error"""
+    async def run():
+        registry = StreamRegistry()
+        turn = _turn(registry)
+        follower = turn.follow()
+        first = asyncio.create_task(follower.__anext__())
+        await _settle()
+
+        await asyncio.wait_for(_produce(turn, 10, timeout=0.05), 1)
+        frames = [await first]
+        async for frame in follower:
+            frames.append(frame)
+        return frames, registry.stats()
+
+    frames, stats = asyncio.run(run())
+    assert b'"error"' in frames[-1]
+    assert stats["send_timeouts"] == 1 and stats["overruns"] == 1
+
+
+if __name__ == "__main__":
+    test_send_waits_for_slow_follower()
+    test_stuck_follower_stops_holding_back_output()
+    print("✅ SSE 流式回答背压测试通过")
@@ -0,0 +1,74 @@
+"""
+前端静态资源测试脚本
+"""
+
+import sys
+import os
+import tempfile
+
+# 添加当前目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.static import IMMUTABLE, REVALIDATE, StaticSite
+
+
+def _site(directory: str) -> StaticSite:
+    os.makedirs(os.path.join(directory, "assets"))
+    with open(os.path.join(directory, "index.html"), "w") as f:
+        f.write("<!doctype html><div id=app></div>" * 20)
+    with open(os.path.join(directory, "assets", "index-COCoc-6G.js"), "w") as f:
+        f.write("console.log('hello');\n" * 50)
+    return StaticSite(directory)
+
+
+def _app(site: StaticSite) -> FastAPI:
+    app = FastAPI()
+    app.mount("/assets", site.mount("assets"), name="assets")
+
+    @app.get("/{full_path:path}")
+    async def spa(full_path: str):
+        return site.index_response({})
+
+    return app
+
+
+def test_mounted_assets_are_compressed_and_immutable():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        client = TestClient(_app(_site(tmp_dir)))
+        response = client.get("/assets/index-COCoc-6G.js", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200 and response.headers["content-encoding"] == "gzip"
+        assert response.headers["cache-control"] == IMMUTABLE
+        assert response.text.startswith("console.log")
+
+        cached = client.get("/assets/index-COCoc-6G.js", headers={
+            "Accept-Encoding": "gzip", "If-None-Match": f'W/{response.headers["etag"]}',
+        })
+        assert cached.status_code == 304
+        assert client.get("/assets/missing.js").status_code == 404
+        assert client.post("/assets/index-COCoc-6G.js").status_code == 405
+
+
+def test_only_new_assets_are_loaded_lazily():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        site = _site(tmp_dir)
+        with open(os.path.join(tmp_dir, "assets", "chunk-AbCdEf12.js"), "w") as f:
+            f.write("export default 1;\n")
+        with open(os.path.join(tmp_dir, "robots.txt"), "w") as f:
+            f.write("User-agent: *\n")
+
+        assert site.file_response("assets/chunk-AbCdEf12.js", {}).status_code == 200
+        # 启动后新增的非 assets 文件和前端路由都不访问磁盘
+        assert site.file_response("robots.txt", {}) is None
+        assert site.file_response("chat/123", {}) is None
+        index = site.index_response({})
+        assert index.headers["cache-control"] == REVALIDATE
+        assert site.stats()["files"] == 3
+
+
+if __name__ == "__main__":
+    test_mounted_assets_are_compressed_and_immutable()
+    test_only_new_assets_are_loaded_lazily()
+    print("✅ 前端静态资源测试通过")
@@ -0,0 +1,86 @@
+"""
+工具结果缓存测试脚本
+"""
+
+import sys
+import os
+import asyncio
+import sqlite3
+import tempfile
+import time
+from types import SimpleNamespace
+
+# 添加当前目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from agent.tools.tool_cache import ToolResultCache, cache_key
+
+SEARCH = SimpleNamespace(name="google_search")
+
+
+def context(call_id: str):
+    return SimpleNamespace(function_call_id=call_id)
+
+
+def test_cache_key_normalization():
+    assert cache_key("google_search", {"request": "约会 地点  ＡＢＣ"}) == cache_key("google_search", {"request": "约会 地点 abc"})
+
+
+def test_miss_store_and_hit():
+    async def run():
+        cache = ToolResultCache(tools=["google_search"])
+        args = {"request": "七夕礼物"}
+        assert await cache.before_tool(SEARCH, args, context("c1")) is None
+        await cache.after_tool(SEARCH, args, context("c1"), {"result": "花"})
+
+        assert await cache.before_tool(SEARCH, {"request": "七夕 礼物"}, context("c2")) is None
+        assert await cache.before_tool(SEARCH, {"request": "七夕礼物"}, context("c3")) == {"result": "花"}
+        # 命中时没有真正执行,after_tool 不会写入
+        await cache.after_tool(SEARCH, args, context("c3"), {"result": "花"})
+        return cache
+
+    cache = asyncio.run(run())
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2 and stats["stores"] == 1
+    assert cache._started == {"c2": cache._started["c2"]}
+
+
+def test_tool_error_and_cancelled_calls_do_not_leak():
+    async def run():
+        cache = ToolResultCache(tools=["google_search"])
+        await cache.before_tool(SEARCH, {"request": "a"}, context("failed"))
+        await cache.on_tool_error(SEARCH, {"request": "a"}, context("failed"), RuntimeError("boom"))
+        assert cache._started == {}
+
+        # 被取消的调用 after / error 回调都不会运行,记录数有上限
+        for i in range(2000):
+            await cache.before_tool(SEARCH, {"request": f"q{i}"}, context(f"cancelled-{i}"))
+        return cache
+
+    cache = asyncio.run(run())
+    assert len(cache._started) == 1024
+    assert "cancelled-1999" in cache._started and "cancelled-0" not in cache._started
+
+
+def test_sqlite_purge_uses_instance_ttl():
+    async def run(path):
+        cache = ToolResultCache(tools=["google_search"], ttl=60, sqlite_path=path)
+        with sqlite3.connect(path) as conn:
+            conn.execute("INSERT INTO tool_cache VALUES ('old', '{}', 1.0, ?)", (time.time() - 120,))
+        await cache.before_tool(SEARCH, {"request": "b"}, context("c1"))
+        await cache.after_tool(SEARCH, {"request": "b"}, context("c1"), {"result": "x"})
+        with sqlite3.connect(path) as conn:
+            return [row[0] for row in conn.execute("SELECT key FROM tool_cache")]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        keys = asyncio.run(run(os.path.join(tmp_dir, "cache.sqlite3")))
+    # 默认 TTL (12 小时) 下不会清掉 2 分钟前的条目
+    assert keys == [cache_key("google_search", {"request": "b"})]
+
+
+if __name__ == "__main__":
+    test_cache_key_normalization()
+    test_miss_store_and_hit()
+    test_tool_error_and_cancelled_calls_do_not_leak()
+    test_sqlite_purge_uses_instance_ttl()
+    print("✅ 工具结果缓存测试通过")
@@ -0,0 +1,118 @@
+"""
+会话事件批量写入测试脚本
+"""
+
+import sys
+import os
+import asyncio
+
+# 添加当前目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from google.adk.errors import StaleSessionError
+from google.adk.events import Event
+from google.genai import types
+
+from agent.sessions.backend import create_session_service
+from agent.sessions.write_behind import WriteBehindSessionService
+
+
+def _text(text: str) -> Event:
+    return Event(author="user", invocation_id="test", content=types.Content(role="user", parts=[types.Part(text=text)]))
+
+
+def _texts(session) -> list:
+    return [event.content.parts[0].text for event in session.events]
+
+
+async def _stored(inner, session) -> list:
+    loaded = await inner.get_session(app_name=session.app_name, user_id=session.user_id, session_id=session.id)
+    return _texts(loaded)
+
+
+def test_events_are_batched_into_one_transaction():
+    async def run():
+        inner = create_session_service("memory")
+        service = WriteBehindSessionService(inner, interval=60)
+        session = await service.create_session(app_name="agent", user_id="user")
+        for i in range(5):
+            await service.append_event(session, _text(f"m{i}"))
+        assert service.stats()["pending_events"] == 5
+
+        await service.flush(app_name="agent", user_id="user", session_id=session.id)
+        await service.stop()
+        return service.stats(), await _stored(inner, session)
+
+    stats, stored = asyncio.run(run())
+    assert stored == ["m0", "m1", "m2", "m3", "m4"]
+    assert stats["transactions"] == 1 and stats["events_written"] == 5 and stats["pending_events"] == 0
+
+
+def test_failed_transaction_requeues_events_in_order():
+    async def run():
+        inner = create_session_service("memory")
+        service = WriteBehindSessionService(inner, interval=60)
+        session = await service.create_session(app_name="agent", user_id="user")
+        await service.append_event(session, _text("a"))
+
+        write = service._write
+        attempts = []
+
+        async def failing_write(batch):
+            attempts.append(len(batch))
+            if len(attempts) == 1:
+                # 事务进行中又追加了事件,然后事务失败
+                await service.append_event(session, _text("b"))
+                raise RuntimeError("database is locked")
+            await write(batch)
+
+        service._write = failing_write
+        # 事务失败时 flush() 抛出异常
+        with pytest.raises(RuntimeError):
+            await service.flush()
+        assert service.stats()["pending_events"] == 2
+
+        await service.flush(app_name="agent", user_id="user", session_id=session.id)
+        await service.stop()
+        return await _stored(inner, session)
+
+    assert asyncio.run(run()) == ["a", "b"]
+
+
+def test_stale_session_is_reported_to_its_flush():
+    """两个 worker 同时写一个会话: 后写入的一方 flush() 抛出 StaleSessionError,不会静默丢弃"""
+    async def run():
+        inner = create_session_service("memory")
+        worker_a = WriteBehindSessionService(inner, interval=60)
+        worker_b = WriteBehindSessionService(inner, interval=60)
+        created = await worker_a.create_session(app_name="agent", user_id="user")
+        session_a = await worker_a.get_session(app_name="agent", user_id="user", session_id=created.id)
+        session_b = await worker_b.get_session(app_name="agent", user_id="user", session_id=created.id)
+
+        await worker_a.append_event(session_a, _text("from a"))
+        await worker_a.flush(app_name="agent", user_id="user", session_id=created.id)
+
+        await worker_b.append_event(session_b, _text("from b"))
+        # 其他会话的 flush 和后台写入不报告这个会话的失败
+        await worker_b.flush()
+        with pytest.raises(StaleSessionError):
+            await worker_b.flush(app_name="agent", user_id="user", session_id=created.id)
+        # 只报告一次
+        await worker_b.flush(app_name="agent", user_id="user", session_id=created.id)
+
+        await worker_a.stop()
+        await worker_b.stop()
+        return worker_b.stats(), await _stored(inner, created)
+
+    stats, stored = asyncio.run(run())
+    assert stored == ["from a"]
+    assert stats["stale_sessions"] == 1 and stats["pending_events"] == 0
+
+
+if __name__ == "__main__":
+    test_events_are_batched_into_one_transaction()
+    test_failed_transaction_requeues_events_in_order()
+    test_stale_session_is_reported_to_its_flush()
+    print("✅ 会话事件批量写入测试通过")
@@ -0,0 +1,131 @@
+"""
+WebSocket 对话协议测试脚本
+"""
+
+import sys
+import os
+import asyncio
+import json
+
+# 添加当前目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import WebSocketDisconnect
+
+from api.ws_chat import WS_MAX_MESSAGE_BYTES, ChatConnection
+
+
+class FakeWebSocket:
+    """按顺序收到 incoming 中的消息,放入 None 表示客户端断开"""
+
+    def __init__(self):
+        self.incoming = asyncio.Queue()
+        self.sent = []
+
+    async def receive_text(self) -> str:
+        text = await self.incoming.get()
+        if text is None:
+            raise WebSocketDisconnect()
+        return text
+
+    async def send_text(self, text: str):
+        self.sent.append(json.loads(text))
+
+    def push(self, payload):
+        self.incoming.put_nowait(payload if payload is None or isinstance(payload, str) else json.dumps(payload))
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def _idle_turn(connection, request_id, message, session_id):
+    await connection.send(request_id, "done")
+
+
+def test_invalid_frames_keep_connection_open():
+    async def run():
+        websocket = FakeWebSocket()
+        connection = ChatConnection(websocket, "user", _idle_turn)
+        serving = asyncio.create_task(connection.serve())
+        for request_id in ([1, 2], {"a": 1}, True):
+            websocket.push({"type": "chat", "id": request_id, "message": "你好"})
+        websocket.push({"type": "cancel", "id": ["r1"]})
+        websocket.push({"type": "chat", "id": "r1", "message": "你好", "session_id": ["s"]})
+        websocket.push("[1, 2]")
+        websocket.push({"type": "ping"})
+        websocket.push(None)
+        await serving
+        return websocket.sent
+
+    sent = asyncio.run(run())
+    errors = [frame for frame in sent if frame.get("type") == "error"]
+    assert len(errors) == 6 and all(frame["reason"] == "bad_message" for frame in errors)
+    assert errors[4]["id"] == "r1"
+    # 连接没有因为异常关闭
+    assert sent[-1] == {"type": "pong"}
+
+
+def test_message_size_is_checked_in_bytes():
+    async def run():
+        websocket = FakeWebSocket()
+        connection = ChatConnection(websocket, "user", _idle_turn)
+        # 字符数没有超出上限,UTF-8 编码后超出
+        message = "好" * (WS_MAX_MESSAGE_BYTES // 3 + 1)
+        await connection._dispatch(json.dumps({"type": "chat", "id": "big", "message": message}, ensure_ascii=False))
+        await connection._dispatch(json.dumps({"type": "chat", "id": "ok", "message": "好"}, ensure_ascii=False))
+        await _settle()
+        return websocket.sent
+
+    sent = asyncio.run(run())
+    assert sent[0] == {"id": None, "type": "error", "error": "消息过长", "reason": "too_large"}
+    assert sent[1] == {"id": "ok", "type": "done"}
+
+
+def test_cancel_stops_the_turn():
+    async def run():
+        cancelled = []
+
+        async def endless_turn(connection, request_id, message, session_id):
+            await connection.send(request_id, "message", content="第一段")
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.append(request_id)
+                raise
+
+        websocket = FakeWebSocket()
+        connection = ChatConnection(websocket, "user", endless_turn)
+        serving = asyncio.create_task(connection.serve())
+        websocket.push({"type": "chat", "id": 7, "message": "在吗"})
+        websocket.push({"type": "chat", "id": "other", "message": "在吗"})
+        await _settle()
+        assert set(connection.turns) == {7, "other"}
+
+        task = connection.turns[7]
+        websocket.push({"type": "cancel", "id": 7})
+        await _settle()
+        assert set(connection.turns) == {"other"}
+        # 发出 cancelled 之后取消继续向上传播
+        assert task.cancelled()
+        # 取消不存在的 id 什么也不做
+        websocket.push({"type": "cancel", "id": "missing"})
+        # 断开时取消其余进行中的对话
+        websocket.push(None)
+        await serving
+        await _settle()
+        return cancelled, connection.turns, websocket.sent
+
+    cancelled, turns, sent = asyncio.run(run())
+    assert cancelled == [7, "other"] and not turns
+    assert {"id": 7, "type": "cancelled"} in sent
+    # 连接已经关闭,不再发送
+    assert {"id": "other", "type": "cancelled"} not in sent
+
+
+if __name__ == "__main__":
+    test_invalid_frames_keep_connection_open()
+    test_message_size_is_checked_in_bytes()
+    test_cancel_stops_the_turn()
+    print("✅ WebSocket 对话协议测试通过")